@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from .models import Category, Item, ItemImage, Offer
+from .listings import refresh_listings
 
 
 class ItemImageInline(admin.TabularInline):
@@ -39,14 +40,14 @@ class CategoryAdmin(admin.ModelAdmin):
 class ItemAdmin(admin.ModelAdmin):
     list_display = ('image_preview', 'title', 'vendor', 'branch', 'category', 'unit', 'is_active', 'offers_count', 'created_at')
     list_filter = ('vendor__type', 'category', 'unit', 'is_active', 'created_at')
-    search_fields = ('title', 'description', 'vendor__name', 'branch__name')
+    search_fields = ('title', 'sku', 'description', 'vendor__name', 'branch__name')
     ordering = ('-created_at',)
     inlines = [ItemImageInline, OfferInline]
     list_per_page = 25
     
     fieldsets = (
         ('Основная информация', {
-            'fields': ('vendor', 'branch', 'category', 'title', 'description')
+            'fields': ('vendor', 'branch', 'category', 'title', 'sku', 'description')
         }),
         ('Дополнительная информация', {
             'fields': ('unit', 'expiry_date', 'original_price'),
@@ -64,16 +65,10 @@ class ItemAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     
     def image_preview(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
-        if primary_image:
+        if obj.primary_image:
             return format_html(
                 '<img src="{}" width="50" height="50" style="border-radius: 8px; object-fit: cover;" />',
-                primary_image.image.url
-            )
-        elif obj.images.exists():
-            return format_html(
-                '<img src="{}" width="50" height="50" style="border-radius: 8px; object-fit: cover;" />',
-                obj.images.first().image.url
+                obj.primary_image_url
             )
         return format_html(
             '<div style="width: 50px; height: 50px; background: #f8f9fa; border-radius: 8px; display: flex; align-items: center; justify-content: center; color: #6c757d;">📦</div>'
@@ -95,11 +90,13 @@ class ItemAdmin(admin.ModelAdmin):
     
     def activate_items(self, request, queryset):
         updated = queryset.update(is_active=True)
+        refresh_listings(queryset.values_list('pk', flat=True))
         self.message_user(request, f'{updated} товаров успешно активированы.')
     activate_items.short_description = "Активировать выбранные товары"
     
     def deactivate_items(self, request, queryset):
         updated = queryset.update(is_active=False)
+        refresh_listings(queryset.values_list('pk', flat=True))
         self.message_user(request, f'{updated} товаров успешно деактивированы.')
     deactivate_items.short_description = "Деактивировать выбранные товары"
     
@@ -172,25 +169,30 @@ class OfferAdmin(admin.ModelAdmin):
     
     def mark_as_expired(self, request, queryset):
         updated = queryset.update(status='expired')
+        refresh_listings(queryset.values_list('item_id', flat=True))
         self.message_user(request, f'{updated} предложений отмечены как истекшие.')
     mark_as_expired.short_description = "Отметить как истекшие"
     
     def mark_as_available(self, request, queryset):
         updated = queryset.update(status='available')
+        refresh_listings(queryset.values_list('item_id', flat=True))
         self.message_user(request, f'{updated} предложений отмечены как доступные.')
     mark_as_available.short_description = "Отметить как доступные"
     
     def mark_as_sold_out(self, request, queryset):
         updated = queryset.update(status='sold_out')
+        refresh_listings(queryset.values_list('item_id', flat=True))
         self.message_user(request, f'{updated} предложений отмечены как распроданные.')
     mark_as_sold_out.short_description = "Отметить как распроданные"
     
     def activate_offers(self, request, queryset):
         updated = queryset.update(is_active=True)
+        refresh_listings(queryset.values_list('item_id', flat=True))
         self.message_user(request, f'{updated} предложений активированы.')
     activate_offers.short_description = "Активировать выбранные предложения"
     
     def deactivate_offers(self, request, queryset):
         updated = queryset.update(is_active=False)
+        refresh_listings(queryset.values_list('item_id', flat=True))
         self.message_user(request, f'{updated} предложений деактивированы.')
     deactivate_offers.short_description = "Деактивировать выбранные предложения"
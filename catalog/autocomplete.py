@@ -0,0 +1,232 @@
+"""
+Search-as-you-type suggestions without database queries.
+
+Every listed item, active category and active vendor is filed under the
+search key of its name and under each later word of it ("qozon kabob" and
+"kabob"), in one sorted list. A prefix is a bisect range of that list; the
+top suggestions of the short, crowded prefixes are cached until an entry
+under them changes. Weights favour what can be bought right now: items
+with an active offer, then vendor rating and discount; vendors and
+categories by how many of their items are on offer. Items follow
+refresh_listings(), vendors and categories their model signals.
+"""
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+
+from foodsave.snapshots import LazySnapshot
+from vendors.normalize import search_key
+
+SUGGESTION_LIMIT = 10
+# Prefixes up to this length match too many keys to rank on every keystroke
+CACHED_PREFIX_LENGTH = 3
+AVAILABLE_WEIGHT = 10.0
+
+ITEM, CATEGORY, VENDOR = 'item', 'category', 'vendor'
+
+# `detail`: vendor name for items, slug for categories, vendor type for vendors
+Suggestion = namedtuple('Suggestion', 'kind id label detail weight')
+
+
+def entry_keys(label):
+    """The label's search key and every word-started suffix of it"""
+    words = search_key(label).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def item_weight(listing):
+    weight = listing.vendor_rating + listing.max_discount / 100
+    return weight + AVAILABLE_WEIGHT if listing.has_active_offer else weight
+
+
+class AutocompleteIndex:
+    """Sorted (key, kind, id) list over the suggestion entries, updated in place"""
+
+    def __init__(self, listings=(), categories=(), vendors=()):
+        self.entries = {}               # (kind, id) -> Suggestion
+        self.keys = []                  # sorted (key, kind, id)
+        self.listed = {}                # item id -> (vendor id, category id, has active offer)
+        self.vendors = {}               # vendor id -> (name, type, rating) of active vendors
+        self.categories = {}            # category id -> (name, slug) of active categories
+        self.counts = Counter()         # (kind, id) -> listed items
+        self.offer_counts = Counter()   # (kind, id) -> listed items with an active offer
+        self._top = {}                  # short prefix -> cached suggestions
+        self._lock = threading.Lock()
+
+        for listing in listings:
+            self.entries[ITEM, listing.item_id] = self._add_listing(listing)
+        for category_id, name, slug in categories:
+            self.categories[category_id] = (name, slug)
+        for vendor_id, name, vendor_type, rating in vendors:
+            self.vendors[vendor_id] = (name, vendor_type, rating)
+        # one sort instead of an insort per entry
+        for key in [(CATEGORY, category_id) for category_id in self.categories] + \
+                   [(VENDOR, vendor_id) for vendor_id in self.vendors]:
+            self.entries[key] = self._suggestion(*key)
+        self.keys = sorted(
+            (text, kind, pk)
+            for (kind, pk), suggestion in self.entries.items()
+            for text in entry_keys(suggestion.label)
+        )
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _suggestion(self, kind, pk):
+        """Suggestion of a vendor or category weighted by its current item counts"""
+        offers = self.offer_counts[kind, pk]
+        weight = math.log1p(self.counts[kind, pk]) + math.log1p(offers)
+        if offers:
+            weight += AVAILABLE_WEIGHT
+        if kind == VENDOR:
+            name, vendor_type, rating = self.vendors[pk]
+            return Suggestion(VENDOR, pk, name, vendor_type, weight + rating)
+        name, slug = self.categories[pk]
+        return Suggestion(CATEGORY, pk, name, slug, weight)
+
+    def _forget_prefixes(self, text):
+        for length in range(1, CACHED_PREFIX_LENGTH + 1):
+            self._top.pop(text[:length], None)
+
+    def _insert(self, suggestion):
+        """File an entry under all of its keys"""
+        self.entries[suggestion.kind, suggestion.id] = suggestion
+        for text in entry_keys(suggestion.label):
+            insort(self.keys, (text, suggestion.kind, suggestion.id))
+            self._forget_prefixes(text)
+
+    def _delete(self, kind, pk):
+        suggestion = self.entries.pop((kind, pk), None)
+        if suggestion is None:
+            return
+        for text in entry_keys(suggestion.label):
+            position = bisect_left(self.keys, (text, kind, pk))
+            if position < len(self.keys) and self.keys[position] == (text, kind, pk):
+                del self.keys[position]
+            self._forget_prefixes(text)
+
+    def _reweigh(self, kind, pk):
+        """Re-file a vendor or category after its item counts changed"""
+        if (kind, pk) in self.entries:
+            self._delete(kind, pk)
+            self._insert(self._suggestion(kind, pk))
+
+    def _count(self, item_id, sign):
+        vendor_id, category_id, has_offer = self.listed[item_id]
+        for key in ((VENDOR, vendor_id), (CATEGORY, category_id)):
+            self.counts[key] += sign
+            self.offer_counts[key] += sign * has_offer
+
+    def _add_listing(self, listing):
+        """Count a listing in, returns its suggestion"""
+        self.listed[listing.item_id] = (listing.vendor_id, listing.category_id, listing.has_active_offer)
+        self._count(listing.item_id, 1)
+        return Suggestion(ITEM, listing.item_id, listing.title, listing.vendor_name, item_weight(listing))
+
+    def sync(self, item_ids, listings):
+        """Replace the given items with their current listings (missing ones are unlisted)"""
+        with self._lock:
+            touched = set()
+            for item_id in item_ids:
+                if item_id in self.listed:
+                    vendor_id, category_id, _ = self.listed[item_id]
+                    touched.update({(VENDOR, vendor_id), (CATEGORY, category_id)})
+                    self._count(item_id, -1)
+                    del self.listed[item_id]
+                self._delete(ITEM, item_id)
+            for listing in listings:
+                self._insert(self._add_listing(listing))
+                touched.update({(VENDOR, listing.vendor_id), (CATEGORY, listing.category_id)})
+            for kind, pk in touched:
+                self._reweigh(kind, pk)
+
+    def sync_vendor(self, vendor):
+        with self._lock:
+            self._remove(VENDOR, vendor.pk)
+            if vendor.is_active:
+                self.vendors[vendor.pk] = (vendor.name, vendor.type, vendor.rating)
+                self._insert(self._suggestion(VENDOR, vendor.pk))
+
+    def sync_category(self, category):
+        with self._lock:
+            self._remove(CATEGORY, category.pk)
+            if category.is_active and category.slug:
+                self.categories[category.pk] = (category.name, category.slug)
+                self._insert(self._suggestion(CATEGORY, category.pk))
+
+    def _remove(self, kind, pk):
+        self._delete(kind, pk)
+        (self.vendors if kind == VENDOR else self.categories).pop(pk, None)
+
+    def remove(self, kind, pk):
+        """Drop a deleted vendor or category"""
+        with self._lock:
+            self._remove(kind, pk)
+
+    def _complete(self, prefix, limit):
+        best = {}
+        position = bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and self.keys[position][0].startswith(prefix):
+            _, kind, pk = self.keys[position]
+            best[kind, pk] = self.entries[kind, pk]
+            position += 1
+        return heapq.nlargest(limit, best.values(), key=lambda suggestion: (suggestion.weight, -suggestion.id))
+
+    def complete(self, query, limit=SUGGESTION_LIMIT):
+        """Up to `limit` suggestions whose name or a word of it starts with `query`, best first"""
+        prefix = search_key(query)
+        if not prefix:
+            return []
+        with self._lock:
+            if len(prefix) > CACHED_PREFIX_LENGTH or limit > SUGGESTION_LIMIT:
+                return self._complete(prefix, limit)
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._top[prefix] = self._complete(prefix, SUGGESTION_LIMIT)
+            return top[:limit]
+
+
+def _build_autocomplete_index():
+    from vendors.models import Vendor
+
+    from .models import CatalogListing, Category
+
+    return AutocompleteIndex(
+        CatalogListing.objects.only(
+            'item_id', 'title', 'vendor_id', 'vendor_name', 'category_id',
+            'vendor_rating', 'max_discount', 'has_active_offer'
+        ),
+        # a category without a slug has no page to link to
+        Category.objects.filter(is_active=True).exclude(slug='').values_list('pk', 'name', 'slug'),
+        Vendor.objects.filter(is_active=True).values_list('pk', 'name', 'type', 'rating'),
+    )
+
+
+autocomplete_index = LazySnapshot(_build_autocomplete_index)
+
+
+def sync_listings(item_ids, listings):
+    """Apply refreshed listings to the suggestions, if this process has built them"""
+    index = autocomplete_index.peek()
+    if index is not None:
+        index.sync(item_ids, listings)
+
+
+def sync_vendor(vendor):
+    index = autocomplete_index.peek()
+    if index is not None:
+        index.sync_vendor(vendor)
+
+
+def sync_category(category):
+    index = autocomplete_index.peek()
+    if index is not None:
+        index.sync_category(category)
+
+
+def remove(kind, pk):
+    index = autocomplete_index.peek()
+    if index is not None:
+        index.remove(kind, pk)
@@ -0,0 +1,187 @@
+"""
+Columnar in-memory copy of CatalogListing for the catalog page.
+
+Each listing field the catalog filters or sorts on is a NumPy array, so a
+filter combination is a handful of vectorized boolean masks and the sort is
+one lexsort over the surviving rows. The catalog view resolves a page of item
+ids here and fetches only those items from the database. The columns are
+shared between workers through catalog/snapshot.py: refresh_listings()
+marks the changed items as pending, and the next generation check of any
+worker (at most every PUBLISH_INTERVAL seconds) publishes them all at once as
+a new generation that every worker maps.
+"""
+import numpy as np
+
+from vendors.distance import branch_arrays, branch_distances, haversine_array
+
+from .snapshot import (
+    SHARED_SNAPSHOT_MAX_AGE, SharedSnapshot, mark_pending, publish_pending, publishing, take_pending, write_table,
+)
+
+SNAPSHOT_NAME = 'listings'
+
+COLUMNS = (
+    'item_id', 'category_id', 'vendor_id', 'branch_id', 'vendor_type', 'best_price',
+    'max_discount', 'vendor_rating', 'latitude', 'longitude', 'has_active_offer', 'item_created_at',
+)
+
+
+def _timestamp(value):
+    """Datetime as integer microseconds, exact for tie-breaking on creation time"""
+    return int(value.timestamp()) * 1_000_000 + value.microsecond
+
+
+def _table(rows):
+    """Dict of column arrays from listing tuples in COLUMNS order"""
+    rows = list(rows)
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    (item_ids, category_ids, vendor_ids, branch_ids, vendor_types, prices,
+     discounts, ratings, lats, lngs, has_offers, created) = columns
+    return {
+        'pk': np.asarray(item_ids, dtype=np.int64),
+        'category_id': np.asarray([-1 if value is None else value for value in category_ids], dtype=np.int64),
+        'vendor_id': np.asarray(vendor_ids, dtype=np.int64),
+        'branch_id': np.asarray(branch_ids, dtype=np.int64),
+        'vendor_type': np.asarray(vendor_types, dtype='<U20'),
+        'best_price': np.asarray([np.nan if value is None else float(value) for value in prices], dtype=np.float64),
+        'max_discount': np.asarray(discounts, dtype=np.float64),
+        'vendor_rating': np.asarray(ratings, dtype=np.float64),
+        'latitude': np.asarray(lats, dtype=np.float64),
+        'longitude': np.asarray(lngs, dtype=np.float64),
+        'has_active_offer': np.asarray(has_offers, dtype=bool),
+        'item_created_at': np.asarray([_timestamp(value) for value in created], dtype=np.int64),
+    }
+
+
+def _sort_keys(ordering, columns):
+    """np.lexsort keys (last key sorts first) for an order_by-style `ordering`, NaN last"""
+    keys = []
+    for field in ordering:
+        descending = field.startswith('-')
+        values = columns[field.lstrip('-')]
+        if values.dtype == bool:
+            values = values.astype(np.int8)
+        if values.dtype.kind == 'f':
+            missing = np.isnan(values)
+            values = np.where(missing, 0.0, values)
+            keys.append((missing, -values if descending else values))
+        else:
+            keys.append((-values if descending else values,))
+    return [key for field_keys in reversed(keys) for key in reversed(field_keys)]
+
+
+class ListingColumns:
+    """Read-only column table, replaced as a whole when the listings change"""
+
+    def __init__(self, rows=()):
+        self.table = _table(rows)
+
+    @classmethod
+    def from_table(cls, table):
+        """Wrap ready column arrays, e.g. a memory-mapped shared snapshot"""
+        columns = cls()
+        columns.table = table
+        return columns
+
+    def __len__(self):
+        return len(self.table['pk'])
+
+    def select(self, ordering, categories=(), vendors=(), vendor_types=(), min_price=None, max_price=None,
+               min_discount=None, origin=None, max_distance=None, branch_ids=None):
+        """
+        Item ids matching the filters, sorted by `ordering` (CatalogListing
+        field names, '-' for descending, 'distance' needs `origin`). Rows tie
+        on the primary key last, like the database ordering. `branch_ids`
+        keeps only items of those branches, e.g. the ones open now.
+        """
+        table = self.table
+        mask = np.ones(len(table['pk']), dtype=bool)
+
+        if categories:
+            mask &= np.isin(table['category_id'], categories)
+        if vendors:
+            mask &= np.isin(table['vendor_id'], vendors)
+        if vendor_types:
+            mask &= np.isin(table['vendor_type'], vendor_types)
+        if min_price is not None and max_price is not None:
+            prices = table['best_price']
+            mask &= (prices >= min_price) & (prices <= max_price)
+        if min_discount is not None:
+            mask &= table['max_discount'] >= min_discount
+        if branch_ids is not None:
+            mask &= np.isin(table['branch_id'], np.asarray(branch_ids, dtype=np.int64))
+
+        if origin is not None and max_distance is not None:
+            # the radius is resolved in SQL on the branch coordinates index
+            nearby = branch_distances(origin[0], origin[1], max_distance)
+            mask &= np.isin(table['branch_id'], np.fromiter(nearby, dtype=np.int64, count=len(nearby)))
+
+        positions = np.flatnonzero(mask)
+        columns = {name: column[positions] for name, column in table.items()}
+
+        if origin is not None:
+            distances = haversine_array(origin[0], origin[1], columns['latitude'], columns['longitude'])
+            if max_distance is None:
+                # only active branches of active vendors have a distance, as in branch_distances()
+                distances[~np.isin(columns['branch_id'], branch_arrays.get().ids)] = np.nan
+            columns['distance'] = distances
+
+        order = np.lexsort(_sort_keys(tuple(ordering) + ('pk',), columns))
+        return columns['pk'][order]
+
+
+# Items read back per query when pending changes are published
+PATCH_BATCH_SIZE = 500
+
+
+def _build_listing_columns():
+    from .models import CatalogListing
+
+    return ListingColumns(CatalogListing.objects.values_list(*COLUMNS))
+
+
+def _patched(table, item_ids):
+    """New table with the given items replaced by their current listings (missing ones are unlisted)"""
+    from .models import CatalogListing
+
+    item_ids = sorted(item_ids)
+    rows = []
+    for start in range(0, len(item_ids), PATCH_BATCH_SIZE):
+        batch = item_ids[start:start + PATCH_BATCH_SIZE]
+        rows.extend(CatalogListing.objects.filter(item_id__in=batch).values_list(*COLUMNS))
+    added = _table(rows)
+    keep = ~np.isin(table['pk'], np.asarray(item_ids, dtype=np.int64))
+    return {name: np.concatenate([column[keep], added[name]]) for name, column in table.items()}
+
+
+def publish_listings():
+    """Publish the pending listing changes as one new generation, if it is time to"""
+    return publish_pending(
+        SNAPSHOT_NAME, _patched, lambda: _build_listing_columns().table, max_age=SHARED_SNAPSHOT_MAX_AGE
+    )
+
+
+# Workers map the newest published file and only query the database
+# themselves when there is none
+listing_columns = SharedSnapshot(
+    SNAPSHOT_NAME, _build_listing_columns, ListingColumns.from_table, SHARED_SNAPSHOT_MAX_AGE,
+    publish=publish_listings,
+)
+
+
+def write_snapshot():
+    """Publish the current listings for all workers, returns (generation, rows)"""
+    with publishing(SNAPSHOT_NAME):
+        # the full table covers whatever was pending
+        take_pending(SNAPSHOT_NAME)
+        columns = _build_listing_columns()
+        generation = write_table(SNAPSHOT_NAME, columns.table)
+    return generation, len(columns)
+
+
+def sync_listings(item_ids, listings):
+    """Mark refreshed listings for the next generation, published right away unless one just was"""
+    mark_pending(SNAPSHOT_NAME, item_ids)
+    if publish_listings() is not None:
+        # map the new file here right away, not after the next generation check
+        listing_columns.invalidate()
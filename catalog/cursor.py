@@ -0,0 +1,225 @@
+"""
+Keyset (cursor) pagination for CatalogListing querysets.
+
+Instead of OFFSET/COUNT every page remembers the sort key of its last (or
+first) row and the next query starts right after it, so page 500 costs the
+same as page 1. Cursors are signed, opaque strings; there is no total count.
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+from django.core import signing
+from django.db.models import F, Q
+
+CURSOR_PARAM = 'cursor'
+CURSOR_SALT = 'catalog.cursor'
+ID_CURSOR_SALT = 'catalog.cursor.ids'
+
+
+def ordering_expressions(ordering, nullable=(), reverse=False):
+    """order_by() arguments for `ordering`, nullable fields always sort last"""
+    expressions = []
+    for field in ordering:
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        if reverse:
+            descending = not descending
+        nulls = {}
+        if name in nullable:
+            # reversing the order also moves the nulls to the front
+            nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        expressions.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+    return expressions
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _after(name, descending, value, nullable):
+    """Rows strictly after `value` in a (name, nulls last) ordering"""
+    if value is None:
+        return None
+    condition = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+    if name in nullable:
+        condition |= Q(**{f'{name}__isnull': True})
+    return condition
+
+
+def _before(name, descending, value, nullable):
+    """Rows strictly before `value` in a (name, nulls last) ordering"""
+    if value is None:
+        return Q(**{f'{name}__isnull': False})
+    return Q(**{f'{name}__gt' if descending else f'{name}__lt': value})
+
+
+def _equal(name, value):
+    if value is None:
+        return Q(**{f'{name}__isnull': True})
+    return Q(**{name: value})
+
+
+class CursorPage:
+    """One page of a CursorPaginator, shaped loosely like Django's Page"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_url = None
+        self.previous_url = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def set_urls(self, request):
+        """Fill next_url/previous_url with the current query string and the page cursors"""
+        for attr, cursor in (('next_url', self.next_cursor), ('previous_url', self.previous_cursor)):
+            if cursor is not None:
+                params = request.GET.copy()
+                params.pop('page', None)
+                params[CURSOR_PARAM] = cursor
+                setattr(self, attr, f'?{params.urlencode()}')
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset` by the fields in `ordering` (Django order_by syntax).
+    The primary key is appended as the final tie-breaker, so every row has a
+    unique position. Fields listed in `nullable` sort last in both directions.
+    """
+
+    def __init__(self, queryset, per_page, ordering, nullable=()):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering) + ('pk',)
+        self.nullable = frozenset(nullable)
+
+    def _key(self, obj):
+        return [_encode(getattr(obj, field.lstrip('-'))) for field in self.ordering]
+
+    def _cursor(self, obj, direction):
+        return signing.dumps(
+            {'o': self.ordering, 'd': direction, 'k': self._key(obj)},
+            salt=CURSOR_SALT, compress=True
+        )
+
+    def decode(self, cursor):
+        """(direction, key) of a cursor, or None for a missing, stale or tampered one"""
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if not isinstance(data, dict) or tuple(data.get('o', ())) != self.ordering:
+            return None
+        if data.get('d') not in ('n', 'p') or len(data.get('k', ())) != len(self.ordering):
+            return None
+        return data['d'], data['k']
+
+    def _seek(self, key, backwards):
+        """Q for rows after `key` (or before it when going backwards)"""
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for field, value in zip(self.ordering, key):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            step = (_before if backwards else _after)(name, descending, value, self.nullable)
+            if step is not None:
+                condition |= prefix & step
+            prefix &= _equal(name, value)
+        return condition
+
+    def get_page(self, cursor=None):
+        decoded = self.decode(cursor)
+        backwards = decoded is not None and decoded[0] == 'p'
+
+        queryset = self.queryset
+        if decoded is not None:
+            queryset = queryset.filter(self._seek(decoded[1], backwards))
+        queryset = queryset.order_by(*ordering_expressions(self.ordering, self.nullable, reverse=backwards))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else decoded is not None
+        return CursorPage(
+            rows,
+            self._cursor(rows[-1], 'n') if rows and has_next else None,
+            self._cursor(rows[0], 'p') if rows and has_previous else None,
+        )
+
+
+class IdListCursorPaginator:
+    """
+    Cursor pages over ids already sorted elsewhere, e.g. by the listing
+    columns for distance, which has no database column to seek on. The
+    cursor holds the id at the page boundary; if that row has left the
+    list since, paging restarts from the top.
+    """
+
+    def __init__(self, ids, per_page, ordering):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.per_page = per_page
+        self.ordering = tuple(ordering) + ('pk',)
+
+    def _cursor(self, pk, direction):
+        return signing.dumps({'o': self.ordering, 'd': direction, 'k': pk}, salt=ID_CURSOR_SALT)
+
+    def decode(self, cursor):
+        """(direction, id) of a cursor, or None for a missing, stale or tampered one"""
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=ID_CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        if not isinstance(data, dict) or tuple(data.get('o', ())) != self.ordering:
+            return None
+        if data.get('d') not in ('n', 'p') or not isinstance(data.get('k'), int):
+            return None
+        return data['d'], data['k']
+
+    def get_page(self, cursor=None):
+        """CursorPage whose object_list is the list of ids of the page"""
+        start, end = 0, self.per_page
+        decoded = self.decode(cursor)
+        if decoded is not None:
+            direction, pk = decoded
+            found = np.flatnonzero(self.ids == pk)
+            if found.size:
+                position = int(found[0])
+                if direction == 'n':
+                    start, end = position + 1, position + 1 + self.per_page
+                else:
+                    start, end = max(position - self.per_page, 0), position
+        end = min(end, len(self.ids))
+
+        ids = self.ids[start:end].tolist()
+        return CursorPage(
+            ids,
+            self._cursor(ids[-1], 'n') if ids and end < len(self.ids) else None,
+            self._cursor(ids[0], 'p') if ids and start > 0 else None,
+        )
@@ -0,0 +1,162 @@
+"""
+Facet counts for the catalog sidebar.
+
+Every facet value (category, vendor, vendor type group, discount bucket) owns a
+bitset of listed items, stored as a Python int. Items get dense bit positions
+(0, 1, 2, ... in listing order, positions of unlisted items are reused), so a
+bitset is as wide as the listing table, however large the item ids grow.
+Counting the items of a value under the current filters is then an AND of a
+few ints and a popcount, with no database query. The index is fed from
+CatalogListing and patched by refresh_listings() whenever listings change.
+"""
+import threading
+
+from foodsave.snapshots import LazySnapshot
+
+# Catalog "type" filter values and the vendor types behind them
+VENDOR_TYPE_GROUPS = {
+    'products': ('store',),
+    'dishes': ('restaurant', 'cafe'),
+}
+# "from N%" discount filters, cumulative
+DISCOUNT_BUCKETS = (20, 50)
+
+FACETS = ('category', 'vendor', 'type', 'discount')
+
+
+def _facet_values(category_id, vendor_id, vendor_type, max_discount):
+    """Facet values a listing belongs to, as {facet: [value, ...]}"""
+    return {
+        'category': [category_id] if category_id is not None else [],
+        'vendor': [vendor_id],
+        'type': [group for group, types in VENDOR_TYPE_GROUPS.items() if vendor_type in types],
+        'discount': [bucket for bucket in DISCOUNT_BUCKETS if max_discount >= bucket],
+    }
+
+
+def bitset(positions):
+    """Int with the bits of `positions` set, built in one pass instead of an OR per bit"""
+    positions = list(positions)
+    if not positions:
+        return 0
+    buffer = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class FacetIndex:
+    """Bitsets of listed items per facet value, with incremental updates"""
+
+    def __init__(self, rows=()):
+        self.items = {}
+        # item id -> bit position, and the positions freed by unlisted items
+        self.positions = {}
+        self._free = []
+        self._lock = threading.Lock()
+        members = {facet: {} for facet in FACETS}
+        for position, (item_id, *values) in enumerate(rows):
+            values = _facet_values(*values)
+            self.items[item_id] = values
+            self.positions[item_id] = position
+            for facet, facet_values in values.items():
+                for value in facet_values:
+                    members[facet].setdefault(value, []).append(position)
+        self.all = bitset(self.positions.values())
+        self.bits = {
+            facet: {value: bitset(positions) for value, positions in values.items()}
+            for facet, values in members.items()
+        }
+
+    def __len__(self):
+        return len(self.items)
+
+    def _add(self, item_id, values):
+        position = self._free.pop() if self._free else len(self.positions)
+        self.positions[item_id] = position
+        bit = 1 << position
+        self.items[item_id] = values
+        self.all |= bit
+        for facet, facet_values in values.items():
+            bits = self.bits[facet]
+            for value in facet_values:
+                bits[value] = bits.get(value, 0) | bit
+
+    def _remove(self, item_id):
+        values = self.items.pop(item_id, None)
+        if values is None:
+            return
+        position = self.positions.pop(item_id)
+        self._free.append(position)
+        mask = ~(1 << position)
+        self.all &= mask
+        for facet, facet_values in values.items():
+            bits = self.bits[facet]
+            for value in facet_values:
+                bits[value] &= mask
+                if not bits[value]:
+                    del bits[value]
+
+    def sync(self, item_ids, listings):
+        """Replace the given items with their current listings (missing ones are unlisted)"""
+        with self._lock:
+            for item_id in item_ids:
+                self._remove(item_id)
+            for listing in listings:
+                self._add(listing.item_id, _facet_values(
+                    listing.category_id, listing.vendor_id, listing.vendor_type, listing.max_discount
+                ))
+
+    def _selected(self, facet, values):
+        bits = self.bits[facet]
+        mask = 0
+        for value in values:
+            mask |= bits.get(value, 0)
+        return mask
+
+    def counts(self, selection, base_ids=None):
+        """
+        Item counts for every facet value under `selection` ({facet: [values]}).
+        Values of one facet are OR-ed, facets are AND-ed; each facet is counted
+        with the other facets' selections only, so checked boxes keep their
+        alternatives visible. `base_ids` restricts everything to those items.
+        """
+        with self._lock:
+            base = self.all
+            if base_ids is not None:
+                positions = self.positions
+                base &= bitset(positions[item_id] for item_id in base_ids if item_id in positions)
+
+            selected = {
+                facet: self._selected(facet, values)
+                for facet, values in selection.items() if values
+            }
+            counts = {}
+            for facet in FACETS:
+                mask = base
+                for other, other_mask in selected.items():
+                    if other != facet:
+                        mask &= other_mask
+                counts[facet] = {
+                    value: (mask & bits).bit_count()
+                    for value, bits in self.bits[facet].items()
+                }
+            return counts
+
+
+def _build_facet_index():
+    from .models import CatalogListing
+
+    return FacetIndex(CatalogListing.objects.values_list(
+        'item_id', 'category_id', 'vendor_id', 'vendor_type', 'max_discount'
+    ))
+
+
+facet_index = LazySnapshot(_build_facet_index)
+
+
+def sync_listings(item_ids, listings):
+    """Apply refreshed listings to the facet index, if this process has built one"""
+    index = facet_index.peek()
+    if index is not None:
+        index.sync(item_ids, listings)
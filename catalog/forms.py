@@ -13,7 +13,7 @@ class ItemForm(forms.ModelForm):
     
     class Meta:
         model = Item
-        fields = ['branch', 'category', 'title', 'description', 'unit', 'custom_unit', 'expiry_date', 'is_active']
+        fields = ['branch', 'category', 'title', 'sku', 'description', 'unit', 'custom_unit', 'expiry_date', 'is_active']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
             'custom_unit': forms.TextInput(attrs={'placeholder': 'Укажите единицу измерения'}),
@@ -65,7 +65,8 @@ class ItemForm(forms.ModelForm):
                 css_class='form-row'
             ),
             Row(
-                Column('title', css_class='form-group col-md-8 mb-3'),
+                Column('title', css_class='form-group col-md-5 mb-3'),
+                Column('sku', css_class='form-group col-md-3 mb-3'),
                 Column(
                     Div(
                         'unit',
@@ -122,6 +123,10 @@ class ItemForm(forms.ModelForm):
             'class': 'form-control',
             'placeholder': 'Название товара...'
         })
+        self.fields['sku'].widget.attrs.update({
+            'class': 'form-control',
+            'placeholder': 'Например, A-1042'
+        })
         self.fields['description'].widget.attrs.update({
             'class': 'form-control',
             'placeholder': 'Описание товара...'
@@ -0,0 +1,100 @@
+"""
+Maintenance of the CatalogListing read model.
+
+Every write that can change what a catalog card shows (item, offer, image,
+vendor, branch) ends up in refresh_listings() for the affected item ids.
+Signals schedule the refresh on transaction commit, so cascading deletes and
+multi-row admin saves see the final state of the database.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Item, CatalogListing
+from . import autocomplete, columns, facets, search, trigrams
+
+REFRESH_BATCH_SIZE = 500
+
+
+def build_listings(items):
+    """Unsaved listing rows for the active items of the `items` queryset"""
+    today = timezone.now().date()
+    items = items.filter(is_active=True).select_related('vendor', 'branch').prefetch_related('offers')
+
+    for item in items:
+        offers = [
+            offer for offer in item.offers.all()
+            if offer.is_active and offer.status == 'available' and offer.start_date <= today
+        ]
+        prices = [offer.discounted_price for offer in offers]
+
+        yield CatalogListing(
+            item_id=item.pk,
+            vendor_id=item.vendor_id,
+            branch_id=item.branch_id,
+            category_id=item.category_id,
+            title=item.title,
+            description=item.description,
+            vendor_name=item.vendor.name,
+            vendor_type=item.vendor.type,
+            vendor_rating=item.vendor.rating,
+            latitude=item.branch.latitude,
+            longitude=item.branch.longitude,
+            best_price=min(prices) if prices else None,
+            max_discount=max((offer.discount_percent for offer in offers), default=0.0),
+            has_active_offer=bool(offers),
+            primary_image=item.primary_image,
+            item_created_at=item.created_at,
+        )
+
+
+def refresh_listings(item_ids):
+    """Rebuild the listing rows of the given items (inactive or deleted items lose theirs)"""
+    item_ids = list(set(item_ids))
+    listed = []
+    for start in range(0, len(item_ids), REFRESH_BATCH_SIZE):
+        batch = item_ids[start:start + REFRESH_BATCH_SIZE]
+        rows = list(build_listings(Item.objects.filter(pk__in=batch)))
+        with transaction.atomic():
+            CatalogListing.objects.filter(item_id__in=batch).delete()
+            CatalogListing.objects.bulk_create(rows)
+            search.sync_listings(batch, rows)
+        facets.sync_listings(batch, rows)
+        trigrams.sync_listings(batch, rows)
+        autocomplete.sync_listings(batch, rows)
+        listed.extend(rows)
+    # one pending mark for all the batches, the shared file is rewritten later
+    if item_ids:
+        columns.sync_listings(item_ids, listed)
+
+
+def rebuild_listings():
+    """Recreate the whole table, returns the number of listed items"""
+    item_ids = list(Item.objects.values_list('pk', flat=True))
+    with transaction.atomic():
+        CatalogListing.objects.all().delete()
+        refresh_listings(item_ids)
+    facets.facet_index.invalidate()
+    columns.listing_columns.invalidate()
+    trigrams.trigram_index.invalidate()
+    autocomplete.autocomplete_index.invalidate()
+    return CatalogListing.objects.count()
+
+
+def schedule_refresh(item_ids):
+    """Refresh the listings once the current transaction commits"""
+    item_ids = list(item_ids)
+    if item_ids:
+        transaction.on_commit(lambda: refresh_listings(item_ids))
+
+
+def listing_items(listings):
+    """Items for a page of listings, in the same order, ready for the card templates"""
+    return items_in_order([listing.pk for listing in listings])
+
+
+def items_in_order(item_ids):
+    """Items with the given ids in one query, in the order of `item_ids`"""
+    items = Item.objects.select_related('vendor', 'category', 'branch').prefetch_related(
+        'offers__branch'
+    ).with_active_offer().in_bulk(item_ids)
+    return [items[item_id] for item_id in item_ids if item_id in items]
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from catalog.columns import write_snapshot
+from catalog.snapshot import snapshot_dir
+
+
+class Command(BaseCommand):
+    help = 'Публикует снимок каталога в CATALOG_SNAPSHOT_DIR для всех воркеров'
+
+    def handle(self, *args, **options):
+        """
+        Воркеры отображают файл в память и читают его без запросов к базе.
+        Изменения товаров воркеры публикуют сами, не чаще раза в
+        PUBLISH_INTERVAL секунд; команда нужна для первого снимка и раз в
+        час для правок в обход сигналов (.update()).
+        """
+        generation, count = write_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Снимок {generation}: {count} товаров в {snapshot_dir()}'
+        ))
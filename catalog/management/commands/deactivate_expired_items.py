@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from catalog.models import Item
+from catalog.listings import refresh_listings
 
 
 class Command(BaseCommand):
@@ -24,7 +25,9 @@ class Command(BaseCommand):
         
         if count > 0:
             # Деактивировать все просроченные товары
+            expired_item_ids = list(expired_items.values_list('pk', flat=True))
             expired_items.update(is_active=False)
+            refresh_listings(expired_item_ids)
             
             self.stdout.write(
                 self.style.SUCCESS(
@@ -52,7 +55,9 @@ class Command(BaseCommand):
         
         offer_count = expired_offers.count()
         if offer_count > 0:
+            affected_item_ids = list(expired_offers.values_list('item_id', flat=True))
             expired_offers.update(is_active=False, status='expired')
+            refresh_listings(affected_item_ids)
             self.stdout.write(
                 self.style.SUCCESS(
                     f'✅ Деактивировано {offer_count} истекших предложений'
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from catalog.listings import rebuild_listings
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает таблицу CatalogListing для каталога, категорий и поиска'
+
+    def handle(self, *args, **options):
+        """
+        Сигналы поддерживают таблицу в актуальном состоянии, но предложения,
+        у которых наступила дата начала, попадают в каталог только после
+        пересборки - запускайте команду через cron раз в день.
+        """
+        count = rebuild_listings()
+        self.stdout.write(self.style.SUCCESS(f'✅ В каталоге {count} товаров'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс FTS5 для поиска по каталогу'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('⚠️  FTS5 доступен только для SQLite, пропускаем'))
+            return
+
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ В индекс добавлено {count} товаров'))
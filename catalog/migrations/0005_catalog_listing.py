@@ -0,0 +1,90 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:36
+
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_listings(apps, schema_editor):
+    """Frozen copy of catalog.listings.build_listings as it was for this schema"""
+    Item = apps.get_model('catalog', 'Item')
+    CatalogListing = apps.get_model('catalog', 'CatalogListing')
+    today = timezone.now().date()
+    items = (
+        Item.objects.filter(is_active=True)
+        .select_related('vendor', 'branch')
+        .prefetch_related('offers', 'images')
+    )
+
+    rows = []
+    for item in items:
+        offers = [
+            offer for offer in item.offers.all()
+            if offer.is_active and offer.status == 'available' and offer.start_date <= today
+        ]
+        prices = []
+        for offer in offers:
+            price = offer.original_price
+            if offer.discount_percent > 0:
+                price = price * (1 - Decimal(str(offer.discount_percent)) / 100)
+                price = price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            prices.append(price)
+        images = sorted(item.images.all(), key=lambda image: (not image.is_primary, image.order, image.pk))
+
+        rows.append(CatalogListing(
+            item_id=item.pk,
+            vendor_id=item.vendor_id,
+            branch_id=item.branch_id,
+            category_id=item.category_id,
+            title=item.title,
+            description=item.description,
+            vendor_name=item.vendor.name,
+            vendor_type=item.vendor.type,
+            vendor_rating=item.vendor.rating,
+            latitude=item.branch.latitude,
+            longitude=item.branch.longitude,
+            best_price=min(prices) if prices else None,
+            max_discount=max((offer.discount_percent for offer in offers), default=0.0),
+            has_active_offer=bool(offers),
+            primary_image=images[0].image.name if images else '',
+            item_created_at=item.created_at,
+        ))
+    CatalogListing.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_item_expiry_date'),
+        ('vendors', '0003_branch_rtree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogListing',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='catalog.item')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('vendor_name', models.CharField(max_length=200)),
+                ('vendor_type', models.CharField(max_length=20)),
+                ('vendor_rating', models.FloatField(default=0.0)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('best_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_discount', models.FloatField(default=0.0)),
+                ('has_active_offer', models.BooleanField(default=False)),
+                ('primary_image', models.CharField(blank=True, max_length=255)),
+                ('item_created_at', models.DateTimeField()),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vendors.branch')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.category')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vendors.vendor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-has_active_offer', '-item_created_at'], name='catalog_cat_has_act_8d340e_idx'), models.Index(fields=['best_price'], name='catalog_cat_best_pr_24158b_idx'), models.Index(fields=['-max_discount'], name='catalog_cat_max_dis_f14350_idx'), models.Index(fields=['-vendor_rating'], name='catalog_cat_vendor__f2133e_idx'), models.Index(fields=['vendor_type'], name='catalog_cat_vendor__dd8a99_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:38
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+import django.db.models.functions.math
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_catalog_listing'),
+        ('vendors', '0003_branch_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='offer',
+            name='discounted_price',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('original_price'), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', django.db.models.functions.comparison.Cast('discount_percent', models.DecimalField(decimal_places=2, max_digits=5)))), '/', models.Value(100)), 2), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['discounted_price'], name='catalog_off_discoun_1811d4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['is_active', 'status', 'discounted_price'], name='catalog_off_is_acti_3beff6_idx'),
+        ),
+    ]
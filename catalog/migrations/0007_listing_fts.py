@@ -0,0 +1,48 @@
+from django.db import migrations
+
+FTS_TABLE = 'catalog_listing_fts'
+
+# Frozen copies of catalog.search as it was for this schema; 0008 replaces
+# the table with the search-key columns
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    'title, description, vendor_name, '
+    "tokenize=\"unicode61 remove_diacritics 2 tokenchars ''''\", "
+    "prefix='2 3')"
+)
+DROP_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+
+APOSTROPHES = str.maketrans({'ʻ': "'", '‘': "'", '’': "'", '`': "'", 'ʼ': "'"})
+
+
+def fold(text):
+    return (text or '').translate(APOSTROPHES).replace('ё', 'е').replace('Ё', 'Е')
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute('SELECT item_id, title, description, vendor_name FROM catalog_cataloglisting')
+        rows = [(item_id, *map(fold, texts)) for item_id, *texts in cursor.fetchall()]
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description, vendor_name) VALUES (%s, %s, %s, %s)',
+            rows
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_offer_discounted_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
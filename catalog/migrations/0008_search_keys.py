@@ -0,0 +1,101 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:48
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Frozen copies of vendors.normalize.search_key and the catalog.search index
+# layout as they were for this schema
+CYRILLIC_TABLE = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+LATIN_FOLD_MAP = {'shch': 'sh', 'kh': 'x', 'zh': 'j', 'yo': 'e', 'ye': 'e'}
+LATIN_FOLD_RE = re.compile('|'.join(LATIN_FOLD_MAP))
+APOSTROPHES_RE = re.compile("['ʻʼ‘’`´]")
+SEPARATORS_RE = re.compile(r'[\W_]+')
+
+FTS_TABLE = 'catalog_listing_fts'
+FTS_COLUMNS = ('title', 'description', 'vendor_name', 'category_name')
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f'{", ".join(FTS_COLUMNS)}, prefix=\'2 3\')'
+)
+
+
+def search_key(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text).casefold().translate(CYRILLIC_TABLE)
+    text = ''.join(
+        char for char in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(char)
+    )
+    text = APOSTROPHES_RE.sub('', text)
+    text = LATIN_FOLD_RE.sub(lambda match: LATIN_FOLD_MAP[match.group()], text)
+    return SEPARATORS_RE.sub(' ', text).strip()
+
+
+def fill_search_keys(apps, schema_editor):
+    Category = apps.get_model('catalog', 'Category')
+    Item = apps.get_model('catalog', 'Item')
+
+    categories = list(Category.objects.only('name'))
+    for category in categories:
+        category.search_name = search_key(category.name)
+    Category.objects.bulk_update(categories, ['search_name'], batch_size=500)
+
+    items = list(Item.objects.only('title', 'description'))
+    for item in items:
+        item.search_title = search_key(item.title)
+        item.search_description = search_key(item.description)
+    Item.objects.bulk_update(items, ['search_title', 'search_description'], batch_size=500)
+
+
+def rebuild_fts(apps, schema_editor):
+    """The full-text index now stores search keys and the category name"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        cursor.execute(CREATE_SQL)
+        cursor.execute(
+            'SELECT l.item_id, l.title, l.description, l.vendor_name, c.name '
+            'FROM catalog_cataloglisting l LEFT JOIN catalog_category c ON c.id = l.category_id'
+        )
+        rows = [(item_id, *map(search_key, texts)) for item_id, *texts in cursor.fetchall()]
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)',
+            rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_listing_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='search_description',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='search_title',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_search_keys, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_fts, migrations.RunPython.noop),
+    ]
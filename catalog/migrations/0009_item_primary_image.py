@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:57
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_primary_images(apps, schema_editor):
+    Item = apps.get_model('catalog', 'Item')
+    ItemImage = apps.get_model('catalog', 'ItemImage')
+    first_image = ItemImage.objects.filter(item=OuterRef('pk')).order_by('-is_primary', 'order', 'pk')
+    Item.objects.update(primary_image=Coalesce(Subquery(first_image.values('image')[:1]), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_search_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='primary_image',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:03
+
+import imaging.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_item_primary_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='itemimage',
+            name='image',
+            field=models.ImageField(storage=imaging.storage.upload_storage, upload_to='item_images/'),
+        ),
+        migrations.AlterField(
+            model_name='surprisebox',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=imaging.storage.upload_storage, upload_to='surprise_boxes/'),
+        ),
+    ]
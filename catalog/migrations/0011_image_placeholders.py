@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_upload_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='primary_placeholder',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='itemimage',
+            name='placeholder',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='surprisebox',
+            name='image_placeholder',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_image_placeholders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='sku',
+            field=models.CharField(blank=True, db_index=True, help_text='Код товара, по нему фото из архива находят свой товар', max_length=64, verbose_name='Артикул'),
+        ),
+    ]
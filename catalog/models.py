@@ -1,7 +1,16 @@
+from decimal import Decimal, ROUND_HALF_UP
+
 from django.db import models
+from django.core.files.storage import default_storage
+from django.db.models import F, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Round
+from django.utils import timezone
 
 # Create your models here.
+from imaging.placeholders import PLACEHOLDER_MAX_LENGTH, PlaceholderMixin
+from imaging.storage import upload_storage
 from vendors.models import Vendor, Branch
+from vendors.normalize import SearchKeysMixin
 from users.models import User
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -9,19 +18,47 @@ from django.urls import reverse
 User = get_user_model()
 
 
-class Category(models.Model):
+class Category(SearchKeysMixin, models.Model):
     name = models.CharField(max_length=100)
+    search_name = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
     slug = models.SlugField(unique=True)
     icon = models.ImageField(upload_to='category_icons/', null=True, blank=True)
     is_active = models.BooleanField(default=True)
     
+    search_key_fields = {'search_name': 'name'}
+    
     class Meta:
         verbose_name_plural = "Categories"
     
     def __str__(self):
         return self.name
 
-class Item(models.Model):
+
+# Which active offer a card shows: the cheapest, oldest first on a tie
+ACTIVE_OFFER_ORDERING = ('discounted_price', 'pk')
+# Which image is the item's picture: the flagged one, else the first in order
+PRIMARY_IMAGE_ORDERING = ('-is_primary', 'order', 'pk')
+
+
+class ItemQuerySet(models.QuerySet):
+    def with_active_offer(self):
+        """Prefetch the active offers in one query, get_active_offer() then reads them from memory"""
+        return self.prefetch_related(Prefetch(
+            'offers',
+            queryset=Offer.objects.active().order_by(*ACTIVE_OFFER_ORDERING),
+            to_attr='active_offers'
+        ))
+
+    def refresh_primary_image(self):
+        """Recompute Item.primary_image and its placeholder of these items in one UPDATE"""
+        first_image = ItemImage.objects.filter(item=OuterRef('pk')).order_by(*PRIMARY_IMAGE_ORDERING)
+        return self.update(
+            primary_image=Coalesce(Subquery(first_image.values('image')[:1]), Value('')),
+            primary_placeholder=Coalesce(Subquery(first_image.values('placeholder')[:1]), Value('')),
+        )
+
+
+class Item(SearchKeysMixin, models.Model):
     UNIT_CHOICES = [
         ('шт', 'Штуки'),
         ('кг', 'Килограммы'),
@@ -36,7 +73,15 @@ class Item(models.Model):
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='items')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     title = models.CharField(max_length=200)
+    sku = models.CharField('Артикул', max_length=64, blank=True, db_index=True,
+                           help_text="Код товара, по нему фото из архива находят свой товар")
     description = models.TextField(blank=True)
+    # transliteration-folded title and description, see vendors/normalize.py
+    search_title = models.CharField(max_length=200, blank=True, db_index=True, editable=False)
+    search_description = models.TextField(blank=True, editable=False)
+    # storage path of the picture cards show, kept by the ItemImage signals
+    primary_image = models.CharField(max_length=255, blank=True, editable=False)
+    primary_placeholder = models.CharField(max_length=PLACEHOLDER_MAX_LENGTH, blank=True, editable=False)
     unit = models.CharField(max_length=20, choices=UNIT_CHOICES, default='шт')
     custom_unit = models.CharField(max_length=50, blank=True, help_text="Укажите единицу измерения, если выбрали 'Другое'")
     expiry_date = models.DateField(null=True, blank=True, help_text="Срок годности товара")
@@ -44,6 +89,10 @@ class Item(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    search_key_fields = {'search_title': 'title', 'search_description': 'description'}
+
+    objects = ItemQuerySet.as_manager()
+
     def __str__(self):
         return self.title
     
@@ -54,15 +103,10 @@ class Item(models.Model):
         return self.get_unit_display()
 
     def get_active_offer(self):
-        """Get the first active offer for this item (include expired offers)"""
-        from django.utils import timezone
-        from django.db.models import Q
-        
-        return self.offers.filter(
-            is_active=True,
-            status='available',
-            start_date__lte=timezone.now().date()
-        ).first()
+        """Cheapest active offer (include expired offers), prefetched by with_active_offer()"""
+        if hasattr(self, 'active_offers'):
+            return self.active_offers[0] if self.active_offers else None
+        return self.offers.active().order_by(*ACTIVE_OFFER_ORDERING).first()
     
     def is_expired(self):
         """Check if item has expired"""
@@ -80,15 +124,29 @@ class Item(models.Model):
         """Alias for title to match template expectations"""
         return self.title
 
+    @property
+    def primary_image_url(self):
+        return default_storage.url(self.primary_image) if self.primary_image else ''
+
     def get_absolute_url(self):
         return reverse('catalog:item_detail', args=[str(self.id)])
 
-class ItemImage(models.Model):
+class ItemImage(PlaceholderMixin, models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='item_images/')
+    image = models.ImageField(upload_to='item_images/', storage=upload_storage)
+    placeholder = models.CharField(max_length=PLACEHOLDER_MAX_LENGTH, blank=True, editable=False)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
 
+    placeholder_fields = {'placeholder': 'image'}
+
+
+class OfferQuerySet(models.QuerySet):
+    def active(self):
+        """Offers a customer can take today (include expired offers)"""
+        return self.filter(is_active=True, status='available', start_date__lte=timezone.now().date())
+
+
 class Offer(models.Model):
     STATUS_CHOICES = [
         ('available', 'Available'),
@@ -109,23 +167,46 @@ class Offer(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = OfferQuerySet.as_manager()
+    
     @property
     def current_price(self):
-        """Calculate current price with discount"""
-        if self.discount_percent > 0:
-            from decimal import Decimal
-            discount_decimal = Decimal(str(self.discount_percent))
-            return self.original_price * (1 - discount_decimal / 100)
-        return self.original_price
+        """
+        Price with discount from the fields in memory, rounded half-up to 0.01
+        exactly like the stored discounted_price that queries sort and filter on
+        """
+        price = Decimal(str(self.original_price))
+        percent = Decimal(str(self.discount_percent))
+        if percent > 0:
+            price *= 1 - percent / 100
+        return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
-    @property
-    def discounted_price(self):
-        """Alias for current_price to match template expectations"""
-        return self.current_price
+    # Computed by the database, so bulk .update() calls keep it in sync too
+    discounted_price = models.GeneratedField(
+        expression=Round(
+            F('original_price')
+            * (Value(100) - Cast('discount_percent', models.DecimalField(max_digits=5, decimal_places=2)))
+            / Value(100),
+            2
+        ),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['discounted_price']),
+            models.Index(fields=['is_active', 'status', 'discounted_price']),
+        ]
 
     def __str__(self):
         return f"{self.item.title} - {self.discount_percent}% off"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the database recomputed discounted_price the same way, no reload needed
+        self.discounted_price = self.current_price
+
     @property
     def is_expired(self):
         from django.utils import timezone
@@ -134,7 +215,7 @@ class Offer(models.Model):
         return False
 
 
-class SurpriseBox(models.Model):
+class SurpriseBox(PlaceholderMixin, models.Model):
     """
     Surprise Box model similar to Too Good To Go functionality
     Allows vendors to create mystery boxes with multiple items at discounted prices
@@ -188,7 +269,10 @@ class SurpriseBox(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     # Image for the box
-    image = models.ImageField(upload_to='surprise_boxes/', null=True, blank=True)
+    image = models.ImageField(upload_to='surprise_boxes/', storage=upload_storage, null=True, blank=True)
+    image_placeholder = models.CharField(max_length=PLACEHOLDER_MAX_LENGTH, blank=True, editable=False)
+
+    placeholder_fields = {'image_placeholder': 'image'}
     
     class Meta:
         verbose_name = "Сюрприз бокс"
@@ -252,3 +336,41 @@ class SurpriseBoxItem(models.Model):
     
     def __str__(self):
         return f"{self.item.title} x{self.quantity} в {self.surprise_box.title}"
+
+
+class CatalogListing(models.Model):
+    """
+    Denormalized read model: one row per active item with everything the
+    catalog filters and sorts on, so listing queries need no joins.
+    Maintained by signals in catalog/signals.py (see catalog/listings.py).
+    """
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    vendor_name = models.CharField(max_length=200)
+    vendor_type = models.CharField(max_length=20)
+    vendor_rating = models.FloatField(default=0.0)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    best_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_discount = models.FloatField(default=0.0)
+    has_active_offer = models.BooleanField(default=False)
+    primary_image = models.CharField(max_length=255, blank=True)
+    item_created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-has_active_offer', '-item_created_at']),
+            models.Index(fields=['best_price']),
+            models.Index(fields=['-max_discount']),
+            models.Index(fields=['-vendor_rating']),
+            models.Index(fields=['vendor_type']),
+        ]
+
+    def __str__(self):
+        return self.title
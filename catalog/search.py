@@ -0,0 +1,157 @@
+"""
+SQLite FTS5 full-text index over CatalogListing.
+
+One FTS row per listed item (rowid = item id) with the search keys of its
+title, description, vendor name and category (vendors/normalize.py), so
+Latin and Cyrillic spellings hit the same index terms. Kept in step by
+refresh_listings() and refilled by `manage.py rebuild_search_index`.
+Matches are ranked with BM25, title weighted above description above
+vendor and category name, in one query that returns the item ids best first;
+views paginate that list and read only the page from the database. When a
+query finds fewer than FUZZY_MIN_RESULTS rows, typo-tolerant trigram matches
+(catalog/trigrams.py) are ranked after them. On databases without FTS5 the
+search falls back to substring filters on the stored keys.
+"""
+from django.db import connection
+from django.db.models import Q
+
+from vendors.normalize import key_prefix, search_key
+
+from .trigrams import trigram_index
+
+FTS_TABLE = 'catalog_listing_fts'
+FTS_COLUMNS = ('title', 'description', 'vendor_name', 'category_name')
+
+# BM25 column weights, in FTS_COLUMNS order
+BM25_WEIGHTS = (10.0, 3.0, 1.0, 1.0)
+RANK_SQL = f'bm25({FTS_TABLE}, {", ".join(str(weight) for weight in BM25_WEIGHTS)})'
+
+# Keys are plain lowercase Latin, the default tokenizer splits them on spaces
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f'{", ".join(FTS_COLUMNS)}, prefix=\'2 3\')'
+)
+# Below this many full-text hits the trigram fallback adds near matches
+FUZZY_MIN_RESULTS = 5
+# Nobody pages further than this through search results
+MAX_RESULTS = 1000
+
+DROP_SQL = f'DROP TABLE IF EXISTS {FTS_TABLE}'
+INSERT_SQL = (
+    f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) '
+    f'VALUES (%s, {", ".join(["%s"] * len(FTS_COLUMNS))})'
+)
+
+
+def match_query(query):
+    """FTS5 MATCH expression: every word of the query key as a quoted prefix, all required"""
+    return ' '.join(f'"{token}"*' for token in search_key(query).split())
+
+
+def _fts_row(item_id, title, description, vendor_name, category_name):
+    return (
+        item_id, search_key(title), search_key(description),
+        search_key(vendor_name), search_key(category_name)
+    )
+
+
+def is_supported(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def sync_listings(item_ids, listings):
+    """Replace the FTS rows of the given items with their current listings"""
+    if not is_supported():
+        return
+    from .models import Category
+
+    item_ids = list(item_ids)
+    category_names = dict(Category.objects.filter(
+        pk__in={listing.category_id for listing in listings}
+    ).values_list('pk', 'name'))
+    with connection.cursor() as cursor:
+        if item_ids:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(item_ids))})',
+                item_ids
+            )
+        cursor.executemany(INSERT_SQL, [
+            _fts_row(
+                listing.item_id, listing.title, listing.description,
+                listing.vendor_name, category_names.get(listing.category_id)
+            )
+            for listing in listings
+        ])
+
+
+def rebuild(using=None):
+    """Refill the index from CatalogListing, returns the number of rows"""
+    conn = using or connection
+    if not is_supported(conn):
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            'SELECT l.item_id, l.title, l.description, l.vendor_name, c.name '
+            'FROM catalog_cataloglisting l LEFT JOIN catalog_category c ON c.id = l.category_id'
+        )
+        rows = [_fts_row(*row) for row in cursor.fetchall()]
+        cursor.executemany(INSERT_SQL, rows)
+        return len(rows)
+
+
+def search_item_ids(query, limit=MAX_RESULTS):
+    """
+    Ids of the items matching `query`, best first: BM25 hits, then trigram
+    near matches. None on databases without FTS5, use search_listings().
+    """
+    if not is_supported():
+        return None
+    expression = match_query(query)
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY {RANK_SQL}, rowid LIMIT %s',
+            [expression, limit]
+        )
+        item_ids = [row[0] for row in cursor.fetchall()]
+
+    if len(item_ids) < FUZZY_MIN_RESULTS:
+        found = set(item_ids)
+        item_ids += [
+            item_id for item_id, _ in trigram_index.get().search(query)
+            if item_id not in found
+        ][:limit - len(item_ids)]
+    return item_ids
+
+
+def search_listings(queryset, query):
+    """Narrow a CatalogListing queryset to `query` by substrings of the stored keys, for databases without FTS5"""
+    key = search_key(query)
+    if not key:
+        return queryset.none()
+    return queryset.filter(
+        Q(item__search_title__contains=key) |
+        Q(item__search_description__contains=key) |
+        Q(vendor__search_name__contains=key) |
+        Q(category__search_name__contains=key)
+    )
+
+
+def items_matching(query, prefix_fields=('search_title',)):
+    """
+    Q for Item rows matching `query` on pages that list inactive items too:
+    a stored key in `prefix_fields` starting with it, or a full-text hit of
+    the item's listing
+    """
+    key = search_key(query)
+    condition = Q()
+    for field in prefix_fields:
+        condition |= key_prefix(field, key)
+    item_ids = search_item_ids(query) if key else None
+    if item_ids:
+        condition |= Q(pk__in=item_ids)
+    return condition
@@ -0,0 +1,75 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from vendors.distance import branch_arrays
+from vendors.models import Vendor, Branch
+from . import autocomplete
+from .listings import schedule_refresh
+from .models import Category, Item, ItemImage, Offer
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_branch_arrays(sender, **kwargs):
+    """Active item counts per branch changed - refresh cached branch arrays"""
+    branch_arrays.invalidate()
+
+
+@receiver(post_save, sender=Item)
+def refresh_item_listing(sender, instance, **kwargs):
+    schedule_refresh([instance.pk])
+
+
+@receiver(post_save, sender=ItemImage)
+@receiver(post_delete, sender=ItemImage)
+def refresh_primary_image(sender, instance, **kwargs):
+    """Added, reordered, re-flagged or deleted images can change the item's picture"""
+    Item.objects.filter(pk=instance.item_id).refresh_primary_image()
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+@receiver(post_save, sender=ItemImage)
+@receiver(post_delete, sender=ItemImage)
+def refresh_parent_item_listing(sender, instance, **kwargs):
+    """Prices, discounts and the primary image live on the item's listing"""
+    schedule_refresh([instance.item_id])
+
+
+@receiver(post_save, sender=Vendor)
+def refresh_vendor_listings(sender, instance, created, **kwargs):
+    if not created:
+        schedule_refresh(instance.items.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Branch)
+def refresh_branch_listings(sender, instance, created, **kwargs):
+    if not created:
+        schedule_refresh(instance.items.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def refresh_category_listings(sender, instance, created, **kwargs):
+    """The category name is part of the search index"""
+    if not created:
+        schedule_refresh(instance.item_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Vendor)
+def sync_vendor_suggestion(sender, instance, **kwargs):
+    autocomplete.sync_vendor(instance)
+
+
+@receiver(post_save, sender=Category)
+def sync_category_suggestion(sender, instance, **kwargs):
+    autocomplete.sync_category(instance)
+
+
+@receiver(post_delete, sender=Vendor)
+def remove_vendor_suggestion(sender, instance, **kwargs):
+    autocomplete.remove(autocomplete.VENDOR, instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def remove_category_suggestion(sender, instance, **kwargs):
+    autocomplete.remove(autocomplete.CATEGORY, instance.pk)
@@ -0,0 +1,238 @@
+"""
+Column tables shared between worker processes through memory-mapped files.
+
+A writer dumps a dict of NumPy columns into one structured .npy file per
+generation and then bumps a small generation file. Workers map the newest
+file read-only, so every process on the host shares the same page cache copy
+and a freshly forked worker serves the catalog without querying the database
+first. Changes are published as new generations, never applied to a worker's
+own copy. Writers only append the changed keys to a pending file
+(mark_pending); publish_pending() folds them into one new generation at most
+every PUBLISH_INTERVAL seconds, so a burst of saves costs one rewrite.
+"""
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from foodsave.snapshots import SNAPSHOT_MAX_AGE, LazySnapshot
+
+# How often a worker looks at the generation file
+GENERATION_CHECK_INTERVAL = 1.0
+# Writes publish a new generation within seconds, so a file is trusted this long;
+# the limit only bounds what bypasses signals (bulk .update() calls)
+SHARED_SNAPSHOT_MAX_AGE = 60 * 60
+# At most one publication per this many seconds, changes in between wait as pending keys
+PUBLISH_INTERVAL = 5.0
+
+
+def snapshot_dir():
+    return Path(settings.CATALOG_SNAPSHOT_DIR)
+
+
+def _generation_path(name):
+    return snapshot_dir() / f'{name}.generation'
+
+
+def _table_path(name, generation):
+    return snapshot_dir() / f'{name}.{generation}.npy'
+
+
+def _pending_path(name):
+    return snapshot_dir() / f'{name}.pending'
+
+
+def _write_atomic(path, write):
+    """Write through a temporary file in the same directory and rename it into place"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write(fh)
+        # mkstemp creates 0600 files, workers may run as another user than cron
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_table(name, table):
+    """Publish a dict of equally long 1-d arrays as the next generation, returns its number"""
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    length = len(next(iter(table.values()))) if table else 0
+    records = np.empty(length, dtype=[(column, values.dtype) for column, values in table.items()])
+    for column, values in table.items():
+        records[column] = values
+
+    # nanosecond clock: increases across writers without a shared counter
+    generation = time.time_ns()
+    _write_atomic(_table_path(name, generation), lambda fh: np.save(fh, records))
+    _write_atomic(_generation_path(name), lambda fh: fh.write(str(generation).encode()))
+
+    # workers that still map an older file keep it alive until they remap
+    for path in directory.glob(f'{name}.*.npy'):
+        if path.name != _table_path(name, generation).name:
+            path.unlink(missing_ok=True)
+    return generation
+
+
+@contextmanager
+def publishing(name, blocking=True):
+    """
+    Serialize the writers of `name` across processes. Yields False instead
+    of waiting when not `blocking` and another process holds the lock.
+    """
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / f'{name}.lock', 'wb') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def mark_pending(name, keys):
+    """Record changed row keys of `name` for the next publish_pending()"""
+    keys = list(keys)
+    if not keys:
+        return
+    path = _pending_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.write(' '.join(str(key) for key in keys) + '\n')
+
+
+def take_pending(name):
+    """Pending keys of `name` as a set of ints, emptying the pending file"""
+    try:
+        fh = open(_pending_path(name), 'r+')
+    except FileNotFoundError:
+        return set()
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        keys = {int(key) for key in fh.read().split()}
+        fh.seek(0)
+        fh.truncate()
+    return keys
+
+
+def has_pending(name):
+    try:
+        return _pending_path(name).stat().st_size > 0
+    except OSError:
+        return False
+
+
+def publish_pending(name, patch, rebuild, interval=PUBLISH_INTERVAL, max_age=SHARED_SNAPSHOT_MAX_AGE):
+    """
+    Publish `patch(table, keys)` of the newest generation of `name` with the
+    pending keys, or `rebuild()` (a full table) when there is no fresh
+    generation. Returns the new generation number; None when nothing is
+    pending, the last publication is younger than `interval` seconds or
+    another process is publishing right now.
+    """
+    if not has_pending(name):
+        return None
+    current = current_generation(name, max_age)
+    if current is not None and current[1] < interval:
+        return None
+    with publishing(name, blocking=False) as locked:
+        if not locked:
+            return None
+        keys = take_pending(name)
+        if not keys:
+            return None
+        try:
+            current = current_generation(name, max_age)
+            table = read_table(name, current[0]) if current is not None else None
+            table = rebuild() if table is None else patch(table, keys)
+            return write_table(name, table)
+        except BaseException:
+            # keep them for the next attempt
+            mark_pending(name, keys)
+            raise
+
+
+def current_generation(name, max_age=SNAPSHOT_MAX_AGE):
+    """(generation, age in seconds) of the newest publication, None if missing or older than `max_age`"""
+    path = _generation_path(name)
+    try:
+        age = time.time() - path.stat().st_mtime
+        if age >= max_age:
+            return None
+        return int(path.read_text()), max(age, 0.0)
+    except (OSError, ValueError):
+        return None
+
+
+def read_table(name, generation):
+    """Read-only memory-mapped columns of a generation, None if the file is gone"""
+    try:
+        records = np.load(_table_path(name, generation), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    return {column: records[column] for column in records.dtype.names}
+
+
+class SharedSnapshot(LazySnapshot):
+    """
+    LazySnapshot that prefers the newest published generation of `name`,
+    converted with `from_table`. Without a fresh file it falls back to
+    `builder`, which queries the database in this process. `publish` runs on
+    every generation check, e.g. to fold pending changes into a new file.
+    """
+
+    def __init__(self, name, builder, from_table, max_age=SNAPSHOT_MAX_AGE, publish=None):
+        super().__init__(builder, max_age)
+        self.name = name
+        self._from_table = from_table
+        self._publish = publish
+        self._generation = None
+        self._checked_at = 0.0
+        self._map_lock = threading.Lock()
+
+    def _remap(self):
+        now = time.monotonic()
+        if now - self._checked_at < GENERATION_CHECK_INTERVAL:
+            return
+        with self._map_lock:
+            if now - self._checked_at < GENERATION_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            if self._publish is not None:
+                self._publish()
+            current = current_generation(self.name, self._max_age)
+            if current is None or current[0] == self._generation:
+                return
+            generation, age = current
+            table = read_table(self.name, generation)
+            if table is None:
+                return
+            self._value = self._from_table(table)
+            # the file ages from the moment it was written, not from when it was mapped
+            self._built_at = now - age
+            self._generation = generation
+
+    def invalidate(self):
+        super().invalidate()
+        self._generation = None
+        self._checked_at = 0.0
+
+    def get(self):
+        self._remap()
+        return super().get()
+
+    def peek(self):
+        self._remap()
+        return super().peek()
@@ -1,3 +1,665 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+from vendors.distance import branch_arrays, haversine
+from vendors.models import Branch, Vendor
+from .autocomplete import autocomplete_index
+from .columns import (
+    COLUMNS, SNAPSHOT_NAME, ListingColumns, listing_columns, publish_listings, sync_listings, write_snapshot,
+)
+from .cursor import CursorPaginator, IdListCursorPaginator, ordering_expressions
+from .facets import FACETS, VENDOR_TYPE_GROUPS, FacetIndex, _facet_values
+from .models import CatalogListing, Category, Item, Offer
+from .search import FUZZY_MIN_RESULTS, MAX_RESULTS, items_matching, rebuild, search_item_ids
+from .snapshot import (
+    PUBLISH_INTERVAL, current_generation, has_pending, mark_pending, publish_pending, publishing, read_table,
+    snapshot_dir, take_pending,
+)
+from .listings import refresh_listings
+from .trigrams import MIN_SIMILARITY, TrigramIndex, edit_distance, max_edits, trigram_index, trigrams
+from .views import DEFAULT_LISTING_ORDERING, LISTING_NULLABLE, LISTING_SORTS, filter_catalog_listings
+
+
+class AutocompleteApiTests(TestCase):
+    def setUp(self):
+        autocomplete_index.invalidate()
+        self.addCleanup(autocomplete_index.invalidate)
+        Category.objects.create(name='Блины', slug='bliny')
+
+    def complete(self, query):
+        response = self.client.get(reverse('catalog:api_autocomplete'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_category_without_slug_is_skipped(self):
+        Category.objects.create(name='блюда', slug='')
+        results = self.complete('bl')
+        self.assertEqual([result['label'] for result in results], ['Блины'])
+        self.assertEqual(results[0]['url'], reverse('catalog:category', args=['bliny']))
+        self.assertEqual(self.complete('blyu'), [])
+
+    def test_category_without_slug_added_to_built_index(self):
+        self.complete('bl')
+        Category.objects.create(name='блюда', slug='')
+        self.assertEqual([result['label'] for result in self.complete('bl')], ['Блины'])
+
+
+class CursorPaginatorTests(TestCase):
+    PRICES = ['5.00', None, '3.00', '5.00', None, '1.00', '3.00']
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='cafe', name='Cafe')
+        branch = Branch.objects.create(
+            vendor=vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        # bulk_create: no signals, the listing rows are set up by hand
+        items = Item.objects.bulk_create(
+            Item(vendor=vendor, branch=branch, title=f'Item {number}') for number in range(len(cls.PRICES))
+        )
+        CatalogListing.objects.bulk_create(
+            CatalogListing(
+                item=item, vendor=vendor, branch=branch, title=item.title, vendor_name=vendor.name,
+                vendor_type=vendor.type, latitude=branch.latitude, longitude=branch.longitude,
+                best_price=Decimal(price) if price else None, item_created_at=timezone.now(),
+            )
+            for item, price in zip(items, cls.PRICES)
+        )
+
+    def expected(self, descending):
+        rows = list(CatalogListing.objects.values_list('pk', 'best_price'))
+        priced = sorted((row for row in rows if row[1] is not None), key=lambda row: (row[1], row[0]))
+        if descending:
+            priced = sorted(priced, key=lambda row: (-row[1], row[0]))
+        return [pk for pk, _ in priced] + sorted(pk for pk, price in rows if price is None)
+
+    def walk(self, paginator):
+        """Pages forward from the top, then back again from the last one"""
+        forward = [paginator.get_page()]
+        while forward[-1].has_next():
+            forward.append(paginator.get_page(forward[-1].next_cursor))
+        backward = [forward[-1]]
+        while backward[-1].has_previous():
+            backward.append(paginator.get_page(backward[-1].previous_cursor))
+        return [[row.pk for row in page] for page in forward], [[row.pk for row in page] for page in backward]
+
+    def test_nulls_sort_last_in_both_directions(self):
+        for ordering, descending in ((('best_price',), False), (('-best_price',), True)):
+            with self.subTest(ordering=ordering):
+                paginator = CursorPaginator(CatalogListing.objects.all(), 2, ordering, ('best_price',))
+                forward, backward = self.walk(paginator)
+                self.assertEqual(sum(forward, []), self.expected(descending))
+                self.assertEqual(backward, forward[::-1])
+                self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+
+    def test_bad_cursor_starts_from_the_top(self):
+        paginator = CursorPaginator(CatalogListing.objects.all(), 2, ('best_price',), ('best_price',))
+        first = paginator.get_page()
+        other = CursorPaginator(CatalogListing.objects.all(), 2, ('-best_price',), ('best_price',))
+        for cursor in ('garbage', other.get_page().next_cursor):
+            page = paginator.get_page(cursor)
+            self.assertEqual([row.pk for row in page], [row.pk for row in first])
+            self.assertFalse(page.has_previous())
+
+    def test_id_list_pages_back_and_forth(self):
+        paginator = IdListCursorPaginator([7, 3, 9, 1, 4], 2, ('distance',))
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        last = paginator.get_page(second.next_cursor)
+        self.assertEqual([first.object_list, second.object_list, last.object_list], [[7, 3], [9, 1], [4]])
+        self.assertFalse(last.has_next())
+        self.assertEqual(paginator.get_page(last.previous_cursor).object_list, [9, 1])
+        self.assertEqual(paginator.get_page(second.previous_cursor).object_list, [7, 3])
+        # the boundary row is gone: start over
+        shrunk = IdListCursorPaginator([7, 9, 1], 2, ('distance',))
+        self.assertEqual(shrunk.get_page(first.next_cursor).object_list, [7, 9])
+
+
+class OfferPriceTests(TestCase):
+    # (original price, discount %, price after discount); the half cents round up
+    CASES = [
+        ('100.00', 0.0, '100.00'),
+        ('100.00', 15.0, '85.00'),
+        ('0.10', 5.0, '0.10'),
+        ('1.05', 50.0, '0.53'),
+        ('2.50', 15.0, '2.13'),
+        ('10.01', 50.0, '5.01'),
+        ('100.05', 50.0, '50.03'),
+        ('9999.99', 33.3, '6669.99'),
+        ('12345.67', 12.5, '10802.46'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='cafe', name='Cafe')
+        cls.branch = Branch.objects.create(
+            vendor=vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        cls.item = Item.objects.create(vendor=vendor, branch=cls.branch, title='Somsa')
+
+    def create_offer(self, price, percent):
+        return Offer.objects.create(
+            item=self.item, branch=self.branch, original_price=Decimal(price),
+            discount_percent=percent, start_date=timezone.now().date()
+        )
+
+    def test_python_and_database_rounding_agree(self):
+        for price, percent, expected in self.CASES:
+            with self.subTest(price=price, percent=percent):
+                offer = self.create_offer(price, percent)
+                stored = Offer.objects.values_list('discounted_price', flat=True).get(pk=offer.pk)
+                self.assertEqual(stored, Decimal(expected))
+                self.assertEqual(offer.current_price, Decimal(expected))
+                self.assertEqual(Offer.objects.get(pk=offer.pk).current_price, Decimal(expected))
+
+    def test_bulk_update_is_recomputed_by_the_database(self):
+        offer = self.create_offer('40.00', 10.0)
+        Offer.objects.filter(pk=offer.pk).update(discount_percent=25.0)
+        self.assertEqual(Offer.objects.get(pk=offer.pk).discounted_price, Decimal('30.00'))
+
+    def test_follows_fields_changed_in_memory(self):
+        offer = self.create_offer('40.00', 10.0)
+        offer.original_price = Decimal('50.00')
+        offer.discount_percent = 20.0
+        with self.assertNumQueries(0):
+            self.assertEqual(offer.current_price, Decimal('40.00'))
+
+    def test_no_reload_after_save(self):
+        offer = self.create_offer('40.00', 10.0)
+        offer.discount_percent = 50.0
+        offer.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(offer.discounted_price, Decimal('20.00'))
+            self.assertEqual(offer.current_price, Decimal('20.00'))
+
+
+class FacetIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        # sparse, large item ids: bit positions must not follow them
+        self.rows = [
+            (
+                item_id,
+                rng.choice([None, 1, 2, 3]),
+                rng.choice([10, 20, 30]),
+                rng.choice(['store', 'cafe', 'restaurant', 'market']),
+                rng.choice([0.0, 10.0, 20.0, 35.0, 50.0, 70.0]),
+            )
+            for item_id in rng.sample(range(1, 10 ** 9), 300)
+        ]
+        self.index = FacetIndex(self.rows)
+
+    def expected(self, rows, selection, base_ids=None):
+        """Counts by brute force over the rows"""
+        values = {row[0]: _facet_values(*row[1:]) for row in rows}
+        if base_ids is not None:
+            values = {item_id: item for item_id, item in values.items() if item_id in base_ids}
+        counts = {}
+        for facet in FACETS:
+            counts[facet] = {}
+            for item in values.values():
+                if all(
+                    set(item[other]) & set(selected)
+                    for other, selected in selection.items() if selected and other != facet
+                ):
+                    for value in item[facet]:
+                        counts[facet][value] = counts[facet].get(value, 0) + 1
+        return counts
+
+    def assertCounts(self, index, rows, selection, base_ids=None):
+        counts = index.counts(selection, base_ids)
+        for facet in FACETS:
+            nonzero = {value: count for value, count in counts[facet].items() if count}
+            self.assertEqual(nonzero, self.expected(rows, selection, base_ids)[facet], facet)
+
+    def test_bitsets_are_dense(self):
+        self.assertEqual(self.index.all, (1 << len(self.rows)) - 1)
+
+    def test_combined_filters(self):
+        selections = [
+            {},
+            {'category': [1]},
+            {'category': [1, 3], 'vendor': [20]},
+            {'type': ['dishes'], 'discount': [50]},
+            {'category': [2], 'vendor': [10, 30], 'type': ['products'], 'discount': [20]},
+        ]
+        base_ids = {row[0] for row in self.rows[::3]}
+        for selection in selections:
+            with self.subTest(selection=selection):
+                self.assertCounts(self.index, self.rows, selection)
+                self.assertCounts(self.index, self.rows, selection, base_ids)
+
+    def test_sync_reuses_positions(self):
+        removed = [row[0] for row in self.rows[:50]]
+        changed = self.rows[50]
+        listing = SimpleNamespace(
+            item_id=changed[0], category_id=3, vendor_id=99, vendor_type='cafe', max_discount=55.0
+        )
+        added = [
+            SimpleNamespace(item_id=item_id, category_id=1, vendor_id=10, vendor_type='store', max_discount=0.0)
+            for item_id in (10 ** 10, 10 ** 10 + 1)
+        ]
+        self.index.sync(removed + [changed[0]], [listing] + added)
+
+        rows = [(changed[0], 3, 99, 'cafe', 55.0)] + self.rows[51:] + [
+            (item.item_id, 1, 10, 'store', 0.0) for item in added
+        ]
+        self.assertEqual(len(self.index), len(rows))
+        self.assertLessEqual(self.index.all.bit_length(), len(self.rows))
+        self.assertCounts(self.index, rows, {})
+        self.assertCounts(self.index, rows, {'vendor': [99, 10], 'discount': [50]})
+        self.assertCounts(self.index, rows, {'category': [1]}, {item.item_id for item in added} | set(removed))
+
+
+class ListingColumnsTests(TestCase):
+    """The columnar filters and sorts agree with the same CatalogListing query"""
+
+    ORIGIN = (41.3, 69.25)
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        store = Vendor.objects.create(owner=owner, type='store', name='Store')
+        cafe = Vendor.objects.create(owner=owner, type='cafe', name='Cafe')
+        categories = [Category.objects.create(name=name, slug=name) for name in ('bread', 'milk')]
+        branches = [
+            Branch.objects.create(
+                vendor=vendor, name=name, address='-', latitude=lat, longitude=lng, phone='-', is_active=active
+            )
+            for vendor, name, lat, lng, active in (
+                (store, 'Center', 41.31, 69.25, True),
+                # same spot as Center: equal distances
+                (cafe, 'Twin', 41.31, 69.25, True),
+                (cafe, 'Far', 41.5, 69.4, True),
+                (store, 'Closed', 41.3, 69.25, False),
+            )
+        ]
+        rng = random.Random(11)
+        created = [timezone.now() - timedelta(hours=hours) for hours in range(4)]
+        items = Item.objects.bulk_create(
+            Item(vendor=branch.vendor, branch=branch, title=f'Item {number}')
+            for number, branch in enumerate(rng.choice(branches) for _ in range(40))
+        )
+        # bulk_create: no signals, the listing rows are set up by hand
+        CatalogListing.objects.bulk_create(
+            CatalogListing(
+                item=item, vendor=item.vendor, branch=item.branch, category=rng.choice(categories + [None]),
+                title=item.title, vendor_name=item.vendor.name, vendor_type=item.vendor.type,
+                vendor_rating=rng.choice([0.0, 4.5, 5.0]),
+                latitude=item.branch.latitude, longitude=item.branch.longitude,
+                best_price=rng.choice([None, Decimal('5.00'), Decimal('9.90'), Decimal('12.00')]),
+                max_discount=rng.choice([0.0, 20.0, 50.0]), has_active_offer=rng.random() < 0.5,
+                item_created_at=rng.choice(created),
+            )
+            for item in items
+        )
+        cls.categories, cls.vendors, cls.branches = categories, (store, cafe), branches
+
+    def setUp(self):
+        branch_arrays.invalidate()
+        self.columns = ListingColumns(CatalogListing.objects.values_list(*COLUMNS))
+
+    def filters(self, **kwargs):
+        filters = {
+            'categories': [], 'vendors': [], 'vendor_types': (), 'min_price': None, 'max_price': None,
+            'min_discount': None, 'origin': None, 'max_distance': None, 'branch_ids': None,
+        }
+        filters.update(kwargs)
+        return filters
+
+    def orm_ids(self, filters, ordering):
+        queryset = filter_catalog_listings(filters)
+        return list(queryset.order_by(
+            *ordering_expressions(ordering + ('pk',), LISTING_NULLABLE)
+        ).values_list('pk', flat=True))
+
+    def filter_cases(self):
+        store, cafe = self.vendors
+        return [
+            self.filters(),
+            self.filters(categories=[self.categories[0].pk]),
+            self.filters(vendors=[cafe.pk]),
+            self.filters(vendor_types=VENDOR_TYPE_GROUPS['products']),
+            self.filters(min_price=5.0, max_price=10.0),
+            self.filters(min_discount=20),
+            self.filters(branch_ids=[self.branches[0].pk, self.branches[2].pk]),
+            self.filters(categories=[self.categories[1].pk], vendors=[store.pk, cafe.pk], min_discount=50),
+        ]
+
+    def test_filters_and_sorts_match_the_database(self):
+        for ordering in [DEFAULT_LISTING_ORDERING, *LISTING_SORTS.values()]:
+            for filters in self.filter_cases():
+                with self.subTest(ordering=ordering, filters=filters):
+                    self.assertEqual(self.columns.select(ordering, **filters).tolist(), self.orm_ids(filters, ordering))
+
+    def test_prices_sort_nulls_last(self):
+        for ordering in (LISTING_SORTS['price_asc'], LISTING_SORTS['price_desc']):
+            ids = self.columns.select(ordering).tolist()
+            prices = dict(CatalogListing.objects.values_list('pk', 'best_price'))
+            missing = [pk for pk in ids if prices[pk] is None]
+            self.assertTrue(missing)
+            self.assertEqual(ids[-len(missing):], missing)
+
+    def expected_by_distance(self, filters, max_distance=None):
+        """Distance, newest first, then pk; branches that are not active have no distance and go last"""
+        active = {branch.pk for branch in self.branches if branch.is_active}
+        rows = filter_catalog_listings(filters).values_list('pk', 'branch_id', 'latitude', 'longitude', 'item_created_at')
+        keyed = []
+        for pk, branch_id, lat, lng, created_at in rows:
+            distance = haversine(*self.ORIGIN, lat, lng) if branch_id in active else None
+            if max_distance is not None and (distance is None or distance > max_distance):
+                continue
+            keyed.append(((distance is None, distance or 0, -created_at.timestamp(), pk), pk))
+        return [pk for _, pk in sorted(keyed)]
+
+    def test_distance_sort_and_radius(self):
+        ordering = ('distance', '-item_created_at')
+        for filters in self.filter_cases():
+            with self.subTest(filters=filters):
+                ids = self.columns.select(ordering, **dict(filters, origin=self.ORIGIN))
+                self.assertEqual(ids.tolist(), self.expected_by_distance(filters))
+                ids = self.columns.select(ordering, **dict(filters, origin=self.ORIGIN, max_distance=5))
+                self.assertEqual(ids.tolist(), self.expected_by_distance(filters, 5))
+
+    def test_distance_ties_break_on_creation_then_pk(self):
+        twins = {self.branches[0].pk, self.branches[1].pk}
+        ids = self.columns.select(('distance', '-item_created_at'), origin=self.ORIGIN, branch_ids=list(twins))
+        rows = dict(CatalogListing.objects.filter(branch_id__in=twins).values_list('pk', 'item_created_at'))
+        self.assertGreater(len(rows), len(set(rows.values())))
+        self.assertEqual(ids.tolist(), sorted(rows, key=lambda pk: (-rows[pk].timestamp(), pk)))
+
+    def test_empty_snapshot(self):
+        columns = ListingColumns()
+        self.assertEqual(len(columns), 0)
+        self.assertEqual(columns.select(DEFAULT_LISTING_ORDERING).tolist(), [])
+        self.assertEqual(columns.select(
+            ('distance',), categories=[1], min_price=1.0, max_price=2.0, origin=self.ORIGIN, max_distance=5
+        ).tolist(), [])
+
+
+class SnapshotPublishTests(TestCase):
+    """Listing changes are marked pending and published as one generation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='cafe', name='Cafe')
+        branch = Branch.objects.create(
+            vendor=vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        items = Item.objects.bulk_create(Item(vendor=vendor, branch=branch, title=f'Item {n}') for n in range(5))
+        CatalogListing.objects.bulk_create(
+            CatalogListing(
+                item=item, vendor=vendor, branch=branch, title=item.title, vendor_name=vendor.name,
+                vendor_type=vendor.type, latitude=branch.latitude, longitude=branch.longitude,
+                best_price=Decimal('10.00'), item_created_at=timezone.now(),
+            )
+            for item in items
+        )
+        cls.item_ids = [item.pk for item in items]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings = override_settings(CATALOG_SNAPSHOT_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        listing_columns.invalidate()
+        self.addCleanup(listing_columns.invalidate)
+        self.generation, _ = write_snapshot()
+
+    def age_generation(self, seconds=PUBLISH_INTERVAL + 1):
+        path = snapshot_dir() / f'{SNAPSHOT_NAME}.generation'
+        timestamp = time.time() - seconds
+        os.utime(path, (timestamp, timestamp))
+
+    def published_prices(self):
+        generation, _ = current_generation(SNAPSHOT_NAME)
+        table = read_table(SNAPSHOT_NAME, generation)
+        return dict(zip(table['pk'].tolist(), table['best_price'].tolist()))
+
+    def test_changes_right_after_a_publication_wait(self):
+        first, second, removed = self.item_ids[:3]
+        CatalogListing.objects.filter(pk=first).update(best_price=Decimal('1.00'))
+        sync_listings([first], [])
+        CatalogListing.objects.filter(pk=second).update(best_price=Decimal('2.00'))
+        sync_listings([second], [])
+        CatalogListing.objects.filter(pk=removed).delete()
+        sync_listings([removed], [])
+        self.assertEqual(current_generation(SNAPSHOT_NAME)[0], self.generation)
+        self.assertTrue(has_pending(SNAPSHOT_NAME))
+
+        # one new generation with all three changes
+        self.age_generation()
+        generation = publish_listings()
+        self.assertNotEqual(generation, self.generation)
+        self.assertFalse(has_pending(SNAPSHOT_NAME))
+        prices = self.published_prices()
+        self.assertEqual((prices[first], prices[second]), (1.0, 2.0))
+        self.assertNotIn(removed, prices)
+        self.assertEqual(len(prices), len(self.item_ids) - 1)
+        self.assertIsNone(publish_listings())
+
+    def test_readers_publish_pending_changes(self):
+        item_id = self.item_ids[-1]
+        CatalogListing.objects.filter(pk=item_id).update(best_price=Decimal('30.00'))
+        sync_listings([item_id], [])
+        self.assertEqual(listing_columns.get().select(('-best_price',))[0], self.item_ids[0])
+
+        self.age_generation()
+        listing_columns.invalidate()
+        self.assertEqual(listing_columns.get().select(('-best_price',))[0], item_id)
+        self.assertNotEqual(current_generation(SNAPSHOT_NAME)[0], self.generation)
+
+    def test_an_old_generation_is_published_right_away(self):
+        self.age_generation()
+        CatalogListing.objects.filter(pk=self.item_ids[0]).update(best_price=Decimal('4.00'))
+        sync_listings([self.item_ids[0]], [])
+        self.assertFalse(has_pending(SNAPSHOT_NAME))
+        self.assertEqual(self.published_prices()[self.item_ids[0]], 4.0)
+
+    def test_pending_keys_survive_a_failed_or_busy_publication(self):
+        mark_pending(SNAPSHOT_NAME, self.item_ids[:2])
+        self.age_generation()
+
+        def fail(table, keys):
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            publish_pending(SNAPSHOT_NAME, fail, lambda: None)
+        # another process is publishing: skip without waiting
+        with publishing(SNAPSHOT_NAME):
+            self.assertIsNone(publish_listings())
+        self.assertEqual(take_pending(SNAPSHOT_NAME), set(self.item_ids[:2]))
+
+    def test_full_snapshot_clears_pending(self):
+        mark_pending(SNAPSHOT_NAME, self.item_ids)
+        write_snapshot()
+        self.assertFalse(has_pending(SNAPSHOT_NAME))
+
+
+class SearchRankingTests(TestCase):
+    """Full-text ranking of search_item_ids() and when the trigram fallback joins in"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        cls.owner = owner
+        cls.vendor = Vendor.objects.create(owner=owner, type='cafe', name='Lola')
+        cls.branch = Branch.objects.create(
+            vendor=cls.vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        cls.bread = Category.objects.create(name='Хлеб', slug='bread')
+
+    def setUp(self):
+        trigram_index.invalidate()
+        self.addCleanup(trigram_index.invalidate)
+
+    def listing(self, title, description='', vendor_name='Lola', category=None):
+        item = Item.objects.create(vendor=self.vendor, branch=self.branch, title=title, description=description)
+        CatalogListing.objects.create(
+            item=item, vendor=self.vendor, branch=self.branch, category=category, title=title,
+            description=description, vendor_name=vendor_name, vendor_type=self.vendor.type,
+            latitude=self.branch.latitude, longitude=self.branch.longitude, item_created_at=timezone.now(),
+        )
+        return item.pk
+
+    def fillers(self, count):
+        for number in range(count):
+            self.listing(f'Чай {number}', 'Зелёный')
+
+    def test_title_outranks_description_outranks_vendor_and_category(self):
+        self.fillers(6)
+        in_vendor = self.listing('Торт', vendor_name='Somsa House')
+        in_description = self.listing('Пирог', 'Как сомса, только сладкий')
+        in_title = self.listing('Сомса')
+        in_category = self.listing('Булка', category=Category.objects.create(name='Somsa', slug='somsa'))
+        rebuild()
+        ids = search_item_ids('somsa')
+        self.assertEqual(ids[:2], [in_title, in_description])
+        self.assertCountEqual(ids[2:], [in_vendor, in_category])
+
+    def test_more_hits_in_the_title_rank_first_and_ties_keep_id_order(self):
+        self.fillers(6)
+        twice = self.listing('Non non')
+        first = self.listing('Non')
+        second = self.listing('Non')
+        rebuild()
+        self.assertEqual(search_item_ids('non'), [twice, first, second])
+
+    def test_limit(self):
+        ids = [self.listing(f'Lepyoshka {number}') for number in range(8)]
+        rebuild()
+        self.assertEqual(search_item_ids('lepyoshka'), ids)
+        self.assertEqual(search_item_ids('lepyoshka', limit=3), ids[:3])
+        self.assertGreaterEqual(MAX_RESULTS, 100)
+
+    def test_few_hits_add_trigram_matches_after_them(self):
+        self.fillers(4)
+        exact = self.listing('Samsa')
+        near = self.listing('Samsa tandir')
+        typo = self.listing('Somsa')
+        rebuild()
+        self.assertEqual(search_item_ids('samsa'), [exact, near, typo])
+        # no full-text hit at all: only near matches, two typos are too many for 'somsa'
+        self.assertEqual(search_item_ids('samsq'), [exact, near])
+
+    def test_enough_hits_skip_the_trigram_fallback(self):
+        ids = [self.listing(f'Samsa {number}') for number in range(FUZZY_MIN_RESULTS)]
+        self.listing('Somsa')
+        rebuild()
+        with mock.patch.object(trigram_index, 'get') as fallback:
+            self.assertEqual(search_item_ids('samsa'), ids)
+        fallback.assert_not_called()
+
+    def test_empty_query(self):
+        self.assertEqual(search_item_ids(' !? '), [])
+
+    def test_items_matching_takes_title_prefixes_and_listing_hits(self):
+        self.fillers(6)
+        in_description = self.listing('Пирог', 'Как сомса, только сладкий')
+        # not listed: found by the prefix of its stored title key only
+        unlisted = Item.objects.create(vendor=self.vendor, branch=self.branch, title='Сомса', is_active=False)
+        Item.objects.create(vendor=self.vendor, branch=self.branch, title='Большая сомса', is_active=False)
+        rebuild()
+        items = Item.objects.filter(items_matching('somsa'))
+        self.assertCountEqual(items.values_list('pk', flat=True), [in_description, unlisted.pk])
+        self.assertEqual(Item.objects.filter(items_matching(' ')).count(), Item.objects.count())
+
+
+class TrigramIndexTests(TestCase):
+    """Vocabulary build, incremental sync and the edit-distance confirmation of the typo fallback"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        cls.vendor = Vendor.objects.create(owner=owner, type='cafe', name='Lola')
+        cls.branch = Branch.objects.create(
+            vendor=cls.vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+
+    def setUp(self):
+        trigram_index.invalidate()
+        self.addCleanup(trigram_index.invalidate)
+
+    def item(self, title):
+        return Item.objects.create(vendor=self.vendor, branch=self.branch, title=title)
+
+    def similarity(self, a, b):
+        shared = len(trigrams(a) & trigrams(b))
+        return shared / len(trigrams(a) | trigrams(b))
+
+    def test_build_indexes_title_and_vendor_words(self):
+        index = TrigramIndex([(1, 'Самса с мясом', 'Lola'), (2, 'Samsa', 'Oq tandir')])
+        self.assertEqual(len(index), 2)
+        # two-letter words are not indexed
+        self.assertCountEqual(index.words, ['samsa', 'myasom', 'lola', 'tandir'])
+        samsa = index.word_ids['samsa']
+        self.assertEqual(index.word_items[samsa], {1, 2})
+        self.assertEqual(index.item_words[2], {samsa, index.word_ids['tandir']})
+        for gram in trigrams('samsa'):
+            self.assertIn(samsa, index.postings[gram])
+        self.assertEqual(index.word_trigrams[samsa], len(trigrams('samsa')))
+
+    def test_build_from_listings(self):
+        items = [self.item('Samsa'), self.item('Lepyoshka')]
+        refresh_listings([item.pk for item in items])
+        trigram_index.invalidate()
+        self.assertEqual(len(trigram_index.get()), 2)
+        self.assertEqual([item_id for item_id, _ in trigram_index.get().search('lepyoshka')], [items[1].pk])
+
+    def test_typo_match(self):
+        index = TrigramIndex([(1, 'Somsa', ''), (2, 'Khachapuri', ''), (3, 'Non', '')])
+        self.assertEqual([item_id for item_id, _ in index.search('samsa')], [1])
+        # longer words tolerate two typos
+        self.assertEqual([item_id for item_id, _ in index.search('xachapury')], [2])
+
+    def test_similar_but_too_many_edits_is_not_a_match(self):
+        index = TrigramIndex([(1, 'Samsara', ''), (2, 'Samsa', '')])
+        self.assertGreaterEqual(self.similarity('samsa', 'samsara'), MIN_SIMILARITY)
+        self.assertGreater(edit_distance('samsa', 'samsara', max_edits('samsa')), max_edits('samsa'))
+        self.assertEqual(index.search('samsa'), [(2, 1.0)])
+
+    def test_below_similarity_is_not_a_match(self):
+        index = TrigramIndex([(1, 'Non', '')])
+        # one typo, but short words share too few trigrams
+        self.assertEqual(edit_distance('nan', 'non', 1), 1)
+        self.assertLess(self.similarity('nan', 'non'), MIN_SIMILARITY)
+        self.assertEqual(index.search('nan'), [])
+
+    def test_sync_adds_changes_and_drops_items(self):
+        somsa, plov = self.item('Somsa'), self.item('Plov')
+        refresh_listings([somsa.pk, plov.pk])
+        index = trigram_index.get()
+        self.assertEqual([item_id for item_id, _ in index.search('samsa')], [somsa.pk])
+
+        lagman = self.item('Lagman')
+        Item.objects.filter(pk=plov.pk).update(title='Plov tandir')
+        refresh_listings([lagman.pk, plov.pk])
+        # same index object, updated in place
+        self.assertIs(trigram_index.get(), index)
+        self.assertEqual([item_id for item_id, _ in index.search('lagmon')], [lagman.pk])
+        self.assertEqual([item_id for item_id, _ in index.search('tandyr')], [plov.pk])
+
+        somsa_id = somsa.pk
+        somsa.delete()
+        Item.objects.filter(pk=lagman.pk).update(is_active=False)
+        refresh_listings([somsa_id, lagman.pk])
+        self.assertEqual(index.search('samsa'), [])
+        self.assertEqual(index.search('lagmon'), [])
+        self.assertEqual(len(index), 1)
 
-# Create your tests here.
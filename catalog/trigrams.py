@@ -0,0 +1,154 @@
+"""
+Typo-tolerant fallback for catalog search.
+
+The words of every listed item's title and vendor name (as search keys) form
+a vocabulary; each word is indexed by its trigrams. A misspelled query word
+is compared only with vocabulary words sharing trigrams with it, scored by
+trigram similarity and confirmed with a bounded edit distance, and the items
+containing the surviving words come back ranked by how well they matched.
+catalog.search.search_item_ids() calls it only when the full-text index
+finds too little.
+"""
+import threading
+from collections import Counter
+
+from foodsave.snapshots import LazySnapshot
+from vendors.normalize import search_key
+
+# Same measure as PostgreSQL pg_trgm: shared / (all distinct trigrams of both)
+MIN_SIMILARITY = 0.3
+# Candidate words checked with the edit distance per query word
+MAX_CANDIDATES = 50
+MAX_RESULTS = 50
+
+
+def trigrams(word):
+    """Distinct trigrams of a word padded like pg_trgm ("  w", "wor", ..., "rd ")"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word):
+    """Typos tolerated in a word of this length"""
+    return 1 if len(word) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 as soon as it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    """Trigram postings over the words of listed items, with incremental updates"""
+
+    def __init__(self, rows=()):
+        self.words = []            # word id -> word
+        self.word_ids = {}         # word -> word id
+        self.word_trigrams = []    # word id -> number of distinct trigrams
+        self.postings = {}         # trigram -> [word id, ...]
+        self.word_items = []       # word id -> {item id, ...}
+        self.item_words = {}       # item id -> {word id, ...}
+        self._lock = threading.Lock()
+        for item_id, title, vendor_name in rows:
+            self._add(item_id, title, vendor_name)
+
+    def __len__(self):
+        return len(self.item_words)
+
+    def _word_id(self, word):
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            word_id = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            self.word_items.append(set())
+            grams = trigrams(word)
+            self.word_trigrams.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(word_id)
+        return word_id
+
+    def _add(self, item_id, title, vendor_name):
+        words = set(f'{search_key(title)} {search_key(vendor_name)}'.split())
+        word_ids = {self._word_id(word) for word in words if len(word) > 2}
+        self.item_words[item_id] = word_ids
+        for word_id in word_ids:
+            self.word_items[word_id].add(item_id)
+
+    def _remove(self, item_id):
+        for word_id in self.item_words.pop(item_id, ()):
+            self.word_items[word_id].discard(item_id)
+
+    def sync(self, item_ids, listings):
+        """Replace the given items with their current listings (missing ones are unlisted)"""
+        with self._lock:
+            for item_id in item_ids:
+                self._remove(item_id)
+            for listing in listings:
+                self._add(listing.item_id, listing.title, listing.vendor_name)
+
+    def similar_words(self, word):
+        """[(word id, similarity)] of vocabulary words within max_edits(word) typos"""
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = []
+        for word_id, count in shared.items():
+            similarity = count / (len(grams) + self.word_trigrams[word_id] - count)
+            if similarity >= MIN_SIMILARITY and self.word_items[word_id]:
+                scored.append((similarity, word_id))
+        scored.sort(reverse=True)
+
+        limit = max_edits(word)
+        return [
+            (word_id, similarity)
+            for similarity, word_id in scored[:MAX_CANDIDATES]
+            if edit_distance(word, self.words[word_id], limit) <= limit
+        ]
+
+    def search(self, query, limit=MAX_RESULTS):
+        """[(item id, score)] best first; the score sums each query word's best similarity"""
+        words = [word for word in search_key(query).split() if len(word) > 2]
+        if not words:
+            return []
+        with self._lock:
+            scores = Counter()
+            for word in words:
+                best = {}
+                for word_id, similarity in self.similar_words(word):
+                    for item_id in self.word_items[word_id]:
+                        if similarity > best.get(item_id, 0.0):
+                            best[item_id] = similarity
+                scores.update(best)
+        return sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+
+
+def _build_trigram_index():
+    from .models import CatalogListing
+
+    return TrigramIndex(CatalogListing.objects.values_list('item_id', 'title', 'vendor_name'))
+
+
+trigram_index = LazySnapshot(_build_trigram_index)
+
+
+def sync_listings(item_ids, listings):
+    """Apply refreshed listings to the trigram index, if this process has built one"""
+    index = trigram_index.peek()
+    if index is not None:
+        index.sync(item_ids, listings)
@@ -11,6 +11,9 @@ urlpatterns = [
     path('vendors/search/', views.SearchView.as_view(), name='search'),
     path('vendors/add-category/', views.add_category, name='add_category'),
     path('add-unit/', views.add_unit, name='add_unit'),
+    path('api/listings/', views.catalog_listings_api, name='api_listings'),
+    path('api/search/', views.search_api, name='api_search'),
+    path('api/autocomplete/', views.autocomplete_api, name='api_autocomplete'),
     path('api/recommendations/', views.get_recommendations, name='api_recommendations'),
     path('api/quick-sets/', views.get_quick_sets, name='api_quick_sets'),
     path('api/custom-sets/', views.get_custom_sets, name='api_custom_sets'),
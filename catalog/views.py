@@ -1,6 +1,5 @@
 from django.shortcuts import render, get_object_or_404
 from django.views.generic import ListView, DetailView
-from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -8,10 +7,20 @@ from django.views.decorators.http import require_http_methods
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.core.paginator import Paginator
-import math
-from .models import Item, Category, Offer, SurpriseBox
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from .models import Item, Category, Offer, SurpriseBox, CatalogListing
+from .listings import items_in_order, listing_items
+from .facets import DISCOUNT_BUCKETS, VENDOR_TYPE_GROUPS, facet_index
+from .columns import listing_columns
+from .search import search_item_ids, search_listings
+from .autocomplete import CATEGORY, ITEM, SUGGESTION_LIMIT, autocomplete_index
+from .cursor import CURSOR_PARAM, CursorPage, CursorPaginator, IdListCursorPaginator, ordering_expressions
 from .forms import CategoryForm, UnitForm
 from vendors.models import Vendor, Branch
+from vendors.distance import haversine
+from vendors.hours import open_branches, open_filter_minutes
+from vendors.spatial import branch_index, valid_point
 from django.utils import timezone
 from django.utils.text import slugify
 import json
@@ -19,101 +28,218 @@ import json
 
 from vendors.models import Branch, Vendor
 
-def catalog_view(request):
-    from django.db.models import Q
-    from django.utils import timezone
-    
-    # Filter active items (include expired items)
-    queryset = Item.objects.filter(
-        is_active=True
-    ).select_related('vendor', 'category', 'branch').prefetch_related(
-        'images',
-        'offers__branch'
-    )
-    
-    # Filter by categories (checkbox filter)
-    categories = request.GET.getlist('categories')
-    if categories:
-        queryset = queryset.filter(category__id__in=categories)
-    
-    # Filter by vendors (checkbox filter)
-    vendors_filter = request.GET.getlist('vendors')
-    if vendors_filter:
-        queryset = queryset.filter(vendor__id__in=vendors_filter)
-    
-    # Filter by price range
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price and max_price:
-        try:
-            min_price = float(min_price)
-            max_price = float(max_price)
-            queryset = queryset.filter(
-                offers__discounted_price__gte=min_price, 
-                offers__discounted_price__lte=max_price,
-                offers__is_active=True, 
-                offers__status='available'
-            )
-        except ValueError:
-            pass
-    
-    # Filter by distance (if user location is provided)
-    distance_filter = request.GET.get('distance')
-    user_lat = request.GET.get('lat')
-    user_lng = request.GET.get('lng')
-    if distance_filter and user_lat and user_lng:
-        try:
-            max_distance = float(distance_filter)
-            user_lat = float(user_lat)
-            user_lng = float(user_lng)
-            # This would need a more complex implementation with spatial queries
-            # For now, we'll just pass the parameters to the template
-        except ValueError:
-            pass
-    
-    # Filter by vendor type (products vs dishes)
-    vendor_type = request.GET.get('type')
-    if vendor_type == 'products':
-        queryset = queryset.filter(vendor__type='store')
-    elif vendor_type == 'dishes':
-        queryset = queryset.filter(vendor__type__in=['restaurant', 'cafe'])
-    
-    # Filter by discount percentage
-    discount_filter = request.GET.get('discount')
-    if discount_filter:
+LISTING_PAGE_SIZE = 12
+
+# CatalogListing orderings, newest first among equal sort keys
+DEFAULT_LISTING_ORDERING = ('-has_active_offer', '-item_created_at')
+LISTING_SORTS = {
+    'price_asc': ('best_price', '-item_created_at'),
+    'price_desc': ('-best_price', '-item_created_at'),
+    'discount': ('-max_discount', '-item_created_at'),
+    'rating': ('-vendor_rating', '-item_created_at'),
+}
+# Sort keys that can be NULL, they always go last
+LISTING_NULLABLE = ('best_price',)
+
+
+def _int_list(values):
+    result = []
+    for value in values:
         try:
-            min_discount = int(discount_filter)
-            queryset = queryset.filter(offers__discount_percent__gte=min_discount, offers__is_active=True, offers__status='available')
-        except ValueError:
+            result.append(int(value))
+        except (TypeError, ValueError):
             pass
+    return result
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_catalog_filters(params):
+    """Normalized catalog filters from a GET QueryDict, shared by the ORM and columnar paths"""
+    min_price = _float_or_none(params.get('min_price'))
+    max_price = _float_or_none(params.get('max_price'))
+    if min_price is None or max_price is None:
+        min_price = max_price = None
+    
+    # User location, the distance radius only counts together with it
+    origin = max_distance = None
+    lat = _float_or_none(params.get('lat'))
+    lng = _float_or_none(params.get('lng'))
+    distance = params.get('distance')
+    if lat and lng and valid_point(lat, lng) and (not distance or _float_or_none(distance) is not None):
+        origin = (lat, lng)
+        max_distance = _float_or_none(distance)
+    
+    discount = _int_list([params.get('discount')]) if params.get('discount') else []
+    
+    # Branches open now / within the hour, from the indexed weekly intervals
+    open_within = open_filter_minutes(params)
+    branch_ids = None
+    if open_within is not None:
+        branch_ids = list(open_branches(open_within).values_list('branch_id', flat=True))
+    return {
+        'categories': _int_list(params.getlist('categories')),
+        'vendors': _int_list(params.getlist('vendors')),
+        'vendor_types': VENDOR_TYPE_GROUPS.get(params.get('type'), ()),
+        'min_price': min_price,
+        'max_price': max_price,
+        'min_discount': discount[0] if discount else None,
+        'origin': origin,
+        'max_distance': max_distance,
+        'branch_ids': branch_ids,
+    }
+
+
+def catalog_ordering(params, filters):
+    """CatalogListing ordering for the `sort` parameter"""
+    sort_by = params.get('sort')
+    if sort_by in LISTING_SORTS:
+        return LISTING_SORTS[sort_by]
+    if sort_by == 'distance':
+        return ('distance', '-item_created_at') if filters['origin'] else ('-item_created_at',)
+    # Default sorting: items with active offers first, then by creation date
+    return DEFAULT_LISTING_ORDERING
+
+
+def catalog_template_filters(params, filters):
+    """Filter values echoed back into the sidebar form"""
+    origin = filters['origin']
+    return {
+        'selected_categories': params.getlist('categories'),
+        'selected_vendors': params.getlist('vendors'),
+        'min_price': filters['min_price'] if filters['min_price'] is not None else params.get('min_price'),
+        'max_price': filters['max_price'] if filters['max_price'] is not None else params.get('max_price'),
+        'selected_distance': params.get('distance'),
+        'selected_open': params.get('open') if filters['branch_ids'] is not None else '',
+        'user_lat': origin[0] if origin else params.get('lat'),
+        'user_lng': origin[1] if origin else params.get('lng'),
+    }
+
+
+def filter_catalog_listings(filters):
+    """CatalogListing rows matching the parsed catalog filters, except the distance ones"""
+    # Active items (include expired items) come from the denormalized listing table
+    queryset = CatalogListing.objects.all()
+    
+    if filters['categories']:
+        queryset = queryset.filter(category_id__in=filters['categories'])
+    if filters['vendors']:
+        queryset = queryset.filter(vendor_id__in=filters['vendors'])
+    if filters['min_price'] is not None:
+        queryset = queryset.filter(best_price__gte=filters['min_price'], best_price__lte=filters['max_price'])
+    if filters['vendor_types']:
+        queryset = queryset.filter(vendor_type__in=filters['vendor_types'])
+    if filters['min_discount'] is not None:
+        queryset = queryset.filter(max_discount__gte=filters['min_discount'])
+    if filters['branch_ids'] is not None:
+        queryset = queryset.filter(branch_id__in=filters['branch_ids'])
+    return queryset
+
+
+def catalog_cursor_page(params):
+    """
+    Cursor page of CatalogListing rows for the catalog filters, returns
+    (page, filter values for the template). With a user location the ids come
+    sorted by the listing columns and only the page is read from the
+    database: distances have no column to filter or seek on.
+    """
+    filters = parse_catalog_filters(params)
+    ordering = catalog_ordering(params, filters)
+    cursor = params.get(CURSOR_PARAM)
+    
+    if filters['origin'] is None:
+        paginator = CursorPaginator(filter_catalog_listings(filters), LISTING_PAGE_SIZE, ordering, LISTING_NULLABLE)
+        return paginator.get_page(cursor), catalog_template_filters(params, filters)
+    
+    ids = listing_columns.get().select(ordering, **filters)
+    page = IdListCursorPaginator(ids, LISTING_PAGE_SIZE, ordering).get_page(cursor)
+    listings = CatalogListing.objects.in_bulk(page.object_list)
+    page.object_list = [listings[pk] for pk in page.object_list if pk in listings]
+    for listing in page.object_list:
+        listing.distance = haversine(*filters['origin'], listing.latitude, listing.longitude)
+    return page, catalog_template_filters(params, filters)
+
+
+def select_catalog_ids(params):
+    """Ordered item ids for the catalog filters, resolved on the in-memory listing columns"""
+    filters = parse_catalog_filters(params)
+    return listing_columns.get().select(catalog_ordering(params, filters), **filters)
+
+
+def catalog_facet_counts(params):
+    """Sidebar counts per category, vendor, type and discount bucket for the current filters"""
+    filters = parse_catalog_filters(params)
+    selection = {
+        'category': filters['categories'],
+        'vendor': filters['vendors'],
+        'type': [params['type']] if filters['vendor_types'] else [],
+        'discount': [filters['min_discount']] if filters['min_discount'] in DISCOUNT_BUCKETS else [],
+    }
     
-    # Sorting
-    sort_by = request.GET.get('sort')
-    if sort_by == 'price_asc':
-        queryset = queryset.order_by('offers__discounted_price')
-    elif sort_by == 'price_desc':
-        queryset = queryset.order_by('-offers__discounted_price')
-    elif sort_by == 'discount':
-        queryset = queryset.order_by('-offers__discount_percent')
-    elif sort_by == 'rating':
-        queryset = queryset.order_by('-vendor__rating')
-    elif sort_by == 'distance':
-        # Distance sorting would need spatial queries implementation
-        queryset = queryset.order_by('-created_at')
+    # price, distance and opening hours aren't facets, they narrow the set the counts run on
+    base_ids = None
+    if filters['min_price'] is not None or filters['max_distance'] is not None or filters['branch_ids'] is not None:
+        base_ids = listing_columns.get().select(
+            ('pk',),
+            min_price=filters['min_price'],
+            max_price=filters['max_price'],
+            origin=filters['origin'],
+            max_distance=filters['max_distance'],
+            branch_ids=filters['branch_ids'],
+        ).tolist()
+    
+    return facet_index.get().counts(selection, base_ids)
+
+
+def paginate_listings(request, queryset, ordering, per_page=LISTING_PAGE_SIZE):
+    """
+    Page of CatalogListing rows: keyset pagination when the request carries a
+    `cursor` parameter (an empty one starts from the top), classic page numbers otherwise.
+    """
+    if CURSOR_PARAM in request.GET:
+        page = CursorPaginator(queryset, per_page, ordering, LISTING_NULLABLE).get_page(request.GET[CURSOR_PARAM])
+        page.set_urls(request)
+        return page
+    # one listing row per item, no distinct needed; pk keeps equal keys in a stable order
+    queryset = queryset.order_by(*ordering_expressions(ordering + ('pk',), LISTING_NULLABLE))
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
+
+
+def paginate_ids(request, ids, ordering, per_page=LISTING_PAGE_SIZE):
+    """Like paginate_listings() for item ids already sorted elsewhere, the page holds ids"""
+    if CURSOR_PARAM in request.GET:
+        page = IdListCursorPaginator(ids, per_page, ordering).get_page(request.GET[CURSOR_PARAM])
+        page.set_urls(request)
+        return page
+    return Paginator(ids, per_page).get_page(request.GET.get('page'))
+
+
+def catalog_view(request):
+    if CURSOR_PARAM in request.GET:
+        items, filters = catalog_cursor_page(request.GET)
+        items.set_urls(request)
+        items.object_list = listing_items(items.object_list)
+        cursor_page = items
     else:
-        # Default sorting: items with active offers first, then by creation date
-        queryset = queryset.order_by('-offers__is_active', '-created_at')
-    
-    # Remove duplicates that might occur due to multiple offers per item
-    queryset = queryset.distinct()
-    
-    # Pagination
-    paginator = Paginator(queryset, 12)
-    page_number = request.GET.get('page')
-    items = paginator.get_page(page_number)
-    
-    # Get all vendors for the filter
-    vendors = Vendor.objects.filter(is_active=True).order_by('name')
+        # Filters and sorting run on the listing columns, the database only serves the page
+        filters = catalog_template_filters(request.GET, parse_catalog_filters(request.GET))
+        items = Paginator(select_catalog_ids(request.GET), LISTING_PAGE_SIZE).get_page(request.GET.get('page'))
+        items.object_list = items_in_order(items.object_list.tolist())
+        cursor_page = None
+    
+    # Get all vendors and categories for the filter, with facet counts
+    facet_counts = catalog_facet_counts(request.GET)
+    vendors = list(Vendor.objects.filter(is_active=True).order_by('name'))
+    for vendor in vendors:
+        vendor.facet_count = facet_counts['vendor'].get(vendor.pk, 0)
+    categories = list(Category.objects.filter(is_active=True))
+    for category in categories:
+        category.facet_count = facet_counts['category'].get(category.pk, 0)
     
     # Get available Surprise Boxes (include expired boxes)
     surprise_boxes = SurpriseBox.objects.filter(
@@ -125,37 +251,81 @@ def catalog_view(request):
     context = {
         'items': items,
         'surprise_boxes': surprise_boxes,
-        'categories': Category.objects.filter(is_active=True),
+        'categories': categories,
         'vendors': vendors,
+        'type_counts': facet_counts['type'],
+        'discount_counts': {str(bucket): count for bucket, count in facet_counts['discount'].items()},
         'current_type': request.GET.get('type', ''),
-        'is_paginated': items.has_other_pages(),
+        'is_paginated': cursor_page is None and items.has_other_pages(),
         'page_obj': items,
-        'selected_categories': categories,
-        'selected_vendors': vendors_filter,
-        'min_price': min_price,
-        'max_price': max_price,
-        'selected_distance': distance_filter,
-        'user_lat': user_lat,
-        'user_lng': user_lng,
+        'cursor_page': cursor_page,
+        **filters,
     }
     
     return render(request, 'catalog/catalog.html', context)
 
 
-class CategoryView(ListView):
+def catalog_listings_api(request):
+    """JSON feed of the catalog for infinite scroll, always cursor paginated"""
+    page, _ = catalog_cursor_page(request.GET)
+    
+    return JsonResponse({
+        'results': [listing_json(listing) for listing in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def listing_json(listing):
+    """Catalog card data of a CatalogListing row for the JSON APIs"""
+    return {
+        'id': listing.pk,
+        'title': listing.title,
+        'vendor': listing.vendor_name,
+        'vendor_type': listing.vendor_type,
+        'price': float(listing.best_price) if listing.best_price is not None else None,
+        'discount': listing.max_discount,
+        'image': default_storage.url(listing.primary_image) if listing.primary_image else None,
+        'distance': round(listing.distance, 2) if getattr(listing, 'distance', None) is not None else None,
+        'url': reverse('catalog:item_detail', args=[listing.pk]),
+    }
+
+
+class ListingPaginationMixin:
+    """
+    ListView over CatalogListing rows that hands full Items of the page to the
+    template. get_queryset() returns unordered rows, `listing_ordering` sorts them,
+    or a list of item ids that is already in order.
+    """
+    listing_ordering = DEFAULT_LISTING_ORDERING
+    
+    def paginate_queryset(self, queryset, page_size):
+        if isinstance(queryset, list):
+            page = paginate_ids(self.request, queryset, self.listing_ordering, page_size)
+            page.object_list = items_in_order(list(page.object_list))
+        else:
+            page = paginate_listings(self.request, queryset, self.listing_ordering, page_size)
+            page.object_list = listing_items(page.object_list)
+        if isinstance(page, CursorPage):
+            self.cursor_page = page
+            return None, page, page.object_list, False
+        return page.paginator, page, page.object_list, page.has_other_pages()
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_page'] = getattr(self, 'cursor_page', None)
+        return context
+
+
+class CategoryView(ListingPaginationMixin, ListView):
     model = Item
     template_name = 'catalog/category.html'
     context_object_name = 'items'
     paginate_by = 12
     
     def get_queryset(self):
-        from django.db.models import Q
-        from django.utils import timezone
         self.category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
-        return Item.objects.filter(
-            category=self.category, 
-            is_active=True
-        ).select_related('vendor')
+        return CatalogListing.objects.filter(category=self.category)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -205,7 +375,7 @@ def item_detail_view(request, pk):
     return render(request, 'catalog/item_detail.html', context)
 
 
-class SearchView(ListView):
+class SearchView(ListingPaginationMixin, ListView):
     model = Item
     template_name = 'catalog/search.html'
     context_object_name = 'items'
@@ -214,13 +384,13 @@ class SearchView(ListView):
     def get_queryset(self):
         query = self.request.GET.get('q')
         if query:
-            return Item.objects.filter(
-                Q(title__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(vendor__name__icontains=query),
-                is_active=True
-            ).select_related('vendor', 'category')
-        return Item.objects.none()
+            # best full-text matches first, only the page is read from the database
+            item_ids = search_item_ids(query)
+            if item_ids is not None:
+                self.listing_ordering = ('rank',)
+                return item_ids
+            return search_listings(CatalogListing.objects.all(), query)
+        return CatalogListing.objects.none()
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -228,76 +398,119 @@ class SearchView(ListView):
         return context
 
 
+def search_api(request):
+    """JSON full-text search over the catalog, cursor paginated like the listings feed"""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'results': [], 'next': None, 'previous': None})
+    
+    cursor = request.GET.get(CURSOR_PARAM)
+    item_ids = search_item_ids(query)
+    if item_ids is None:
+        page = CursorPaginator(
+            search_listings(CatalogListing.objects.all(), query), LISTING_PAGE_SIZE,
+            DEFAULT_LISTING_ORDERING, LISTING_NULLABLE
+        ).get_page(cursor)
+    else:
+        page = IdListCursorPaginator(item_ids, LISTING_PAGE_SIZE, ('rank',)).get_page(cursor)
+        listings = CatalogListing.objects.in_bulk(page.object_list)
+        page.object_list = [listings[pk] for pk in page.object_list if pk in listings]
+    return JsonResponse({
+        'query': query,
+        'results': [listing_json(listing) for listing in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+
+def suggestion_url(suggestion):
+    if suggestion.kind == ITEM:
+        return reverse('catalog:item_detail', args=[suggestion.id])
+    if suggestion.kind == CATEGORY:
+        return reverse('catalog:category', args=[suggestion.detail])
+    return reverse('vendors:vendor_detail', args=[suggestion.id])
+
+
+def autocomplete_api(request):
+    """Search-as-you-type suggestions (items, categories, vendors) from the in-memory index"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', SUGGESTION_LIMIT)), 1), SUGGESTION_LIMIT)
+    except ValueError:
+        limit = SUGGESTION_LIMIT
+    
+    suggestions = autocomplete_index.get().complete(query, limit) if query else []
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'type': suggestion.kind,
+                'id': suggestion.id,
+                'label': suggestion.label,
+                'vendor': suggestion.detail if suggestion.kind == ITEM else None,
+                'url': suggestion_url(suggestion),
+            }
+            for suggestion in suggestions
+        ],
+    })
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
+    return haversine(lat1, lon1, lat2, lon2)
 
 
 class MapView(ListView):
     model = Item
     template_name = 'catalog/map_simple.html'
     context_object_name = 'nearby_items'
+    nearby_limit = 20
     
     def get_queryset(self):
-        user_lat = float(self.request.GET.get('lat', 0))
-        user_lng = float(self.request.GET.get('lng', 0))
+        # branch_id -> distance in km, filled from the spatial index
+        self.branch_distances = {}
+        try:
+            user_lat = float(self.request.GET.get('lat', 0))
+            user_lng = float(self.request.GET.get('lng', 0))
+        except ValueError:
+            return Item.objects.none()
         
-        if not user_lat or not user_lng:
+        if not user_lat or not user_lng or not valid_point(user_lat, user_lng):
             return Item.objects.none()
         
-        # Get all active items with their branches
-        items = Item.objects.filter(is_active=True).select_related('vendor', 'branch', 'category')
+        # Closest branches that together hold enough active items
+        open_within = open_filter_minutes(self.request.GET)
+        branch_ids = None
+        if open_within is not None:
+            branch_ids = open_branches(open_within).values_list('branch_id', flat=True)
+        nearest = branch_index.get().nearest_with_items(user_lat, user_lng, self.nearby_limit, branch_ids)
+        self.branch_distances = dict(nearest)
         
-        # Calculate distances and sort by proximity
-        items_with_distance = []
-        for item in items:
-            if item.branch and item.branch.latitude and item.branch.longitude:
-                distance = calculate_distance(
-                    user_lat, user_lng,
-                    float(item.branch.latitude), 
-                    float(item.branch.longitude)
-                )
-                items_with_distance.append((item, distance))
+        items = Item.objects.filter(
+            is_active=True,
+            branch_id__in=self.branch_distances
+        ).select_related('vendor', 'branch', 'category')
         
-        # Sort by distance and return closest 20 items
-        items_with_distance.sort(key=lambda x: x[1])
-        return [item for item, distance in items_with_distance[:20]]
+        # Sort by distance and return closest items
+        items = sorted(items, key=lambda item: (self.branch_distances[item.branch_id], item.pk))
+        return items[:self.nearby_limit]
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_lat = self.request.GET.get('lat')
-        user_lng = self.request.GET.get('lng')
-        
-        context['user_lat'] = user_lat
-        context['user_lng'] = user_lng
-        
-        # Prepare items with distances for the map
-        items_data = []
-        for item in context['nearby_items']:
-            if item.branch and item.branch.latitude and item.branch.longitude:
-                distance = calculate_distance(
-                    float(user_lat), float(user_lng),
-                    float(item.branch.latitude), 
-                    float(item.branch.longitude)
-                )
-                items_data.append({
-                    'item': item,
-                    'distance': round(distance, 2),
-                    'lat': float(item.branch.latitude),
-                    'lng': float(item.branch.longitude)
-                })
-        
-        context['items_data'] = items_data
+        context['user_lat'] = self.request.GET.get('lat')
+        context['user_lng'] = self.request.GET.get('lng')
+        
+        # Prepare items with distances for the map (already computed by the index)
+        context['items_data'] = [
+            {
+                'item': item,
+                'distance': round(self.branch_distances[item.branch_id], 2),
+                'lat': float(item.branch.latitude),
+                'lng': float(item.branch.longitude)
+            }
+            for item in context['nearby_items']
+        ]
         return context
 
 
@@ -321,7 +534,7 @@ def get_recommendations(request):
             'item', 
             'item__vendor', 
             'item__category'
-        ).prefetch_related('item__images')
+        )
         
         # Исключаем товары, которые уже в корзине
         cart_items = getattr(request, 'session', {}).get('cart', [])
@@ -354,11 +567,7 @@ def get_recommendations(request):
         recommendations_data = []
         for offer in unique_offers:
             item = offer.item
-            try:
-                primary_image = item.images.filter(is_primary=True).first()
-                image_url = primary_image.image.url if primary_image else ''
-            except:
-                image_url = ''
+            image_url = item.primary_image_url
             
             # Определяем тип бейджа
             badge_type = 'discount'
@@ -421,7 +630,7 @@ def get_quick_sets(request):
             'item', 
             'item__vendor', 
             'item__category'
-        ).prefetch_related('item__images')
+        )
         
         # Создаем быстрые наборы на основе категорий
         quick_sets = []
@@ -443,7 +652,7 @@ def get_quick_sets(request):
                     'current_price': float(offer.current_price),
                     'original_price': float(offer.original_price),
                     'discount_percent': int(offer.discount_percent),
-                    'image_url': offer.item.images.filter(is_primary=True).first().image.url if offer.item.images.filter(is_primary=True).first() else '/static/images/placeholder.jpg'
+                    'image_url': offer.item.primary_image_url or '/static/images/placeholder.jpg'
                 } for offer in dairy_items]
             })
         
@@ -464,7 +673,7 @@ def get_quick_sets(request):
                     'current_price': float(offer.current_price),
                     'original_price': float(offer.original_price),
                     'discount_percent': int(offer.discount_percent),
-                    'image_url': offer.item.images.filter(is_primary=True).first().image.url if offer.item.images.filter(is_primary=True).first() else '/static/images/placeholder.jpg'
+                    'image_url': offer.item.primary_image_url or '/static/images/placeholder.jpg'
                 } for offer in bakery_items]
             })
         
@@ -483,7 +692,7 @@ def get_quick_sets(request):
                     'current_price': float(offer.current_price),
                     'original_price': float(offer.original_price),
                     'discount_percent': int(offer.discount_percent),
-                    'image_url': offer.item.images.filter(is_primary=True).first().image.url if offer.item.images.filter(is_primary=True).first() else '/static/images/placeholder.jpg'
+                    'image_url': offer.item.primary_image_url or '/static/images/placeholder.jpg'
                 } for offer in popular_items]
             })
         
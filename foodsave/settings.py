@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'users',
     'vendors',
     'catalog',
+    'imaging',
     'booking',
     'orders',
     'notifications',
@@ -147,11 +148,32 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Фото товаров, боксов, логотипы и аватары: уменьшаются до 2048px, без EXIF,
+    # одинаковые загрузки хранятся одним файлом (imaging/storage.py)
+    'uploads': {
+        'BACKEND': 'imaging.storage.ContentAddressedStorage',
+        'OPTIONS': {'max_dimension': 2048},
+    },
+}
+
+# Memory-mapped catalog snapshots shared by all workers (catalog/snapshot.py),
+# `manage.py test` points it at a temporary directory (foodsave/test_runner.py)
+CATALOG_SNAPSHOT_DIR = BASE_DIR / 'var' / 'catalog_snapshot'
+
+# Кэш уменьшенных копий /media/r/<w>x<h>/... (imaging/resize.py), старые удаляются по LRU
+IMAGE_RESIZE_CACHE_DIR = BASE_DIR / 'var' / 'resized'
+IMAGE_RESIZE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+TEST_RUNNER = 'foodsave.test_runner.TestRunner'
+
 # Crispy Forms settings
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
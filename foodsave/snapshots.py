@@ -0,0 +1,44 @@
+"""
+Process-wide derived data (NumPy arrays, tries, indexes) built from the
+database on first use and rebuilt once stale. Used by the map, the catalog
+and the autocomplete alike.
+"""
+import threading
+import time
+
+# Signals only reach the current process; other workers pick up changes
+# (and bulk .update() calls that bypass signals) after this many seconds.
+SNAPSHOT_MAX_AGE = 300
+
+
+class LazySnapshot:
+    """Process-wide value rebuilt on first use after it was invalidated or got too old"""
+
+    def __init__(self, builder, max_age=SNAPSHOT_MAX_AGE):
+        self._builder = builder
+        self._max_age = max_age
+        self._value = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+        if value is not None and time.monotonic() - self._built_at < self._max_age:
+            return value
+        with self._lock:
+            value = self._value
+            if value is None or time.monotonic() - self._built_at >= self._max_age:
+                value = self._builder()
+                self._value = value
+                self._built_at = time.monotonic()
+            return value
+
+    def peek(self):
+        """The current value without building it, None if there is nothing fresh"""
+        value = self._value
+        if value is not None and time.monotonic() - self._built_at < self._max_age:
+            return value
+        return None
+
+    def invalidate(self):
+        self._value = None
@@ -0,0 +1,22 @@
+"""
+Test runner keeping the files tests publish out of the project tree.
+"""
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner with CATALOG_SNAPSHOT_DIR in a temporary directory removed afterwards"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._snapshot_dir = tempfile.TemporaryDirectory(prefix='foodsave-snapshot-')
+        self._saved_snapshot_dir = settings.CATALOG_SNAPSHOT_DIR
+        settings.CATALOG_SNAPSHOT_DIR = self._snapshot_dir.name
+
+    def teardown_test_environment(self, **kwargs):
+        settings.CATALOG_SNAPSHOT_DIR = self._saved_snapshot_dir
+        self._snapshot_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -13,6 +13,8 @@ urlpatterns = [
     path('catalog/', include('catalog.urls')),
     path('vendors/', include('vendors.urls')),
     path('orders/', include('booking.urls')),
+    # Resized copies are rendered by Django: the web server must pass /media/r/ through
+    path(f"{settings.MEDIA_URL.strip('/')}/r/", include('imaging.urls')),
 ]
 
 # Serve media files in development
@@ -0,0 +1,17 @@
+from django.contrib import admin
+
+from .models import ImageJob, StoredFile
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('name',)
+    readonly_fields = ('last_error',)
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'references', 'created_at')
+    search_fields = ('name',)
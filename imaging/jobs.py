@@ -0,0 +1,76 @@
+"""
+Background image work.
+
+Saving an upload only enqueues an ImageJob for the stored name; the
+image_worker command renders the variants and the placeholder in a pool of
+processes and writes the placeholder back to every row showing that file.
+Until then templates fall back to the original image without a placeholder.
+Normalizing and hashing the upload stays in the request: the stored name is
+the hash (imaging/storage.py).
+"""
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+
+from .placeholders import render_placeholder
+from .variants import generate_variants, variant_widths
+
+MAX_ATTEMPTS = 5
+# the first retry after 30 seconds, then 1, 2 and 4 minutes
+RETRY_DELAY = timedelta(seconds=30)
+# a job running longer than this belongs to a worker that died
+STALE_AFTER = timedelta(minutes=10)
+# errors retrying cannot fix
+PERMANENT_ERRORS = (FileNotFoundError, UnidentifiedImageError, Image.DecompressionBombError)
+
+# Uploads processed in the background: (app label, model) -> image field
+IMAGE_FIELDS = {
+    ('catalog', 'ItemImage'): 'image',
+    ('catalog', 'SurpriseBox'): 'image',
+    ('catalog', 'Category'): 'icon',
+    ('vendors', 'Vendor'): 'logo',
+}
+
+
+def image_fields():
+    """(model, image field, placeholder field or None) for every processed upload field"""
+    for (app_label, model_name), image_field in IMAGE_FIELDS.items():
+        model = apps.get_model(app_label, model_name)
+        placeholder_fields = {
+            source: target for target, source in getattr(model, 'placeholder_fields', {}).items()
+        }
+        yield model, image_field, placeholder_fields.get(image_field)
+
+
+def needs_processing(name, placeholder=None):
+    """`placeholder` is the stored value, None for models without one"""
+    # not cached: this decides whether the worker runs at all
+    return not variant_widths(name, cached=False) or placeholder == ''
+
+
+def retry_delay(attempts):
+    return RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def process_image(name):
+    """
+    Runs in a worker process, without the database: writes the variants of
+    `name` and returns its placeholder.
+    """
+    if not variant_widths(name, cached=False):
+        generate_variants(name)
+    with default_storage.open(name, 'rb') as fh:
+        return render_placeholder(fh)
+
+
+def apply_placeholder(name, placeholder):
+    """Store the placeholder on every row showing `name`, through save() so listings follow"""
+    for model, image_field, placeholder_field in image_fields():
+        if placeholder_field is None:
+            continue
+        rows = model._base_manager.filter(**{image_field: name}).exclude(**{placeholder_field: placeholder})
+        for row in rows:
+            setattr(row, placeholder_field, placeholder)
+            row.save(update_fields=[placeholder_field])
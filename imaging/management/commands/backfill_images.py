@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from imaging.jobs import image_fields, needs_processing
+from imaging.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь обработки загруженные изображения без вариантов или превью, в том числе старые фото после migrate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='everything', help='Все изображения, в том числе обработанные и с ошибками')
+
+    def handle(self, *args, everything=False, **options):
+        names = set()
+        for model, image_field, placeholder_field in image_fields():
+            rows = (
+                model._base_manager
+                .exclude(**{f'{image_field}__isnull': True})
+                .exclude(**{image_field: ''})
+            )
+            columns = [image_field, placeholder_field] if placeholder_field else [image_field]
+            for name, *placeholder in rows.values_list(*columns):
+                if everything or needs_processing(name, placeholder[0] if placeholder else None):
+                    names.add(name)
+
+        for name in sorted(names):
+            ImageJob.objects.enqueue(name, retry_failed=everything)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ В очереди {len(names)} изображений, запустите: python manage.py image_worker'
+        ))
@@ -0,0 +1,133 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import FileField
+from django.utils import timezone
+
+from imaging.models import StoredFile, delete_unreferenced
+from imaging.signals import STORED_FIELDS
+from imaging.storage import CONTENT_DIR, PIN_TIME, upload_storage
+from imaging.variants import delete_variants
+
+
+def legacy_rows(model, field):
+    """Rows whose file was uploaded before the content-addressed storage"""
+    return (
+        model._base_manager
+        .exclude(**{f'{field.attname}__isnull': True})
+        .exclude(**{field.attname: ''})
+        .exclude(**{f'{field.attname}__startswith': f'{CONTENT_DIR}/'})
+    )
+
+
+def referenced_names():
+    """Every file name any file field of any model points at"""
+    names = set()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, FileField):
+                names.update(model._base_manager.values_list(field.attname, flat=True))
+    return names
+
+
+def settled_content_files(storage):
+    """Files of the content-addressed storage older than PIN_TIME: their rows, if any, are saved"""
+    if not storage.exists(CONTENT_DIR):
+        return
+    settled = timezone.now() - timedelta(seconds=PIN_TIME)
+    for directory in storage.listdir(CONTENT_DIR)[0]:
+        # .locks holds the lock and pin files
+        if directory.startswith('.'):
+            continue
+        for filename in storage.listdir(posixpath.join(CONTENT_DIR, directory))[1]:
+            name = posixpath.join(CONTENT_DIR, directory, filename)
+            if storage.get_modified_time(name) < settled:
+                yield name
+
+
+class Command(BaseCommand):
+    help = 'Переносит загруженные изображения в контентное хранилище (без дублей и EXIF) и пересчитывает ссылки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не менять')
+
+    def handle(self, *args, dry_run=False, **options):
+        moved = {}  # old name -> content name, None for missing files
+        size_before = size_after = 0
+        for model, fields in STORED_FIELDS.items():
+            for field in fields:
+                for instance in list(legacy_rows(model, field)):
+                    old_name = getattr(instance, field.attname).name
+                    if old_name not in moved:
+                        moved[old_name] = self.store(field.storage, old_name, dry_run)
+                        if moved[old_name]:
+                            size_before += field.storage.size(old_name)
+                    if moved[old_name] and not dry_run:
+                        # a regular save: the signals count the reference and refresh listings
+                        setattr(instance, field.attname, moved[old_name])
+                        instance.save(update_fields=[field.name])
+
+        stored = {name for name in moved.values() if name}
+        if not dry_run:
+            size_after = sum(upload_storage().size(name) for name in stored)
+            self.delete_legacy(moved)
+            self.recount()
+
+        missing = sum(1 for name in moved.values() if name is None)
+        if missing:
+            self.stdout.write(self.style.WARNING(f'⚠️  Не найдено на диске: {missing} файлов'))
+        message = f'✅ {len(moved) - missing} файлов → {len(stored)} уникальных'
+        if not dry_run:
+            message += f', {size_before / 2**20:.1f} МБ → {size_after / 2**20:.1f} МБ'
+        self.stdout.write(self.style.SUCCESS(message))
+
+    def store(self, storage, name, dry_run):
+        if not storage.exists(name):
+            self.stdout.write(self.style.WARNING(f'⚠️  {name}: файл не найден'))
+            return None
+        with storage.open(name) as fh:
+            if dry_run:
+                return storage.prepare(name, fh)[0]
+            return storage.save(name, fh)
+
+    def delete_legacy(self, moved):
+        """Old files nobody points at any more, with their variants"""
+        still_used = referenced_names()
+        storage = upload_storage()
+        for old_name, new_name in moved.items():
+            if new_name and old_name not in still_used:
+                storage.delete(old_name)
+                delete_variants(old_name)
+
+    def recount(self):
+        """
+        Set every StoredFile counter to the actual number of rows, dropping
+        unused files, also those a pin kept for a row that was never saved
+        """
+        counts = Counter()
+        for model, fields in STORED_FIELDS.items():
+            for field in fields:
+                counts.update(
+                    model._base_manager
+                    .filter(**{f'{field.attname}__startswith': f'{CONTENT_DIR}/'})
+                    .values_list(field.attname, flat=True)
+                )
+        with transaction.atomic():
+            existing = {stored.name: stored for stored in StoredFile.objects.all()}
+            unused = [name for name in existing if name not in counts]
+            StoredFile.objects.filter(name__in=unused).delete()
+            created = []
+            for name, references in counts.items():
+                stored = existing.get(name)
+                if stored is None:
+                    created.append(StoredFile(name=name, references=references))
+                elif stored.references != references:
+                    StoredFile.objects.filter(pk=stored.pk).update(references=references)
+            StoredFile.objects.bulk_create(created)
+        storage = upload_storage()
+        for name in {*unused, *(name for name in settled_content_files(storage) if name not in counts)}:
+            delete_unreferenced(name, storage)
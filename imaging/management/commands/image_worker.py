@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+
+from imaging.jobs import MAX_ATTEMPTS, PERMANENT_ERRORS, STALE_AFTER, apply_placeholder, process_image, retry_delay
+from imaging.models import ImageJob
+
+# Jobs of a worker that died are picked up again by the live ones this often
+REQUEUE_EVERY = 60
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь изображений (варианты и превью) в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов Pillow (по умолчанию - все ядра)')
+        parser.add_argument('--poll', type=float, default=2.0, help='Пауза при пустой очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Выйти, когда очередь опустеет')
+
+    def handle(self, *args, processes, poll, once, **options):
+        """
+        Держите запущенным рядом с веб-сервером (systemd/supervisor). Процессы
+        стартуют через spawn: они не наследуют соединения с базой и работают
+        только с файлами, в базу пишет этот процесс.
+        """
+        self.requeue_stale()
+        self.stdout.write(f'🖼  Обработка изображений: {processes} процессов')
+
+        while True:
+            # a crashed process breaks the whole pool: start a new one
+            pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+            with pool:
+                finished = self.run(pool, processes, poll, once)
+            if finished:
+                return
+
+    def run(self, pool, processes, poll, once):
+        """Feed the pool until the queue is empty (with --once) or the pool breaks"""
+        running = {}
+        requeued_at = time.monotonic()
+        while True:
+            if time.monotonic() - requeued_at >= REQUEUE_EVERY:
+                self.requeue_stale()
+                requeued_at = time.monotonic()
+
+            # keep every process busy with one job queued behind it
+            for job in ImageJob.objects.claim(processes * 2 - len(running)):
+                running[pool.submit(process_image, job.name)] = job
+
+            if not running:
+                if once:
+                    return True
+                time.sleep(poll)
+                continue
+
+            done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+            broken = None
+            for future in done:
+                job = running.pop(future)
+                try:
+                    placeholder = future.result()
+                except BrokenProcessPool as exc:
+                    broken = exc
+                    self.failed(job, exc)
+                except Exception as exc:
+                    self.failed(job, exc)
+                else:
+                    apply_placeholder(job.name, placeholder)
+                    job.finish()
+                    self.stdout.write(f'✅ {job.name}')
+            if broken:
+                # the other jobs of the pool are lost too and count as attempts
+                for job in running.values():
+                    self.failed(job, broken)
+                return False
+
+    def requeue_stale(self):
+        requeued = ImageJob.objects.requeue_stale(STALE_AFTER, MAX_ATTEMPTS)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'⚠️  Возвращено в очередь зависших задач: {requeued}'))
+
+    def failed(self, job, exc):
+        error = f'{type(exc).__name__}: {exc}'
+        if isinstance(exc, PERMANENT_ERRORS) or job.attempts >= MAX_ATTEMPTS:
+            job.fail(error)
+            self.stdout.write(self.style.ERROR(f'❌ {job.name}: {error}'))
+        else:
+            job.fail(error, retry_delay(job.attempts))
+            self.stdout.write(self.style.WARNING(f'⚠️  {job.name}: {error}, попытка {job.attempts} из {MAX_ATTEMPTS}'))
@@ -0,0 +1,128 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .variants import delete_variants
+
+
+class StoredFileQuerySet(models.QuerySet):
+    def acquire(self, name, count=1):
+        """`count` more rows point at the file `name`"""
+        if self.filter(name=name).update(references=F('references') + count):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, references=count)
+        except IntegrityError:
+            # created by a concurrent upload of the same content
+            self.filter(name=name).update(references=F('references') + count)
+
+    def release(self, name, storage):
+        """One row less points at `name`; the last release deletes the file once committed"""
+        with transaction.atomic():
+            self.filter(name=name, references__gt=0).update(references=F('references') - 1)
+            deleted, _ = self.filter(name=name, references=0).delete()
+        if deleted:
+            transaction.on_commit(lambda: delete_unreferenced(name, storage))
+
+
+class StoredFile(models.Model):
+    """A content-addressed upload (imaging/storage.py) and how many model fields use it"""
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StoredFileQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+
+def delete_unreferenced(name, storage):
+    with storage.lock(name):
+        # the same content may have been uploaded again since the release
+        if StoredFile.objects.filter(name=name).exists() or storage.is_pinned(name):
+            return
+        storage.delete(name)
+    delete_variants(name)
+
+
+class ImageJobQuerySet(models.QuerySet):
+    def enqueue(self, name, retry_failed=False):
+        """
+        Process `name` (again). A running job runs once more for the rows saved
+        meanwhile; failed ones only with `retry_failed`: the same name is the
+        same bytes failing the same way.
+        """
+        statuses = [ImageJob.DONE, ImageJob.RUNNING]
+        if retry_failed:
+            statuses.append(ImageJob.FAILED)
+        if self.filter(name=name, status__in=statuses).update(
+            status=ImageJob.PENDING, attempts=0, run_after=timezone.now(), last_error='',
+        ):
+            return
+        self.get_or_create(name=name)
+
+    def claim(self, limit):
+        """Mark up to `limit` due jobs as running for this worker and return them"""
+        claimed = []
+        due = self.filter(status=ImageJob.PENDING, run_after__lte=timezone.now()).order_by('run_after', 'pk')
+        for job in due[:limit]:
+            # another worker may have claimed it since the select
+            if self.filter(pk=job.pk, status=ImageJob.PENDING).update(
+                status=ImageJob.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1,
+            ):
+                job.attempts += 1
+                claimed.append(job)
+        return claimed
+
+    def requeue_stale(self, older_than, max_attempts):
+        """
+        Jobs left running by a worker that died. Those out of attempts fail
+        instead: an image killing the worker would kill the next one too.
+        """
+        stale = self.filter(status=ImageJob.RUNNING, started_at__lt=timezone.now() - older_than)
+        stale.filter(attempts__gte=max_attempts).update(status=ImageJob.FAILED, last_error='Worker died')
+        return stale.update(status=ImageJob.PENDING, run_after=timezone.now())
+
+
+class ImageJob(models.Model):
+    """Variants and placeholder of a stored image, rendered by the image_worker command"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageJobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+    def finish(self):
+        # a job enqueued again while running stays pending
+        ImageJob.objects.filter(pk=self.pk, status=ImageJob.RUNNING).update(status=ImageJob.DONE, last_error='')
+
+    def fail(self, error, retry_in=None):
+        """Back to the queue after `retry_in`, or failed for good without it"""
+        if retry_in is None:
+            changes = {'status': ImageJob.FAILED}
+        else:
+            changes = {'status': ImageJob.PENDING, 'run_after': timezone.now() + retry_in}
+        ImageJob.objects.filter(pk=self.pk, status=ImageJob.RUNNING).update(last_error=error, **changes)
@@ -0,0 +1,54 @@
+"""
+Inline placeholders shown while the real image lazy-loads.
+
+A placeholder is a PLACEHOLDER_SIZE px WebP of the whole picture as a data URI,
+about 200 bytes. Templates put it in the <img> background: the browser scales
+it up smoothly, so first paint shows the colours of the photo with no image
+request, and the loaded image simply covers it.
+"""
+import base64
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+# Field length, a placeholder that does not fit is dropped
+PLACEHOLDER_MAX_LENGTH = 500
+
+
+def render_placeholder(fh):
+    """data: URI of a tiny preview of the image in `fh`"""
+    image = Image.open(fh)
+    image.draft('RGB', (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    data_uri = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    return data_uri if len(data_uri) <= PLACEHOLDER_MAX_LENGTH else ''
+
+
+class PlaceholderMixin:
+    """
+    Model mixin clearing stored placeholders when a new image is uploaded;
+    the image worker (imaging/jobs.py) renders the new one. `placeholder_fields`
+    maps each placeholder field to the image field it is computed from.
+    """
+    placeholder_fields = {}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        for placeholder_field, image_field in self.placeholder_fields.items():
+            if update_fields is not None and image_field not in update_fields:
+                continue
+            image = getattr(self, image_field)
+            if image and image._committed:
+                continue
+            setattr(self, placeholder_field, '')
+            if update_fields is not None:
+                update_fields = {*update_fields, placeholder_field}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
@@ -0,0 +1,200 @@
+"""
+Resized copies of uploads rendered on first request.
+
+Avatars, logos and icons are shown at too many sizes to pre-generate them
+like the card variants (imaging/variants.py). A template asks for a size with
+resized_url(), which signs "<w>x<h>/<path>", so clients cannot make the server
+render sizes nobody uses. The first request renders the copy into a disk
+cache under IMAGE_RESIZE_CACHE_DIR; later requests open it straight from
+disk. The cache is kept under IMAGE_RESIZE_CACHE_MAX_BYTES by deleting the
+least recently used files, the file mtime serving as the last use.
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from PIL import Image, ImageOps
+
+from .variants import VARIANT_FORMATS, encode, load_image
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single dev server process, the thread locks are enough
+    fcntl = None
+
+MAX_SIZE = 2048
+# A hit refreshes the mtime at most this often: a stat per request, not a write
+TOUCH_INTERVAL = 600
+# Eviction frees space down to this share of the limit, not one file per render
+EVICT_TO = 0.9
+# Every process rescans the total now and then to see the other workers' renders
+RESCAN_EVERY = 100
+LOCK_STRIPES = 64
+
+_signer = signing.Signer(salt='imaging.resize')
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_size_lock = threading.Lock()
+_cache_bytes = None
+_renders_since_scan = 0
+
+
+def _key(name, width, height):
+    return f'{width}x{height}/{name}'
+
+
+def signature(name, width, height):
+    return _signer.signature(_key(name, width, height))
+
+
+def valid_signature(name, width, height, value):
+    return constant_time_compare(value, signature(name, width, height))
+
+
+def resized_url(name, width, height=0):
+    """Signed URL of `name` cropped to width x height, a 0 side follows the aspect ratio"""
+    url = reverse('imaging:resized', kwargs={'width': width, 'height': height, 'name': name})
+    return f'{url}?s={signature(name, width, height)}'
+
+
+def cache_dir():
+    return str(settings.IMAGE_RESIZE_CACHE_DIR)
+
+
+def cache_path(name, width, height, ext):
+    digest = hashlib.sha1(_key(name, width, height).encode()).hexdigest()
+    return os.path.join(cache_dir(), digest[:2], f'{digest}.{ext}')
+
+
+def resize(image, width, height):
+    """Cover-crop to width x height, or scale by the non-zero side; never upscales"""
+    if width and height:
+        scale = min(1, image.width / width, image.height / height)
+        return ImageOps.fit(image, (max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    image.thumbnail((width or MAX_SIZE, height or MAX_SIZE), Image.LANCZOS)
+    return image
+
+
+def render(name, width, height, ext):
+    with default_storage.open(name, 'rb') as fh:
+        image = load_image(fh)
+    image_format, options = VARIANT_FORMATS[ext]
+    return encode(resize(image, width, height), image_format, options)
+
+
+@contextmanager
+def _file_lock(name, blocking=True):
+    """Exclusive lock shared by all processes, yields False if not blocking and taken"""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.join(cache_dir(), 'locks'), exist_ok=True)
+    with open(os.path.join(cache_dir(), 'locks', name), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+@contextmanager
+def single_flight(path):
+    """Only one thread of one process renders a given copy, the others wait for it"""
+    stripe = int(os.path.basename(path)[:4], 16) % LOCK_STRIPES
+    with _thread_locks[stripe], _file_lock(f'{stripe}.lock'):
+        yield
+
+
+def open_cached(path):
+    fh = open(path, 'rb')
+    if time.time() - os.fstat(fh.fileno()).st_mtime > TOUCH_INTERVAL:
+        os.utime(path)
+    return fh
+
+
+def open_resized(name, width, height, ext):
+    """Open file of the resized copy, rendered first unless cached"""
+    path = cache_path(name, width, height, ext)
+    try:
+        return open_cached(path)
+    except FileNotFoundError:
+        pass
+    with single_flight(path):
+        try:
+            # rendered by whoever held the lock before us
+            return open_cached(path)
+        except FileNotFoundError:
+            pass
+        data = render(name, width, height, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as out:
+                out.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            # disk full and the like: no half-written copy left behind
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        fh = open(path, 'rb')
+    account(len(data))
+    return fh
+
+
+def cached_files():
+    """(mtime, size, path) of every cached copy"""
+    files = []
+    for entry in os.scandir(cache_dir()):
+        if not entry.is_dir() or entry.name == 'locks':
+            continue
+        for file_entry in os.scandir(entry.path):
+            if file_entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = file_entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file_entry.path))
+    return files
+
+
+def account(added):
+    """Count a new copy, evicting old ones when the cache grew past the limit"""
+    global _cache_bytes, _renders_since_scan
+    with _size_lock:
+        _renders_since_scan += 1
+        if _cache_bytes is None or _renders_since_scan >= RESCAN_EVERY:
+            _cache_bytes = sum(size for _, size, _ in cached_files())
+            _renders_since_scan = 0
+        else:
+            _cache_bytes += added
+        if _cache_bytes > settings.IMAGE_RESIZE_CACHE_MAX_BYTES:
+            _cache_bytes = evict()
+
+
+def evict():
+    """Delete least recently used copies down to EVICT_TO of the limit, returns the cache size"""
+    with _file_lock('evict.lock', blocking=False) as locked:
+        files = cached_files()
+        total = sum(size for _, size, _ in files)
+        if not locked:
+            # another process is evicting right now
+            return total
+        target = settings.IMAGE_RESIZE_CACHE_MAX_BYTES * EVICT_TO
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
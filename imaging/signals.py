@@ -0,0 +1,78 @@
+from django.apps import apps
+from django.db.models import FileField
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .jobs import image_fields, needs_processing
+from .models import ImageJob, StoredFile
+from .storage import ContentAddressedStorage, is_content_name
+
+
+def enqueue_image_job(sender, instance, **kwargs):
+    """New uploads and rows missing a placeholder go to the image worker"""
+    for image_field, placeholder_field in IMAGE_JOB_FIELDS[sender]:
+        name = getattr(instance, image_field).name
+        placeholder = getattr(instance, placeholder_field) if placeholder_field else None
+        if name and needs_processing(name, placeholder):
+            ImageJob.objects.enqueue(name)
+
+
+# model -> [(image field, placeholder field or None)]
+IMAGE_JOB_FIELDS = {}
+for model, image_field, placeholder_field in image_fields():
+    IMAGE_JOB_FIELDS.setdefault(model, []).append((image_field, placeholder_field))
+    post_save.connect(enqueue_image_job, sender=model, dispatch_uid=f'imaging_jobs_{model._meta.label_lower}')
+
+
+def content_fields(model):
+    """File fields of `model` stored in the content-addressed storage"""
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+# model -> its content-addressed fields, the ones whose files are reference-counted
+STORED_FIELDS = {model: fields for model in apps.get_models() if (fields := content_fields(model))}
+
+
+def _saved_fields(sender, update_fields):
+    fields = STORED_FIELDS[sender]
+    if update_fields is not None:
+        fields = [field for field in fields if field.name in update_fields]
+    return fields
+
+
+def remember_stored_names(sender, instance, update_fields=None, **kwargs):
+    """The file names before the save, to know which references change"""
+    fields = _saved_fields(sender, update_fields)
+    previous = {}
+    if fields and not instance._state.adding:
+        previous = sender._base_manager.filter(pk=instance.pk).values(*(field.attname for field in fields)).first()
+    instance._stored_names = previous or {}
+
+
+def count_stored_references(sender, instance, update_fields=None, **kwargs):
+    previous = instance.__dict__.pop('_stored_names', {})
+    for field in _saved_fields(sender, update_fields):
+        name = getattr(instance, field.attname).name or ''
+        old_name = previous.get(field.attname) or ''
+        if name == old_name:
+            continue
+        if is_content_name(name):
+            StoredFile.objects.acquire(name)
+        if is_content_name(old_name):
+            StoredFile.objects.release(old_name, field.storage)
+
+
+def release_stored_files(sender, instance, **kwargs):
+    for field in STORED_FIELDS[sender]:
+        name = getattr(instance, field.attname).name
+        if is_content_name(name):
+            StoredFile.objects.release(name, field.storage)
+
+
+for model in STORED_FIELDS:
+    uid = f'imaging_refcount_{model._meta.label_lower}'
+    pre_save.connect(remember_stored_names, sender=model, dispatch_uid=uid)
+    post_save.connect(count_stored_references, sender=model, dispatch_uid=uid)
+    post_delete.connect(release_stored_files, sender=model, dispatch_uid=uid)
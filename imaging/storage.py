@@ -0,0 +1,107 @@
+"""
+Content-addressed storage for user uploads.
+
+An upload is normalized (imaging.ingest) and saved as
+uploads/<first two hex digits>/<sha256 of the normalized bytes>.<ext>, e.g.
+uploads/3f/3fa9...e1.webp, so the same picture uploaded ten times is one file
+on disk, whatever it was called. Because files are shared, they are never
+deleted through the field: the StoredFile reference counts (imaging.models)
+decide when the last row using a file is gone.
+
+The row referencing a file is saved after the file, so a save that finds the
+content already on disk pins it, and saving and deleting a name take the same
+lock: a file is never deleted between the save that reuses it and the row
+that takes the reference.
+"""
+import hashlib
+import os
+import posixpath
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, storages
+
+from .ingest import MAX_DIMENSION, normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single dev server process, the thread locks are enough
+    fcntl = None
+
+CONTENT_DIR = 'uploads'
+# Lock and pin files, inside the storage so every process sees the same ones
+LOCK_DIR = posixpath.join(CONTENT_DIR, '.locks')
+LOCK_STRIPES = 64
+# A reused file is kept this long even with no references: the row taking one
+# may still be in a transaction the deleting process can't see
+PIN_TIME = 60 * 60
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def content_name(digest, extension):
+    return posixpath.join(CONTENT_DIR, digest[:2], f'{digest}{extension}')
+
+
+def is_content_name(name):
+    return bool(name) and name.startswith(CONTENT_DIR + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, max_dimension=MAX_DIMENSION, **kwargs):
+        super().__init__(**kwargs)
+        self.max_dimension = max_dimension
+
+    def prepare(self, name, content):
+        """(content name, normalized bytes) for an upload called `name`"""
+        data, extension = normalize(b''.join(content.chunks()), self.max_dimension)
+        if extension is None:
+            extension = posixpath.splitext(name)[1].lower()
+        return content_name(hashlib.sha256(data).hexdigest(), extension), data
+
+    def _pin_path(self, name):
+        return self.path(posixpath.join(LOCK_DIR, f'{posixpath.basename(name)}.pin'))
+
+    @contextmanager
+    def lock(self, name):
+        """Exclusive across threads and processes: saving and deleting `name` never interleave"""
+        stripe = int(posixpath.basename(name)[:4], 16) % LOCK_STRIPES
+        with _thread_locks[stripe]:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.path(LOCK_DIR), exist_ok=True)
+            with open(self.path(posixpath.join(LOCK_DIR, f'{stripe}.lock')), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                yield
+
+    def is_pinned(self, name):
+        """Reused by a save in the last PIN_TIME seconds, call under lock()"""
+        try:
+            return time.time() - os.stat(self._pin_path(name)).st_mtime < PIN_TIME
+        except FileNotFoundError:
+            return False
+
+    def _save(self, name, content):
+        name, data = self.prepare(name, content)
+        with self.lock(name):
+            if not self.exists(name):
+                return super()._save(name, ContentFile(data))
+            # the last reference may be going away right now, keep the file for our row
+            with open(self._pin_path(name), 'a'):
+                os.utime(self._pin_path(name))
+            return name
+
+    def delete(self, name):
+        super().delete(name)
+        try:
+            os.remove(self._pin_path(name))
+        except FileNotFoundError:
+            pass
+
+
+def upload_storage():
+    """Storage of the upload fields, callable so migrations don't freeze the backend"""
+    return storages['uploads']
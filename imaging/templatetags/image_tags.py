@@ -0,0 +1,97 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from ..resize import resized_url as signed_resized_url
+from ..variants import VARIANT_FORMATS, variant_name, variant_widths
+
+register = template.Library()
+
+# Cards are at most about a third of the viewport wide
+DEFAULT_SIZES = '(max-width: 576px) 100vw, (max-width: 992px) 50vw, 33vw'
+# Width of the plain src for browsers without srcset support
+FALLBACK_WIDTH = 640
+
+
+def _name(image):
+    """Storage path of a FieldFile or a stored path string"""
+    return getattr(image, 'name', image) or ''
+
+
+def _img_attrs(attrs, placeholder=''):
+    """Lazy-loading <img> attributes, the inline placeholder as background until the image loads"""
+    attrs = {'loading': 'lazy', 'decoding': 'async', **attrs}
+    if placeholder:
+        background = f'background: url({placeholder}) center / cover no-repeat'
+        attrs['style'] = f"{attrs['style'].rstrip('; ')}; {background}" if attrs.get('style') else background
+        # transparent logos would show the blur through
+        attrs['onload'] = "this.style.backgroundImage='none'"
+    return flatatt(attrs)
+
+
+@register.simple_tag
+def srcset(image, ext='webp'):
+    """'url 160w, url 320w, ...' for the variants of `image`, empty without variants"""
+    name = _name(image)
+    return ', '.join(
+        f'{default_storage.url(variant_name(name, width, ext))} {width}w'
+        for width in variant_widths(name)
+    )
+
+
+@register.simple_tag
+def responsive_image(image, sizes=DEFAULT_SIZES, placeholder='', **attrs):
+    """
+    <picture> with a WebP and a JPEG srcset of the image variants, or a
+    plain lazy <img> of the original while it has none. `placeholder` is a
+    stored data: URI painted until the image arrives (imaging/placeholders.py).
+    {% responsive_image item.primary_image placeholder=item.primary_placeholder alt=item.title %}
+    """
+    name = _name(image)
+    attrs = _img_attrs(attrs, placeholder)
+    widths = variant_widths(name)
+    if not widths:
+        return format_html('<img src="{}"{}>', default_storage.url(name), attrs)
+
+    # the preferred formats as <source>s, the last one (JPEG) as the <img> itself
+    *preferred, fallback_ext = VARIANT_FORMATS
+    fallback_width = next((width for width in widths if width >= FALLBACK_WIDTH), widths[-1])
+    sources = mark_safe(''.join(
+        format_html('<source type="image/{}" srcset="{}" sizes="{}">', ext, srcset(name, ext), sizes)
+        for ext in preferred
+    ))
+    return format_html(
+        # display: contents keeps <picture> out of the layout, CSS still sees a plain <img>
+        '<picture style="display: contents">{}<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        sources,
+        default_storage.url(variant_name(name, fallback_width, fallback_ext)),
+        srcset(name, fallback_ext),
+        sizes,
+        attrs,
+    )
+
+
+@register.simple_tag
+def resized_url(image, width, height=0):
+    """Signed /media/r/ URL of `image` at width x height"""
+    return signed_resized_url(_name(image), width, height)
+
+
+@register.simple_tag
+def resized_image(image, width, height, **attrs):
+    """
+    <img> cropped to width x height CSS pixels with a 2x copy for dense screens,
+    for avatars, logos and icons shown at fixed sizes.
+    {% resized_image vendor.logo 40 40 class="rounded-circle" %}
+    """
+    name = _name(image)
+    return format_html(
+        '<img src="{}" srcset="{} 2x" width="{}" height="{}"{}>',
+        signed_resized_url(name, width, height),
+        signed_resized_url(name, width * 2, height * 2),
+        width,
+        height,
+        _img_attrs(attrs),
+    )
@@ -0,0 +1,223 @@
+import shutil
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from .jobs import MAX_ATTEMPTS, RETRY_DELAY, STALE_AFTER, retry_delay
+from .management.commands.image_worker import Command as ImageWorker
+from .models import ImageJob, StoredFile
+from .resize import resized_url
+from .storage import ContentAddressedStorage
+from . import variants
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+class StoredFileTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = ContentAddressedStorage(location=media)
+
+    def release(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            StoredFile.objects.release(name, self.storage)
+
+    def test_same_content_is_one_file(self):
+        name = self.storage.save('a.png', png('red'))
+        self.assertRegex(name, r'^uploads/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$')
+        self.assertEqual(self.storage.save('b.png', png('red')), name)
+        self.assertNotEqual(self.storage.save('c.png', png('blue')), name)
+
+    def test_last_release_deletes_the_file(self):
+        name = self.storage.save('a.png', png('red'))
+        StoredFile.objects.acquire(name)
+        StoredFile.objects.acquire(name)
+        self.release(name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(self.storage.exists(name))
+        self.release(name)
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(self.storage.exists(name))
+
+    def test_release_of_unknown_name_is_harmless(self):
+        self.release('uploads/00/00.png')
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_reused_file_survives_the_last_release(self):
+        name = self.storage.save('a.png', png('red'))
+        StoredFile.objects.acquire(name)
+        # a second upload of the same picture, its row not saved yet
+        self.assertEqual(self.storage.save('b.png', png('red')), name)
+        self.release(name)
+        self.assertTrue(self.storage.exists(name))
+        StoredFile.objects.acquire(name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+
+class VariantWidthsTests(SimpleTestCase):
+    def setUp(self):
+        self.storage = mock.Mock()
+        self.addCleanup(variants.forget, 'uploads/ab/ab.png')
+
+    def widths(self, now):
+        with mock.patch.object(variants.time, 'monotonic', return_value=now):
+            return variants.variant_widths('uploads/ab/ab.png', self.storage)
+
+    def test_missing_variants_are_cached_briefly(self):
+        self.storage.listdir.side_effect = FileNotFoundError
+        self.assertEqual(self.widths(1000.0), ())
+        self.assertEqual(self.widths(1000.0 + variants.MISSING_WIDTHS_TTL - 1), ())
+        self.assertEqual(self.storage.listdir.call_count, 1)
+
+        self.storage.listdir.side_effect = None
+        self.storage.listdir.return_value = ([], ['160.webp', '160.jpg', '320.webp'])
+        self.assertEqual(self.widths(1000.0 + variants.MISSING_WIDTHS_TTL), (160,))
+        self.assertEqual(self.widths(1000.0 + variants.WIDTHS_TTL), (160,))
+        self.assertEqual(self.storage.listdir.call_count, 2)
+
+
+class ResizedImageTests(SimpleTestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media, IMAGE_RESIZE_CACHE_DIR=f'{media}/resized')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_truncated_source_is_not_found(self):
+        buffer = BytesIO()
+        Image.effect_noise((256, 256), 64).convert('RGB').save(buffer, 'JPEG')
+        # the header is intact, decoding fails half way
+        data = buffer.getvalue()[:buffer.tell() // 2]
+        name = default_storage.save('avatars/broken.jpg', ContentFile(data))
+        # twice: the first failure must not keep the render lock
+        for _ in range(2):
+            self.assertEqual(self.client.get(resized_url(name, 32, 32)).status_code, 404)
+
+    def test_resized_copy(self):
+        name = default_storage.save('avatars/ok.png', png('red'))
+        response = self.client.get(resized_url(name, 4, 4), HTTP_ACCEPT='image/webp')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+
+class CrashingPool:
+    """Stands in for a ProcessPoolExecutor whose first job kills the pool, the rest never finish"""
+
+    crashed = False
+
+    def submit(self, fn, *args):
+        future = Future()
+        if not self.crashed:
+            self.crashed = True
+            future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        return future
+
+
+class ImageJobTests(TestCase):
+    def setUp(self):
+        self.worker = ImageWorker(stdout=StringIO())
+
+    def job(self, name='uploads/a.png'):
+        ImageJob.objects.enqueue(name)
+        return ImageJob.objects.get(name=name)
+
+    def make_due(self):
+        ImageJob.objects.update(run_after=timezone.now())
+
+    def test_claim_takes_due_jobs_once(self):
+        first, second = self.job('uploads/a.png'), self.job('uploads/b.png')
+        ImageJob.objects.filter(pk=second.pk).update(run_after=timezone.now() + timedelta(minutes=1))
+        claimed = ImageJob.objects.claim(10)
+        self.assertEqual(claimed, [first])
+        self.assertEqual(claimed[0].attempts, 1)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (ImageJob.RUNNING, 1))
+        self.assertIsNotNone(first.started_at)
+        self.assertEqual(ImageJob.objects.claim(10), [])
+
+    def test_failure_backs_off_exponentially(self):
+        self.assertEqual(
+            [retry_delay(attempts) for attempts in range(1, 5)],
+            [RETRY_DELAY, RETRY_DELAY * 2, RETRY_DELAY * 4, RETRY_DELAY * 8],
+        )
+        self.job()
+        for attempts in (1, 2):
+            [job] = ImageJob.objects.claim(1)
+            before = timezone.now()
+            self.worker.failed(job, OSError('disk full'))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (ImageJob.PENDING, attempts))
+            self.assertEqual(job.last_error, 'OSError: disk full')
+            self.assertGreaterEqual(job.run_after, before + retry_delay(attempts))
+            # not due until the delay has passed
+            self.assertEqual(ImageJob.objects.claim(1), [])
+            self.make_due()
+
+    def test_gives_up_at_max_attempts(self):
+        self.job()
+        for _ in range(MAX_ATTEMPTS):
+            [job] = ImageJob.objects.claim(1)
+            self.worker.failed(job, OSError('disk full'))
+            self.make_due()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, MAX_ATTEMPTS))
+        self.assertEqual(ImageJob.objects.claim(1), [])
+        # only an upload of new bytes or an explicit retry runs it again
+        ImageJob.objects.enqueue(job.name)
+        self.assertEqual(ImageJob.objects.claim(1), [])
+        ImageJob.objects.enqueue(job.name, retry_failed=True)
+        self.assertEqual(ImageJob.objects.claim(1)[0].attempts, 1)
+
+    def test_permanent_error_fails_at_once(self):
+        self.job()
+        [job] = ImageJob.objects.claim(1)
+        self.worker.failed(job, FileNotFoundError('uploads/a.png'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.FAILED, 1))
+
+    def test_pool_crash_counts_an_attempt_for_every_lost_job(self):
+        jobs = [self.job('uploads/a.png'), self.job('uploads/b.png')]
+        for attempts in range(1, MAX_ATTEMPTS + 1):
+            # two jobs in flight for one process, both lost with the pool
+            self.assertFalse(self.worker.run(CrashingPool(), processes=1, poll=0.01, once=True))
+            for job in jobs:
+                job.refresh_from_db()
+                self.assertEqual(job.attempts, attempts)
+                self.assertIn('BrokenProcessPool', job.last_error)
+            self.make_due()
+        self.assertEqual({job.status for job in jobs}, {ImageJob.FAILED})
+        self.assertTrue(self.worker.run(CrashingPool(), processes=1, poll=0.01, once=True))
+
+    def test_requeue_stale(self):
+        stale, fresh, spent = self.job('uploads/a.png'), self.job('uploads/b.png'), self.job('uploads/c.png')
+        ImageJob.objects.claim(3)
+        long_ago = timezone.now() - STALE_AFTER - timedelta(minutes=1)
+        ImageJob.objects.filter(pk__in=[stale.pk, spent.pk]).update(started_at=long_ago)
+        ImageJob.objects.filter(pk=spent.pk).update(attempts=MAX_ATTEMPTS)
+
+        self.assertEqual(ImageJob.objects.requeue_stale(STALE_AFTER, MAX_ATTEMPTS), 1)
+        for job in (stale, fresh, spent):
+            job.refresh_from_db()
+        self.assertEqual((stale.status, stale.attempts), (ImageJob.PENDING, 1))
+        self.assertEqual(fresh.status, ImageJob.RUNNING)
+        # a worker died on it every time
+        self.assertEqual(spent.status, ImageJob.FAILED)
+        self.assertEqual([job.pk for job in ImageJob.objects.claim(3)], [stale.pk])
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'imaging'
+
+urlpatterns = [
+    path('<int:width>x<int:height>/<path:name>', views.resized_image, name='resized'),
+]
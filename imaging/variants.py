@@ -0,0 +1,135 @@
+"""
+Fixed-width variants of uploaded images.
+
+Every upload is re-encoded at the widths of VARIANT_WIDTHS that are smaller
+than the original, plus the original width itself when it is below the
+largest one, never upscaled. Each width is written as WebP and as a JPEG
+fallback under variants/<original path without extension>/<width>.<ext>. The
+file names are the whole manifest: variant_widths() lists the directory, so
+the srcset template tag needs no database fields. Each process caches the
+listings for a while, the worker's writes and deletes reach it on expiry.
+"""
+import posixpath
+import threading
+import time
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'variants'
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+
+# extension -> (Pillow format, save options), the first one is preferred by browsers
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# How long a process trusts a listing: images without variants get them from
+# the worker within seconds, deleted ones only go away with their last row
+MISSING_WIDTHS_TTL = 30
+WIDTHS_TTL = 600
+
+# image path -> (available widths, monotonic expiry)
+_widths_cache = {}
+_cache_lock = threading.Lock()
+
+
+def variant_dir(name):
+    return posixpath.join(VARIANTS_DIR, posixpath.splitext(name)[0])
+
+
+def variant_name(name, width, ext):
+    return posixpath.join(variant_dir(name), f'{width}.{ext}')
+
+
+def target_widths(original_width):
+    """Widths to generate for an image `original_width` pixels wide"""
+    widths = [width for width in VARIANT_WIDTHS if width < original_width]
+    if original_width <= VARIANT_WIDTHS[-1]:
+        widths.append(original_width)
+    return widths
+
+
+def load_image(fh):
+    """Decoded, upright image in RGB or RGBA"""
+    image = Image.open(fh)
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(image):
+    """{(width, ext): encoded bytes} for a loaded image"""
+    rendered = {}
+    for width in target_widths(image.width):
+        if width == image.width:
+            resized = image
+        else:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for ext, (image_format, options) in VARIANT_FORMATS.items():
+            rendered[width, ext] = encode(resized, image_format, options)
+    return rendered
+
+
+def generate_variants(name, storage=default_storage):
+    """Write the variants of the stored image `name`, returns the generated widths"""
+    with storage.open(name, 'rb') as fh:
+        image = load_image(fh)
+    rendered = render_variants(image)
+    for (width, ext), data in rendered.items():
+        path = variant_name(name, width, ext)
+        # fixed names: replace instead of letting the storage add a suffix
+        storage.delete(path)
+        storage.save(path, ContentFile(data))
+    forget(name)
+    return sorted({width for width, _ in rendered})
+
+
+def delete_variants(name, storage=default_storage):
+    """Remove the variants of an image whose original is gone"""
+    forget(name)
+    try:
+        _, files = storage.listdir(variant_dir(name))
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for filename in files:
+        storage.delete(posixpath.join(variant_dir(name), filename))
+
+
+def variant_widths(name, storage=default_storage, cached=True):
+    """Sorted widths that exist in every format, empty if the image has no variants yet"""
+    if cached:
+        widths, expires = _widths_cache.get(name, ((), 0.0))
+        if time.monotonic() < expires:
+            return widths
+    try:
+        _, files = storage.listdir(variant_dir(name))
+    except (FileNotFoundError, NotImplementedError):
+        files = ()
+    found = {}
+    for filename in files:
+        stem, _, ext = filename.partition('.')
+        if stem.isdigit() and ext in VARIANT_FORMATS:
+            found.setdefault(int(stem), set()).add(ext)
+    widths = tuple(sorted(width for width, exts in found.items() if len(exts) == len(VARIANT_FORMATS)))
+    with _cache_lock:
+        _widths_cache[name] = (widths, time.monotonic() + (WIDTHS_TTL if widths else MISSING_WIDTHS_TTL))
+    return widths
+
+
+def forget(name):
+    with _cache_lock:
+        _widths_cache.pop(name, None)
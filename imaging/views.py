@@ -0,0 +1,31 @@
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from PIL import Image
+
+from . import resize
+
+# The URL names the source and the size, the source never changes under a name
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+
+@require_GET
+def resized_image(request, width, height, name):
+    """/media/r/<w>x<h>/<path>?s=<signature>: a resized copy from the disk cache"""
+    if not (width or height) or width > resize.MAX_SIZE or height > resize.MAX_SIZE:
+        raise Http404
+    if not resize.valid_signature(name, width, height, request.GET.get('s', '')):
+        raise Http404
+
+    ext = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpg'
+    try:
+        fh = resize.open_resized(name, width, height, ext)
+    except (OSError, Image.DecompressionBombError):
+        # missing, truncated or not an image (UnidentifiedImageError is an OSError)
+        raise Http404
+
+    response = FileResponse(fh, content_type=CONTENT_TYPES[ext])
+    response['Cache-Control'] = CACHE_CONTROL
+    patch_vary_headers(response, ['Accept'])
+    return response
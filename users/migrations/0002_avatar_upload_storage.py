@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:03
+
+import imaging.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=imaging.storage.upload_storage, upload_to='avatars/'),
+        ),
+    ]
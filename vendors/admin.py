@@ -5,6 +5,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.db.models import Count
 from .models import Vendor, Branch
+from .signals import refresh_map_indexes
 
 
 class OpeningHoursWidget(forms.Textarea):
@@ -131,11 +132,13 @@ class VendorAdmin(admin.ModelAdmin):
     
     def activate_vendors(self, request, queryset):
         updated = queryset.update(is_active=True)
+        refresh_map_indexes()
         self.message_user(request, f'{updated} вендоров успешно активированы.')
     activate_vendors.short_description = "Активировать выбранных вендоров"
     
     def deactivate_vendors(self, request, queryset):
         updated = queryset.update(is_active=False)
+        refresh_map_indexes()
         self.message_user(request, f'{updated} вендоров успешно деактивированы.')
     deactivate_vendors.short_description = "Деактивировать выбранных вендоров"
     
@@ -214,10 +217,12 @@ class BranchAdmin(admin.ModelAdmin):
     
     def activate_branches(self, request, queryset):
         updated = queryset.update(is_active=True)
+        refresh_map_indexes()
         self.message_user(request, f'{updated} филиалов успешно активированы.')
     activate_branches.short_description = "Активировать выбранные филиалы"
     
     def deactivate_branches(self, request, queryset):
         updated = queryset.update(is_active=False)
+        refresh_map_indexes()
         self.message_user(request, f'{updated} филиалов успешно деактивированы.')
     deactivate_branches.short_description = "Деактивировать выбранные филиалы"
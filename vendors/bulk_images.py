@@ -0,0 +1,221 @@
+"""
+Bulk item photos from a zip archive.
+
+Files are named after the item's SKU or title, with a number for extra
+photos: "A-1042.jpg", "Лепёшка.png", "non_2.jpg". Names are folded with
+search_key(), so case, separators and Latin/Cyrillic spelling don't matter;
+a SKU wins over a title, and a name matching several items (the same product
+in several branches) goes to all of them.
+
+The archive is never read into memory: Django spools a large upload to a
+temporary file, and members are copied from it one at a time, in chunks, to
+a temporary directory. The copies are normalized and stored (the expensive
+part, imaging.ingest) in a thread pool, Pillow releases the GIL while it
+decodes and encodes, and the rows are created here, on the request thread,
+in one transaction per finished file. Variants and placeholders go to the
+image worker like any other upload (imaging/jobs.py); primary images and
+listings of the touched items are refreshed once, at the end.
+"""
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Max
+from PIL import Image, UnidentifiedImageError
+
+from catalog.listings import schedule_refresh
+from catalog.models import Item, ItemImage
+from imaging.models import ImageJob, StoredFile
+from imaging.storage import upload_storage
+from .normalize import search_key
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif', '.bmp', '.tif', '.tiff'}
+MAX_FILES = 500
+# uncompressed sizes, checked again while copying: headers can lie
+MAX_FILE_SIZE = 20 * 1024 * 1024
+MAX_TOTAL_SIZE = 1024 * 1024 * 1024
+COPY_CHUNK = 1024 * 1024
+THREADS = min(4, os.cpu_count() or 1)
+
+# "non 2" is the second photo of "non"
+NUMBERED_RE = re.compile(r'^(?P<key>.+) (?P<number>\d{1,2})$')
+
+
+def archive_members(archive):
+    """Members of the uploaded zip `archive`, ValidationError if it can't be processed"""
+    try:
+        with zipfile.ZipFile(archive) as opened:
+            members = [info for info in opened.infolist() if not info.is_dir()]
+    except (zipfile.BadZipFile, zipfile.LargeZipFile):
+        raise ValidationError('Файл не является zip-архивом')
+    if len(members) > MAX_FILES:
+        raise ValidationError(f'В архиве больше {MAX_FILES} файлов')
+    if sum(info.file_size for info in members) > MAX_TOTAL_SIZE:
+        raise ValidationError(f'Архив больше {MAX_TOTAL_SIZE // 1024 ** 2} МБ в распакованном виде')
+    return members
+
+
+def skip_reason(info):
+    """Why a member is not a photo to import, None if it is"""
+    filename = posixpath.basename(info.filename)
+    if filename.startswith('.') or info.filename.startswith('__MACOSX/'):
+        return 'служебный файл'
+    if posixpath.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+        return 'не изображение'
+    if info.file_size > MAX_FILE_SIZE:
+        return f'больше {MAX_FILE_SIZE // 1024 ** 2} МБ'
+    return None
+
+
+class ItemMatcher:
+    """Items of a vendor by folded SKU and by folded title"""
+
+    def __init__(self, vendor):
+        self.by_sku = {}
+        self.by_title = {}
+        for item in Item.objects.filter(vendor=vendor).only('id', 'title', 'sku', 'search_title'):
+            if item.sku:
+                self.by_sku.setdefault(search_key(item.sku), []).append(item)
+            self.by_title.setdefault(item.search_title, []).append(item)
+
+    def lookup(self, key):
+        return self.by_sku.get(key) or self.by_title.get(key) or []
+
+    def match(self, filename):
+        """Items the photo `filename` belongs to, empty if none"""
+        key = search_key(posixpath.splitext(posixpath.basename(filename))[0])
+        items = self.lookup(key)
+        # a full match first: a SKU may end with a number too
+        if not items and (numbered := NUMBERED_RE.match(key)):
+            items = self.lookup(numbered['key'])
+        return items
+
+
+def photo_order(info):
+    """Sort key putting "non.jpg" before "Non_2.jpg" whatever the case and separators"""
+    return search_key(posixpath.splitext(posixpath.basename(info.filename))[0]), info.filename
+
+
+def extract(archive, info, directory, index):
+    """Copy one member to `directory` chunk by chunk, returns the path"""
+    path = os.path.join(directory, f'{index}{posixpath.splitext(info.filename)[1].lower()}')
+    copied = 0
+    with archive.open(info) as source, open(path, 'wb') as target:
+        while chunk := source.read(COPY_CHUNK):
+            copied += len(chunk)
+            if copied > MAX_FILE_SIZE:
+                raise ValueError(f'больше {MAX_FILE_SIZE // 1024 ** 2} МБ')
+            target.write(chunk)
+    return path
+
+
+def store(path):
+    """Runs in the thread pool: the content name of the normalized photo at `path`"""
+    try:
+        with open(path, 'rb') as fh:
+            try:
+                Image.open(fh).verify()
+            except (UnidentifiedImageError, SyntaxError, OSError):
+                raise ValueError('файл повреждён или не является изображением')
+            fh.seek(0)
+            return upload_storage().save(posixpath.basename(path), File(fh))
+    finally:
+        os.remove(path)
+
+
+def next_orders(items):
+    """item id -> order of a photo added after the existing ones"""
+    last = (
+        ItemImage.objects.filter(item__in=items)
+        .values('item').annotate(last=Max('order')).values_list('item', 'last')
+    )
+    orders = {item.pk: 0 for item in items}
+    orders.update((item_id, last + 1) for item_id, last in last)
+    return orders
+
+
+def import_photos(vendor, upload):
+    """
+    Attach the photos of the zip `upload` to the items of `vendor`. Yields a
+    progress dict per archive member, then a summary with 'finished'.
+    """
+    members = sorted(archive_members(upload), key=photo_order)
+    matcher = ItemMatcher(vendor)
+    total = len(members)
+    counts = {'added': 0, 'unmatched': 0, 'skipped': 0, 'error': 0}
+    done = 0
+
+    def progress(info, status, **extra):
+        nonlocal done
+        done += 1
+        counts[status] += 1
+        return {'file': info.filename, 'status': status, 'done': done, 'total': total, **extra}
+
+    matched = []
+    for info in members:
+        reason = skip_reason(info)
+        items = [] if reason else matcher.match(info.filename)
+        if reason:
+            yield progress(info, 'skipped', error=reason)
+        elif not items:
+            yield progress(info, 'unmatched')
+        else:
+            matched.append((info, items))
+
+    orders = next_orders({item for _, items in matched for item in items})
+    running = {}
+    touched = set()
+
+    def attach():
+        """Rows for the files stored so far, waits for at least one"""
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            info, positions = running.pop(future)
+            try:
+                name = future.result()
+            except Exception as exc:
+                yield progress(info, 'error', error=str(exc))
+                continue
+            with transaction.atomic():
+                ItemImage.objects.bulk_create(
+                    ItemImage(item=item, image=name, order=order) for item, order in positions
+                )
+                # bulk_create sends no signals: what the ItemImage ones do per row, once per file
+                StoredFile.objects.acquire(name, len(positions))
+                ImageJob.objects.enqueue(name)
+            touched.update(item.pk for item, _ in positions)
+            yield progress(info, 'added', items=[item.title for item, _ in positions])
+
+    try:
+        with zipfile.ZipFile(upload) as archive, \
+                tempfile.TemporaryDirectory(prefix='bulk-images-') as directory, \
+                ThreadPoolExecutor(max_workers=THREADS) as pool:
+            for index, (info, items) in enumerate(matched):
+                # only a few files wait on disk, the rest stays in the archive
+                if len(running) >= THREADS * 2:
+                    yield from attach()
+                try:
+                    path = extract(archive, info, directory, index)
+                except (ValueError, zipfile.BadZipFile, OSError) as exc:
+                    yield progress(info, 'error', error=str(exc))
+                    continue
+                # the order follows the file names, not the finishing order
+                positions = [(item, orders[item.pk]) for item in items]
+                for item in items:
+                    orders[item.pk] += 1
+                running[pool.submit(store, path)] = (info, positions)
+            while running:
+                yield from attach()
+    finally:
+        # also when the client went away halfway: the rows so far are committed
+        if touched:
+            Item.objects.filter(pk__in=touched).refresh_primary_image()
+            schedule_refresh(touched)
+
+    yield {'finished': True, 'done': done, 'total': total, **counts}
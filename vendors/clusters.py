@@ -0,0 +1,149 @@
+"""
+Precomputed marker clusters for the map.
+
+Every zoom level has its own grid of CLUSTER_CELL_PX-sized Web Mercator
+cells; each cell keeps a branch count and coordinate sums for the centroid.
+A map tile at any zoom is then a handful of dict lookups, and moving or
+deactivating a branch only touches one cell per level.
+"""
+import math
+import threading
+
+from foodsave.snapshots import LazySnapshot
+
+MAX_ZOOM = 18
+TILE_PX = 256
+CLUSTER_CELL_PX = 64
+CELLS_PER_TILE = TILE_PX // CLUSTER_CELL_PX
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+
+def world_pixel(lat, lng, zoom):
+    """Web Mercator pixel coordinates of a point at the given zoom"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    scale = TILE_PX * (1 << zoom)
+    x = (lng + 180.0) / 360.0 * scale
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+class Cluster:
+    __slots__ = ('count', 'lat_sum', 'lng_sum', 'branch_ids')
+
+    def __init__(self):
+        self.count = 0
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+        self.branch_ids = set()
+
+    def as_dict(self):
+        data = {
+            'lat': round(self.lat_sum / self.count, 6),
+            'lng': round(self.lng_sum / self.count, 6),
+            'count': self.count,
+        }
+        if self.count == 1:
+            data['id'] = next(iter(self.branch_ids))
+        return data
+
+
+class ClusterPyramid:
+    """Grid clusters for zoom levels 0..MAX_ZOOM with incremental updates"""
+
+    def __init__(self, points=()):
+        self.levels = [{} for _ in range(MAX_ZOOM + 1)]
+        self.positions = {}
+        self._lock = threading.Lock()
+        for branch_id, lat, lng in points:
+            self._add(branch_id, lat, lng)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cells(self, lat, lng):
+        for zoom in range(MAX_ZOOM + 1):
+            x, y = world_pixel(lat, lng, zoom)
+            yield zoom, (int(x // CLUSTER_CELL_PX), int(y // CLUSTER_CELL_PX))
+
+    def _add(self, branch_id, lat, lng):
+        self.positions[branch_id] = (lat, lng)
+        for zoom, cell in self._cells(lat, lng):
+            cluster = self.levels[zoom].get(cell)
+            if cluster is None:
+                cluster = self.levels[zoom][cell] = Cluster()
+            cluster.count += 1
+            cluster.lat_sum += lat
+            cluster.lng_sum += lng
+            cluster.branch_ids.add(branch_id)
+
+    def _remove(self, branch_id):
+        position = self.positions.pop(branch_id, None)
+        if position is None:
+            return
+        lat, lng = position
+        for zoom, cell in self._cells(lat, lng):
+            cluster = self.levels[zoom][cell]
+            cluster.count -= 1
+            cluster.branch_ids.discard(branch_id)
+            if cluster.count:
+                cluster.lat_sum -= lat
+                cluster.lng_sum -= lng
+            else:
+                del self.levels[zoom][cell]
+
+    def upsert(self, branch_id, lat, lng):
+        """Add a branch or move it to new coordinates"""
+        with self._lock:
+            if self.positions.get(branch_id) == (lat, lng):
+                return
+            self._remove(branch_id)
+            self._add(branch_id, lat, lng)
+
+    def remove(self, branch_id):
+        with self._lock:
+            self._remove(branch_id)
+
+    def tile(self, zoom, x, y):
+        """Clusters inside the 256px tile (zoom, x, y)"""
+        cells = self.levels[zoom]
+        first_col, first_row = x * CELLS_PER_TILE, y * CELLS_PER_TILE
+        clusters = []
+        with self._lock:
+            for row in range(first_row, first_row + CELLS_PER_TILE):
+                for col in range(first_col, first_col + CELLS_PER_TILE):
+                    cluster = cells.get((col, row))
+                    if cluster is not None:
+                        clusters.append(cluster.as_dict())
+        return clusters
+
+
+def _build_pyramid():
+    from .models import Branch
+
+    return ClusterPyramid(
+        Branch.objects.filter(is_active=True, vendor__is_active=True)
+        .values_list('id', 'latitude', 'longitude')
+    )
+
+
+cluster_pyramid = LazySnapshot(_build_pyramid)
+
+
+def sync_branch(branch):
+    """Apply a saved branch to the pyramid, if this process has built one"""
+    pyramid = cluster_pyramid.peek()
+    if pyramid is None:
+        return
+    if branch.is_active and branch.vendor.is_active:
+        pyramid.upsert(branch.pk, float(branch.latitude), float(branch.longitude))
+    else:
+        pyramid.remove(branch.pk)
+
+
+def remove_branch(branch_id):
+    pyramid = cluster_pyramid.peek()
+    if pyramid is not None:
+        pyramid.remove(branch_id)
@@ -0,0 +1,160 @@
+"""
+Batched great-circle distances between one user point and many branches.
+
+Coordinates of active branches are cached as float64 NumPy arrays, so the map,
+the catalog distance filter and the vendor list compute every distance they
+need with a single vectorized call instead of a Python loop. A radius search
+prefilters in SQL instead, so it only reads the branches near the user.
+"""
+import math
+
+import numpy as np
+
+from foodsave.snapshots import LazySnapshot
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance in kilometers between two points using Haversine formula"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_array(lat, lng, lats, lngs):
+    """Distances in kilometers from (lat, lng) to every point of the `lats`/`lngs` arrays"""
+    lat_rad = math.radians(lat)
+    lats_rad = np.radians(lats)
+    half_dlat = (lats_rad - lat_rad) * 0.5
+    half_dlng = np.radians(lngs - lng) * 0.5
+
+    a = np.sin(half_dlat) ** 2 + math.cos(lat_rad) * np.cos(lats_rad) * np.sin(half_dlng) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def top_k(distances, k):
+    """Positions of the k smallest distances, closest first"""
+    if k <= 0 or len(distances) == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(distances):
+        candidates = np.argpartition(distances, k - 1)[:k]
+    else:
+        candidates = np.arange(len(distances))
+    return candidates[np.argsort(distances[candidates], kind='stable')]
+
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) enclosing a circle of `radius_km`"""
+    angular = radius_km / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angular)
+    ratio = math.sin(angular) / max(math.cos(math.radians(lat)), 1e-12)
+    lng_delta = math.degrees(math.asin(ratio)) if ratio < 1 else 180.0
+    return lat - lat_delta, lat + lat_delta, lng - lng_delta, lng + lng_delta
+
+
+class BranchArrays:
+    """Column arrays of active branches: ids, coordinates, vendor ids and active item counts"""
+
+    def __init__(self, ids, lats, lngs, vendor_ids, item_counts):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.vendor_ids = np.asarray(vendor_ids, dtype=np.int64)
+        self.item_counts = np.asarray(item_counts, dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (id, lat, lng, vendor_id, item_count) tuples"""
+        rows = list(rows)
+        if not rows:
+            return cls([], [], [], [], [])
+        return cls(*zip(*rows))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, lat, lng):
+        """Distance from (lat, lng) to every branch"""
+        return haversine_array(lat, lng, self.lats, self.lngs)
+
+    def nearest(self, lat, lng, k):
+        """The k nearest branches as a list of (branch_id, distance_km)"""
+        distances = self.distances(lat, lng)
+        positions = top_k(distances, k)
+        return list(zip(self.ids[positions].tolist(), distances[positions].tolist()))
+
+
+def branch_distances(lat, lng, radius_km=None):
+    """
+    {branch_id: distance_km} for active branches, optionally within
+    `radius_km`. The radius is narrowed down by a bounding box on the Branch
+    (latitude, longitude) index in SQL, exact distances only for the survivors.
+    """
+    if radius_km is None:
+        arrays = branch_arrays.get()
+        return dict(zip(arrays.ids.tolist(), arrays.distances(lat, lng).tolist()))
+
+    from .models import Branch
+
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    rows = list(
+        Branch.objects.filter(
+            is_active=True, vendor__is_active=True,
+            latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng)
+        ).values_list('id', 'latitude', 'longitude')
+    )
+    if not rows:
+        return {}
+    ids, lats, lngs = (np.asarray(column) for column in zip(*rows))
+    distances = haversine_array(lat, lng, lats.astype(np.float64), lngs.astype(np.float64))
+    keep = distances <= radius_km
+    return dict(zip(ids[keep].tolist(), distances[keep].tolist()))
+
+
+def vendor_distance_arrays(lat, lng):
+    """(sorted vendor ids, distance_km) to the closest active branch of each vendor"""
+    arrays = branch_arrays.get()
+    distances = arrays.distances(lat, lng)
+    # Group by vendor, closest branch first, and keep the first row of each group
+    order = np.lexsort((distances, arrays.vendor_ids))
+    vendor_ids, first = np.unique(arrays.vendor_ids[order], return_index=True)
+    return vendor_ids, distances[order[first]]
+
+
+def order_by_distance(vendor_ids, lat, lng):
+    """
+    (ids, distances) of `vendor_ids` closest first, NaN and last for vendors
+    without an active branch; ties keep the order they came in.
+    """
+    ids = np.asarray(vendor_ids, dtype=np.int64)
+    known_ids, known = vendor_distance_arrays(lat, lng)
+    distances = np.full(len(ids), np.nan)
+    if len(known_ids):
+        positions = np.minimum(np.searchsorted(known_ids, ids), len(known_ids) - 1)
+        found = known_ids[positions] == ids
+        distances[found] = known[positions[found]]
+    order = np.argsort(distances, kind='stable')
+    return ids[order], distances[order]
+
+
+def _load_branch_arrays():
+    from django.db.models import Count, Q
+    from .models import Branch
+
+    return BranchArrays.from_rows(
+        Branch.objects.filter(is_active=True, vendor__is_active=True)
+        .annotate(active_items=Count('items', filter=Q(items__is_active=True)))
+        .order_by('id')
+        .values_list('id', 'latitude', 'longitude', 'vendor_id', 'active_items')
+    )
+
+
+branch_arrays = LazySnapshot(_load_branch_arrays)
@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Row, Column, Submit, Div, HTML
 from crispy_forms.bootstrap import FormActions
+from .bulk_images import archive_members
 from .models import Vendor, Branch
 
 User = get_user_model()
@@ -228,6 +229,19 @@ class BranchForm(forms.ModelForm):
         })
 
 
+class BulkImageUploadForm(forms.Form):
+    """Zip archive of item photos named by SKU or title"""
+    archive = forms.FileField(label="Zip-архив с фото", widget=forms.ClearableFileInput(attrs={
+        'class': 'form-control',
+        'accept': '.zip,application/zip',
+    }))
+
+    def clean_archive(self):
+        archive = self.cleaned_data['archive']
+        archive_members(archive)
+        return archive
+
+
 class AssignVendorRoleForm(forms.Form):
     """Staff form to assign vendor role to an existing user"""
     user = forms.ModelChoiceField(queryset=User.objects.all(), label="Пользователь")
@@ -0,0 +1,180 @@
+"""
+Opening hours compiled into weekly minute intervals.
+
+Branch.opening_hours is free-form JSON ({"monday": "09:00-22:00",
+"пт": {"open": "10:00", "close": "02:00"}, "sunday": "closed"}). On save it
+is compiled once into Branch.schedule: sorted, merged [start, end) pairs of
+minutes since Monday 00:00 local time. Overnight ranges spill into the next
+day (Sunday wraps to Monday), equal open and close times mean round the
+clock, unparseable days count as closed. Checking a moment is then a bisect
+over a handful of pairs, and ScheduleTable answers it for many branches at
+once. The same intervals are stored as BranchOpenInterval rows, so list
+pages can filter to open branches in SQL (open_branches()).
+"""
+from bisect import bisect_right
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+TIMEZONE = ZoneInfo('Asia/Tashkent')
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+
+# Accepted keys per weekday, Monday first
+DAY_KEYS = (
+    ('monday', 'mon', 'понедельник', 'пн'),
+    ('tuesday', 'tue', 'вторник', 'вт'),
+    ('wednesday', 'wed', 'среда', 'ср'),
+    ('thursday', 'thu', 'четверг', 'чт'),
+    ('friday', 'fri', 'пятница', 'пт'),
+    ('saturday', 'sat', 'суббота', 'сб'),
+    ('sunday', 'sun', 'воскресенье', 'вс'),
+)
+CLOSED_VALUES = ('closed', 'закрыто', 'выходной')
+
+# `open` GET parameter of list pages -> minutes ahead that still count
+OPEN_FILTERS = {
+    'now': 0,
+    'hour': 60,
+}
+
+
+def local_now(now=None):
+    return (now or timezone.now()).astimezone(TIMEZONE)
+
+
+def minute_of_week(now=None):
+    """Minutes since Monday 00:00 in Tashkent for `now` (default: the current time)"""
+    now = local_now(now)
+    return now.weekday() * DAY_MINUTES + now.hour * 60 + now.minute
+
+
+def day_hours(opening_hours, weekday):
+    """Raw opening_hours value of a weekday (0 = Monday), None if the day is missing"""
+    if not opening_hours:
+        return None
+    keys = {str(key).strip().lower(): value for key, value in opening_hours.items()}
+    for key in DAY_KEYS[weekday]:
+        if key in keys:
+            return keys[key]
+    return None
+
+
+def parse_time(value):
+    """'09:00' -> 540; '24:00' is the end of the day"""
+    hours, minutes = str(value).strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (hours == 24 and minutes):
+        raise ValueError(value)
+    return hours * 60 + minutes
+
+
+def parse_range(value):
+    """(open, close) minutes of a day's value, None when closed or unreadable"""
+    try:
+        if isinstance(value, dict):
+            return parse_time(value['open']), parse_time(value['close'])
+        if isinstance(value, str):
+            if value.strip().lower() in CLOSED_VALUES:
+                return None
+            start, end = value.replace('–', '-').split('-')
+            return parse_time(start), parse_time(end)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def compile_schedule(opening_hours):
+    """Sorted, merged [start, end) minute-of-week intervals of an opening_hours mapping"""
+    intervals = []
+    for weekday in range(7):
+        hours = parse_range(day_hours(opening_hours, weekday))
+        if hours is None:
+            continue
+        opens, closes = hours
+        if closes <= opens:
+            # overnight, or the same time twice for round the clock
+            closes += DAY_MINUTES
+        start = weekday * DAY_MINUTES + opens
+        end = weekday * DAY_MINUTES + closes
+        if end > WEEK_MINUTES:
+            intervals.append([0, end - WEEK_MINUTES])
+            end = WEEK_MINUTES
+        intervals.append([start, end])
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def open_interval(schedule, minute):
+    """The [start, end) interval of `schedule` containing `minute`, None if closed then"""
+    position = bisect_right(schedule, [minute, WEEK_MINUTES]) - 1
+    if position >= 0 and minute < schedule[position][1]:
+        return schedule[position]
+    return None
+
+
+def is_open(schedule, minute):
+    return open_interval(schedule, minute) is not None
+
+
+def interval_filter(minute, within=0):
+    """Q for BranchOpenInterval rows overlapping [minute, minute + within] of the week"""
+    last = minute + within
+    overlaps = Q(start_minute__lte=last, end_minute__gt=minute)
+    if last >= WEEK_MINUTES:
+        # the window runs past Sunday midnight into next Monday
+        overlaps |= Q(start_minute__lte=last - WEEK_MINUTES)
+    return overlaps
+
+
+def open_branches(within=0, now=None):
+    """Branch ids (a values() queryset) open at some point in the next `within` minutes"""
+    from .models import BranchOpenInterval
+
+    return BranchOpenInterval.objects.filter(
+        interval_filter(minute_of_week(now), within)
+    ).values('branch_id')
+
+
+def open_filter_minutes(params):
+    """Minutes ahead for the `open` GET parameter, None without the filter"""
+    return OPEN_FILTERS.get(params.get('open'))
+
+
+class ScheduleTable:
+    """The intervals of many schedules as flat arrays, for checking all of them at once"""
+
+    def __init__(self, schedules):
+        schedules = list(schedules)
+        self.size = len(schedules)
+        owners, starts, ends = [], [], []
+        for position, schedule in enumerate(schedules):
+            for start, end in schedule:
+                owners.append(position)
+                starts.append(start)
+                ends.append(end)
+        self.owners = np.asarray(owners, dtype=np.intp)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+
+    def open_at(self, minute):
+        """Boolean array: is each schedule open at `minute` of the week"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.owners[(self.starts <= minute) & (minute < self.ends)]] = True
+        return mask
+
+
+def open_now(branches, now=None):
+    """{branch id: is open} for branch instances, one vectorized check for all of them"""
+    branches = list(branches)
+    mask = ScheduleTable(branch.schedule for branch in branches).open_at(minute_of_week(now))
+    return dict(zip((branch.pk for branch in branches), mask.tolist()))
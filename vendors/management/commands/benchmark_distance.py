@@ -0,0 +1,57 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from vendors.distance import haversine, haversine_array, top_k
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скалярный и векторный расчет расстояний до филиалов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--k', type=int, default=20)
+
+    def _best_of(self, repeat, func):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+
+    def handle(self, *args, **options):
+        """
+        Синтетические филиалы вокруг Ташкента, одна точка пользователя.
+        Выводит лучшее время из нескольких запусков в миллисекундах.
+        """
+        rng = random.Random(42)
+        user_lat, user_lng = 41.311, 69.279
+        k = options['k']
+
+        self.stdout.write(f'{"branches":>10} {"scalar ms":>12} {"numpy ms":>10} {"sorted ms":>10} {"top-k ms":>10} {"speedup":>8}')
+        for size in options['sizes']:
+            lats = np.array([41.31 + rng.uniform(-0.2, 0.2) for _ in range(size)])
+            lngs = np.array([69.28 + rng.uniform(-0.25, 0.25) for _ in range(size)])
+            lat_list, lng_list = lats.tolist(), lngs.tolist()
+
+            def scalar():
+                distances = [haversine(user_lat, user_lng, lat, lng) for lat, lng in zip(lat_list, lng_list)]
+                return sorted(range(size), key=distances.__getitem__)[:k]
+
+            def vectorized():
+                return haversine_array(user_lat, user_lng, lats, lngs)
+
+            distances = vectorized()
+            scalar_ms = self._best_of(options['repeat'], scalar)
+            numpy_ms = self._best_of(options['repeat'], vectorized)
+            sorted_ms = self._best_of(options['repeat'], lambda: np.argsort(distances)[:k])
+            top_k_ms = self._best_of(options['repeat'], lambda: top_k(distances, k))
+
+            self.stdout.write(
+                f'{size:>10} {scalar_ms:>12.2f} {numpy_ms:>10.3f} {sorted_ms:>10.3f} {top_k_ms:>10.3f} '
+                f'{scalar_ms / (numpy_ms + top_k_ms):>7.0f}x'
+            )
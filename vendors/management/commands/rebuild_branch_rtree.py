@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from vendors import rtree
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает R*Tree индекс координат филиалов для запросов карты'
+
+    def handle(self, *args, **options):
+        if not rtree.is_supported():
+            self.stdout.write(self.style.WARNING('⚠️  R*Tree доступен только для SQLite, пропускаем'))
+            return
+
+        count = rtree.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'✅ В индекс добавлено {count} филиалов'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='branch',
+            index=models.Index(fields=['latitude', 'longitude'], name='vendors_bra_latitud_78ea74_idx'),
+        ),
+    ]
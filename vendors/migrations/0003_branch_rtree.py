@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Frozen copies of vendors.rtree as it was for this schema
+RTREE_TABLE = 'vendors_branch_rtree'
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} '
+    'USING rtree(id, min_lat, max_lat, min_lng, max_lng)'
+)
+POPULATE_SQL = (
+    f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) '
+    'SELECT b.id, b.latitude, b.latitude, b.longitude, b.longitude '
+    'FROM vendors_branch b INNER JOIN vendors_vendor v ON v.id = b.vendor_id '
+    'WHERE b.is_active AND v.is_active'
+)
+
+
+def create_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_SQL)
+        schema_editor.execute(POPULATE_SQL)
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {RTREE_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0002_branch_coordinates_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
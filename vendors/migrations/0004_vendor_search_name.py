@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:48
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Frozen copy of vendors.normalize.search_key as it was for this schema
+CYRILLIC_TABLE = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+})
+LATIN_FOLD_MAP = {'shch': 'sh', 'kh': 'x', 'zh': 'j', 'yo': 'e', 'ye': 'e'}
+LATIN_FOLD_RE = re.compile('|'.join(LATIN_FOLD_MAP))
+APOSTROPHES_RE = re.compile("['ʻʼ‘’`´]")
+SEPARATORS_RE = re.compile(r'[\W_]+')
+
+
+def search_key(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text).casefold().translate(CYRILLIC_TABLE)
+    text = ''.join(
+        char for char in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(char)
+    )
+    text = APOSTROPHES_RE.sub('', text)
+    text = LATIN_FOLD_RE.sub(lambda match: LATIN_FOLD_MAP[match.group()], text)
+    return SEPARATORS_RE.sub(' ', text).strip()
+
+
+def fill_search_names(apps, schema_editor):
+    Vendor = apps.get_model('vendors', 'Vendor')
+    vendors = list(Vendor.objects.only('name'))
+    for vendor in vendors:
+        vendor.search_name = search_key(vendor.name)
+    Vendor.objects.bulk_update(vendors, ['search_name'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0003_branch_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendor',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+# Frozen copy of vendors.hours.compile_schedule as it was for this schema
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+DAY_KEYS = (
+    ('monday', 'mon', 'понедельник', 'пн'),
+    ('tuesday', 'tue', 'вторник', 'вт'),
+    ('wednesday', 'wed', 'среда', 'ср'),
+    ('thursday', 'thu', 'четверг', 'чт'),
+    ('friday', 'fri', 'пятница', 'пт'),
+    ('saturday', 'sat', 'суббота', 'сб'),
+    ('sunday', 'sun', 'воскресенье', 'вс'),
+)
+CLOSED_VALUES = ('closed', 'закрыто', 'выходной')
+
+
+def parse_time(value):
+    hours, minutes = str(value).strip().split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or (hours == 24 and minutes):
+        raise ValueError(value)
+    return hours * 60 + minutes
+
+
+def parse_range(value):
+    try:
+        if isinstance(value, dict):
+            return parse_time(value['open']), parse_time(value['close'])
+        if isinstance(value, str):
+            if value.strip().lower() in CLOSED_VALUES:
+                return None
+            start, end = value.replace('–', '-').split('-')
+            return parse_time(start), parse_time(end)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def compile_schedule(opening_hours):
+    keys = {str(key).strip().lower(): value for key, value in (opening_hours or {}).items()}
+    intervals = []
+    for weekday, day_keys in enumerate(DAY_KEYS):
+        value = next((keys[key] for key in day_keys if key in keys), None)
+        hours = parse_range(value)
+        if hours is None:
+            continue
+        opens, closes = hours
+        if closes <= opens:
+            closes += DAY_MINUTES
+        start = weekday * DAY_MINUTES + opens
+        end = weekday * DAY_MINUTES + closes
+        if end > WEEK_MINUTES:
+            intervals.append([0, end - WEEK_MINUTES])
+            end = WEEK_MINUTES
+        intervals.append([start, end])
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def compile_schedules(apps, schema_editor):
+    Branch = apps.get_model('vendors', 'Branch')
+    branches = list(Branch.objects.only('opening_hours'))
+    for branch in branches:
+        branch.schedule = compile_schedule(branch.opening_hours)
+    Branch.objects.bulk_update(branches, ['schedule'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0004_vendor_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='branch',
+            name='schedule',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(compile_schedules, migrations.RunPython.noop),
+    ]
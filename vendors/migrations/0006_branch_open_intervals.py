@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_open_intervals(apps, schema_editor):
+    Branch = apps.get_model('vendors', 'Branch')
+    BranchOpenInterval = apps.get_model('vendors', 'BranchOpenInterval')
+    BranchOpenInterval.objects.bulk_create(
+        [
+            BranchOpenInterval(branch_id=branch_id, start_minute=start, end_minute=end)
+            for branch_id, schedule in Branch.objects.values_list('id', 'schedule')
+            for start, end in schedule
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0005_branch_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BranchOpenInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_minute', models.PositiveIntegerField()),
+                ('end_minute', models.PositiveIntegerField()),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_intervals', to='vendors.branch')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start_minute', 'end_minute'], name='vendors_bra_start_m_49ce3c_idx')],
+            },
+        ),
+        migrations.RunPython(fill_open_intervals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:03
+
+import imaging.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0006_branch_open_intervals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vendor',
+            name='logo',
+            field=models.ImageField(blank=True, null=True, storage=imaging.storage.upload_storage, upload_to='vendor_logos/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendors', '0007_logo_upload_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vendor',
+            name='logo_placeholder',
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+    ]
@@ -1,11 +1,16 @@
 from django.db import models
 from django.utils import timezone
 from datetime import datetime
+from imaging.placeholders import PLACEHOLDER_MAX_LENGTH, PlaceholderMixin
+from imaging.storage import upload_storage
 from users.models import User
 
+from . import hours
+from .normalize import SearchKeysMixin
+
 # Create your models here.
 
-class Vendor(models.Model):
+class Vendor(SearchKeysMixin, PlaceholderMixin, models.Model):
     TYPE_CHOICES = [
         ('restaurant', 'Restaurant'),
         ('store', 'Store'),
@@ -15,13 +20,19 @@ class Vendor(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_vendors')
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     name = models.CharField(max_length=200)
+    # transliteration-folded name, see vendors/normalize.py
+    search_name = models.CharField(max_length=200, blank=True, db_index=True, editable=False)
     description = models.TextField(blank=True)
-    logo = models.ImageField(upload_to='vendor_logos/', null=True, blank=True)
+    logo = models.ImageField(upload_to='vendor_logos/', storage=upload_storage, null=True, blank=True)
+    logo_placeholder = models.CharField(max_length=PLACEHOLDER_MAX_LENGTH, blank=True, editable=False)
     rating = models.FloatField(default=0.0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    search_key_fields = {'search_name': 'name'}
+    placeholder_fields = {'logo_placeholder': 'logo'}
+
     def __str__(self):
         return f"{self.name} ({self.get_type_display()})"
 
@@ -33,41 +44,39 @@ class Branch(models.Model):
     longitude = models.FloatField()
     phone = models.CharField(max_length=20)
     opening_hours = models.JSONField(default=dict)  # {"monday": "09:00-22:00", ...}
+    # opening_hours compiled on save, see vendors/hours.py
+    schedule = models.JSONField(default=list, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude']),
+        ]
+
     def __str__(self):
         return f"{self.vendor.name} - {self.name}"
     
+    def save(self, *args, **kwargs):
+        self.schedule = hours.compile_schedule(self.opening_hours)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'opening_hours' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'schedule'}
+        super().save(*args, **kwargs)
+        if update_fields is None or 'opening_hours' in update_fields:
+            self.sync_open_intervals()
+    
+    def sync_open_intervals(self):
+        """Replace the BranchOpenInterval rows with the compiled schedule"""
+        self.open_intervals.all().delete()
+        BranchOpenInterval.objects.bulk_create(
+            BranchOpenInterval(branch=self, start_minute=start, end_minute=end)
+            for start, end in self.schedule
+        )
+    
     def get_today_hours(self):
         """Get opening hours for today"""
-        from zoneinfo import ZoneInfo
-        
-        if not self.opening_hours:
-            return None
-            
-        # Get current day name in local timezone (Asia/Tashkent)
-        now_utc = timezone.now()
-        now_local = now_utc.astimezone(ZoneInfo('Asia/Tashkent'))
-        today = now_local.strftime('%A').lower()
-        
-        # Map English day names to possible keys
-        day_mapping = {
-            'monday': ['monday', 'понедельник', 'пн'],
-            'tuesday': ['tuesday', 'вторник', 'вт'],
-            'wednesday': ['wednesday', 'среда', 'ср'],
-            'thursday': ['thursday', 'четверг', 'чт'],
-            'friday': ['friday', 'пятница', 'пт'],
-            'saturday': ['saturday', 'суббота', 'сб'],
-            'sunday': ['sunday', 'воскресенье', 'вс']
-        }
-        
-        # Try to find today's hours
-        for key in day_mapping.get(today, [today]):
-            if key in self.opening_hours:
-                return self.opening_hours[key]
-        
-        return None
+        return hours.day_hours(self.opening_hours, hours.local_now().weekday())
     
     def get_closing_time(self):
         """Get closing time for today"""
@@ -103,67 +112,19 @@ class Branch(models.Model):
     
     def is_open_now(self):
         """Check if branch is currently open"""
-        from datetime import datetime
-        from zoneinfo import ZoneInfo
-        
-        today_hours = self.get_today_hours()
-        if not today_hours:
-            return False
-            
-        if isinstance(today_hours, str):
-            if today_hours.lower() in ['closed', 'закрыто']:
-                return False
-                
-            if '-' in today_hours:
-                try:
-                    # Handle both "09:00-18:00" and "09:00 - 18:00" formats
-                    parts = today_hours.split('-')
-                    if len(parts) == 2:
-                        open_time_str = parts[0].strip()
-                        close_time_str = parts[1].strip()
-                        
-                        # Get current time in local timezone (Asia/Tashkent)
-                        now_utc = timezone.now()
-                        now_local = now_utc.astimezone(ZoneInfo('Asia/Tashkent'))
-                        current_time = now_local.time()
-                        
-                        # Parse opening and closing times
-                        open_time = datetime.strptime(open_time_str, '%H:%M').time()
-                        close_time = datetime.strptime(close_time_str, '%H:%M').time()
-                        
-                        # Check if we're within opening hours
-                        if open_time <= close_time:
-                            # Normal case: 09:00 - 18:00
-                            return open_time <= current_time <= close_time
-                        else:
-                            # Overnight case: 20:00 - 02:00
-                            return current_time >= open_time or current_time <= close_time
-                    return False
-                except (ValueError, AttributeError):
-                    return False
-        
-        elif isinstance(today_hours, dict):
-            open_time_str = today_hours.get('open')
-            close_time_str = today_hours.get('close')
-            if open_time_str and close_time_str:
-                try:
-                    # Get current time in local timezone (Asia/Tashkent)
-                    now_utc = timezone.now()
-                    now_local = now_utc.astimezone(ZoneInfo('Asia/Tashkent'))
-                    current_time = now_local.time()
-                    
-                    # Parse opening and closing times
-                    open_time = datetime.strptime(open_time_str, '%H:%M').time()
-                    close_time = datetime.strptime(close_time_str, '%H:%M').time()
-                    
-                    # Check if we're within opening hours
-                    if open_time <= close_time:
-                        # Normal case: 09:00 - 18:00
-                        return open_time <= current_time <= close_time
-                    else:
-                        # Overnight case: 20:00 - 02:00
-                        return current_time >= open_time or current_time <= close_time
-                except (ValueError, AttributeError):
-                    return False
-        
-        return False
\ No newline at end of file
+        return hours.is_open(self.schedule, hours.minute_of_week())
+
+
+class BranchOpenInterval(models.Model):
+    """One [start, end) range of Branch.schedule, in minutes since Monday 00:00 Tashkent time"""
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='open_intervals')
+    start_minute = models.PositiveIntegerField()
+    end_minute = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_minute', 'end_minute']),
+        ]
+
+    def __str__(self):
+        return f"{self.branch_id}: {self.start_minute}-{self.end_minute}"
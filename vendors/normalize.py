@@ -0,0 +1,85 @@
+"""
+Script-independent search keys.
+
+Uzbek is written in both Latin and Cyrillic and Russian names get typed in
+Latin, so "нон"/"non" or "лепёшка"/"lepyoshka" must end up as the same key.
+search_key() transliterates Cyrillic to Uzbek Latin, folds case and
+diacritics, merges spellings that differ between the two traditions
+(ё/yo, х/kh, ж/zh, apostrophes) and keeps only letters, digits and single
+spaces. Stored keys and queries go through the same function.
+"""
+import re
+import unicodedata
+
+from django.db.models import Q
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+    # Uzbek letters
+    'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+CYRILLIC_TABLE = str.maketrans(CYRILLIC_TO_LATIN)
+
+# Latin spellings folded onto the transliteration above, longest first
+LATIN_FOLDS = (
+    ('shch', 'sh'),
+    ('kh', 'x'),
+    ('zh', 'j'),
+    ('yo', 'e'),
+    ('ye', 'e'),
+)
+LATIN_FOLD_RE = re.compile('|'.join(source for source, _ in LATIN_FOLDS))
+LATIN_FOLD_MAP = dict(LATIN_FOLDS)
+
+# o‘, g‘ and the Cyrillic hard sign are written with any of these, or not at all
+APOSTROPHES_RE = re.compile("['ʻʼ‘’`´]")
+SEPARATORS_RE = re.compile(r'[\W_]+')
+
+
+def search_key(text):
+    """Canonical folded form of `text` for indexing and for queries"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text).casefold()
+    # Cyrillic first: decomposing would split й and ё into a letter and a mark
+    text = text.translate(CYRILLIC_TABLE)
+    text = ''.join(
+        char for char in unicodedata.normalize('NFKD', text)
+        if not unicodedata.combining(char)
+    )
+    text = APOSTROPHES_RE.sub('', text)
+    text = LATIN_FOLD_RE.sub(lambda match: LATIN_FOLD_MAP[match.group()], text)
+    return SEPARATORS_RE.sub(' ', text).strip()
+
+
+def key_prefix(field, key):
+    """
+    Q for a stored search key starting with `key`, as a range on the index:
+    LIKE 'key%' (__startswith) scans the whole table on SQLite
+    """
+    if not key:
+        return Q()
+    upper = key[:-1] + chr(ord(key[-1]) + 1)
+    return Q(**{f'{field}__gte': key, f'{field}__lt': upper})
+
+
+class SearchKeysMixin:
+    """
+    Model mixin filling stored search keys on save. `search_key_fields` maps
+    each key field to the text field it is computed from.
+    """
+    search_key_fields = {}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        for key_field, source_field in self.search_key_fields.items():
+            setattr(self, key_field, search_key(getattr(self, source_field)))
+            if update_fields is not None and source_field in update_fields:
+                update_fields = {*update_fields, key_field}
+        if update_fields is not None:
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
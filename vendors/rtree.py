@@ -0,0 +1,84 @@
+"""
+SQLite R*Tree over active branch coordinates.
+
+The virtual table is created by a migration and kept in sync by signals;
+`manage.py rebuild_branch_rtree` refills it from scratch. On databases without
+R*Tree support the viewport query falls back to the (latitude, longitude)
+index on Branch.
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+RTREE_TABLE = 'vendors_branch_rtree'
+
+CREATE_SQL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} '
+    'USING rtree(id, min_lat, max_lat, min_lng, max_lng)'
+)
+DROP_SQL = f'DROP TABLE IF EXISTS {RTREE_TABLE}'
+POPULATE_SQL = (
+    f'INSERT INTO {RTREE_TABLE} (id, min_lat, max_lat, min_lng, max_lng) '
+    'SELECT b.id, b.latitude, b.latitude, b.longitude, b.longitude '
+    'FROM vendors_branch b INNER JOIN vendors_vendor v ON v.id = b.vendor_id '
+    'WHERE b.is_active AND v.is_active'
+)
+
+
+def is_supported(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def _active_branches():
+    from .models import Branch
+
+    return Branch.objects.filter(is_active=True, vendor__is_active=True)
+
+
+def sync_branch(branch):
+    """Insert, move or drop a single branch depending on its current state"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RTREE_TABLE} WHERE id = %s', [branch.pk])
+        if branch.is_active and branch.vendor.is_active:
+            cursor.execute(
+                f'INSERT INTO {RTREE_TABLE} VALUES (%s, %s, %s, %s, %s)',
+                [branch.pk, branch.latitude, branch.latitude, branch.longitude, branch.longitude]
+            )
+
+
+def remove_branch(branch_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {RTREE_TABLE} WHERE id = %s', [branch_id])
+
+
+def rebuild(using=None):
+    """Refill the R*Tree from the Branch table, returns the number of rows"""
+    conn = using or connection
+    if not is_supported(conn):
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute(f'DELETE FROM {RTREE_TABLE}')
+        cursor.execute(POPULATE_SQL)
+        return cursor.rowcount
+
+
+def branches_in_bbox(min_lat, min_lng, max_lat, max_lng):
+    """Queryset of active branches inside the bounding box"""
+    branches = _active_branches().filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lng, max_lng)
+    )
+    if not is_supported():
+        return branches
+
+    # R*Tree stores 32-bit floats rounded outwards, the exact range check above
+    # trims the few extra candidates it may return
+    return branches.filter(id__in=RawSQL(
+        f'SELECT id FROM {RTREE_TABLE} '
+        'WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s',
+        [min_lat, max_lat, min_lng, max_lng]
+    ))
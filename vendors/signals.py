@@ -0,0 +1,44 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import clusters, rtree
+from .models import Vendor, Branch
+from .distance import branch_arrays
+
+
+def refresh_map_indexes():
+    """Full resync after bulk .update() calls that bypass model signals"""
+    branch_arrays.invalidate()
+    clusters.cluster_pyramid.invalidate()
+    rtree.rebuild()
+
+
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def invalidate_branch_arrays(sender, **kwargs):
+    """Branch coordinates or activity changed - refresh cached branch arrays"""
+    branch_arrays.invalidate()
+
+
+@receiver(post_save, sender=Branch)
+def sync_branch_map_indexes(sender, instance, **kwargs):
+    rtree.sync_branch(instance)
+    clusters.sync_branch(instance)
+
+
+@receiver(post_delete, sender=Branch)
+def remove_branch_map_indexes(sender, instance, **kwargs):
+    rtree.remove_branch(instance.pk)
+    clusters.remove_branch(instance.pk)
+
+
+@receiver(post_save, sender=Vendor)
+def sync_vendor_map_indexes(sender, instance, created, **kwargs):
+    if created:
+        return
+    for branch in instance.branches.all():
+        branch.vendor = instance
+        rtree.sync_branch(branch)
+        clusters.sync_branch(branch)
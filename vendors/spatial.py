@@ -0,0 +1,170 @@
+"""
+In-memory spatial index over active branches.
+
+Branches are bucketed into a regular lat/lng grid. Nearest-neighbour queries
+scan the grid in rings around the user's cell and yield branches in order of
+increasing distance, so "closest N" never has to touch every branch. Points
+far from every branch would walk a huge number of empty rings, so past
+MAX_RING_RADIUS the rest is ordered with one vectorized sort instead.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from .distance import EARTH_RADIUS_KM, branch_arrays, haversine_array, top_k
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# ~1.1 km per cell in latitude, ~0.8 km in longitude around Tashkent
+GRID_CELL_DEGREES = 0.01
+
+# Rings scanned one by one (~50 km), anything further is sorted in bulk
+MAX_RING_RADIUS = 50
+
+
+def valid_point(lat, lng):
+    """Finite coordinates within the lat/lng ranges"""
+    return (
+        math.isfinite(lat) and math.isfinite(lng)
+        and -90 <= lat <= 90 and -180 <= lng <= 180
+    )
+
+
+class BranchGridIndex:
+    """Immutable grid over the branches of a BranchArrays snapshot that have active items"""
+
+    def __init__(self, arrays, cell_size=GRID_CELL_DEGREES):
+        self.arrays = arrays
+        self.cell_size = cell_size
+
+        positions = np.flatnonzero(arrays.item_counts > 0)
+        rows = np.floor(arrays.lats[positions] / cell_size).astype(np.int64)
+        cols = np.floor(arrays.lngs[positions] / cell_size).astype(np.int64)
+        self.positions, self.rows, self.cols = positions, rows, cols
+        cells = {}
+        for position, row, col in zip(positions.tolist(), rows.tolist(), cols.tolist()):
+            cells.setdefault((row, col), []).append(position)
+        self.cells = {cell: np.array(members, dtype=np.intp) for cell, members in cells.items()}
+
+        if self.cells:
+            self.bounds = (int(rows.min()), int(rows.max()), int(cols.min()), int(cols.max()))
+        else:
+            self.bounds = None
+
+    def __len__(self):
+        return sum(len(members) for members in self.cells.values())
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _ring(self, row, col, radius):
+        """Cells at Chebyshev distance `radius` from (row, col)"""
+        if radius == 0:
+            yield (row, col)
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield (row - radius, c)
+            yield (row + radius, c)
+        for r in range(row - radius + 1, row + radius):
+            yield (r, col - radius)
+            yield (r, col + radius)
+
+    def _max_radius(self, row, col):
+        min_row, max_row, min_col, max_col = self.bounds
+        return max(abs(row - min_row), abs(row - max_row), abs(col - min_col), abs(col - max_col))
+
+    def _unscanned_bound(self, lat, radius):
+        """Lower bound (km) on the distance to any cell outside the scanned rings"""
+        span = radius * self.cell_size
+        lng_scale = math.cos(math.radians(min(89.0, abs(lat) + span)))
+        # small safety margin: the grid is planar, the distance is not
+        return span * KM_PER_DEGREE * min(1.0, lng_scale) * 0.99
+
+    def _iter_positions(self, lat, lng):
+        """Yield (position, distance_km) ordered by increasing distance"""
+        if not self.cells or not valid_point(lat, lng):
+            return
+        arrays = self.arrays
+        row, col = self._cell(lat, lng)
+        max_radius = self._max_radius(row, col)
+        heap = []
+        for radius in range(min(max_radius, MAX_RING_RADIUS) + 1):
+            ring = [self.cells[cell] for cell in self._ring(row, col, radius) if cell in self.cells]
+            if ring:
+                positions = np.concatenate(ring)
+                distances = haversine_array(lat, lng, arrays.lats[positions], arrays.lngs[positions])
+                for distance, position in zip(distances.tolist(), positions.tolist()):
+                    heapq.heappush(heap, (distance, position))
+            bound = self._unscanned_bound(lat, radius)
+            while heap and heap[0][0] <= bound:
+                distance, position = heapq.heappop(heap)
+                yield position, distance
+
+        if max_radius > MAX_RING_RADIUS:
+            # Everything outside the scanned square plus what is left in the heap
+            outside = np.maximum(np.abs(self.rows - row), np.abs(self.cols - col)) > MAX_RING_RADIUS
+            positions = np.concatenate([
+                np.array([position for _, position in heap], dtype=np.intp),
+                self.positions[outside],
+            ])
+            distances = haversine_array(lat, lng, arrays.lats[positions], arrays.lngs[positions])
+            order = top_k(distances, len(distances))
+            for distance, position in zip(distances[order].tolist(), positions[order].tolist()):
+                yield position, distance
+            return
+        while heap:
+            distance, position = heapq.heappop(heap)
+            yield position, distance
+
+    def iter_nearest(self, lat, lng):
+        """Yield (branch_id, distance_km) ordered by increasing distance"""
+        ids = self.arrays.ids
+        for position, distance in self._iter_positions(lat, lng):
+            yield int(ids[position]), distance
+
+    def nearest(self, lat, lng, k):
+        """The k nearest branches as a list of (branch_id, distance_km)"""
+        result = []
+        for pair in self.iter_nearest(lat, lng):
+            if len(result) >= k:
+                break
+            result.append(pair)
+        return result
+
+    def nearest_with_items(self, lat, lng, item_count, branch_ids=None):
+        """
+        Nearest branches until together they hold at least `item_count` active
+        items, only among `branch_ids` when given
+        """
+        ids = self.arrays.ids
+        item_counts = self.arrays.item_counts
+        allowed = set(branch_ids) if branch_ids is not None else None
+        result = []
+        collected = 0
+        for position, distance in self._iter_positions(lat, lng):
+            if collected >= item_count:
+                break
+            if allowed is not None and int(ids[position]) not in allowed:
+                continue
+            result.append((int(ids[position]), distance))
+            collected += int(item_counts[position])
+        return result
+
+
+class _IndexHolder:
+    """Keeps the grid in step with the cached branch arrays it was built from"""
+
+    def __init__(self):
+        self._index = None
+
+    def get(self):
+        arrays = branch_arrays.get()
+        index = self._index
+        if index is None or index.arrays is not arrays:
+            index = BranchGridIndex(arrays)
+            self._index = index
+        return index
+
+
+branch_index = _IndexHolder()
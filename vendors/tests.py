@@ -1,3 +1,437 @@
-lst = ["010463000218039221EZUaUPBgFI9nR", "010463000218039221gEMJsn2Ax4k8L", "010463000218039221b9Bmgiwyjc4sh", "010463000218039221727aBOejvgfKS", "010463000218039221nrxjAPYS94wvV", "0104630002180392215j3xq8XdI8KdD", "010463000218039221LD10lvDQtfazD", "010463000218039221zbQp3KoOEQyY8", "010463000218039221K5XbmOxRjZlV9", "010463000218039221yewBSfBvougbT", "010463000218039221VyDqbvhrP6yeT", "010463000218039221x2ntSFtcodVT9", "0104630002180392219K7nsdfMZGtEM", "010463000218039221ZBGAjr6oVxQDX", "010463000218039221BDwe3Lr9te0xB", "010463000218039221exXmvEkmbwvqG", "01046300021803922166mIkNvr9KGCv", "0104630002180392216TiUEuz2beBg8", "0104630002180392215W6tef4P5nF51", "010463000218039221IA74h98nUYUnT", "010463000218039221lXbpj43vj3Axi", "010463000218039221IfYjXSxrgQ7ed", "0104630002180392213mnQMH71dgs9y", "0104630002180392217TiKrzT9Rsygs", "010463000218039221C1Hgx6q8f5O9k", "010463000218039221zJ1zceaB5kco3", "01046300021803922127IqvdXB5MvXf", "010463000218039221CnzGweOnRyaf8", "010463000218039221BonrNa8UWa6Cn", "0104630002180392211iT4akxCC35Aq", "010463000218039221sgoBmkZ33JAyO", "010463000218039221vEExkE3YAYnsG", "0104630002180392216doxEB2GnEr64", "010463000218039221L4Aa2ZTCnuTCK", "010463000218039221enZmEETOin6NH", "010463000218039221g02JenKOibjTM", "010463000218039221gdBvRiYZwI73z", "010463000218039221PNGC2DGogFcrk", "0104630002180392214mTHyCRJvMKwJ", "0104630002180392215SE03RC3gXAf5", "010463000218039221CcUdDYEGSMZUz", "010463000218039221vwFzM7NZIC7am", "0104630002180392216IlXXtZDei81b", "010463000218039221aG8IBQl9ID39S", "0104630002180392211pk68WYLGJgmK", "010463000218039221XjkkxZamgGVoL", "010463000218039221Dj4GSOPqKLFlb", "010463000218039221MnmoYIRbcR0EW", "010463000218039221nEhqx17k9ennw", "010463000218039221hBMSY91fGmndx", "0104630002180392210pPvBTPdywpLK", "010463000218039221zQOicCWFx02pp", "010463000218039221hyTLqwNg5IbwT", "010463000218039221Eg4xKk3T4VRSN", "0104630002180392213iUACe1fTfGBI", "010463000218039221IFLIHo5imHJDJ", "0104630002180392213FdzivDLxGCD1", "010463000218039221DLkN2hKTfPMbG", "010463000218039221BCK0DDaOt1J1E", "010463000218039221TXCN7HZYhyEND", "010463000218039221DY1ZsL86uv2bd", "010463000218039221H8I3itE9SMGAi", "010463000218039221N4whf94OYXWSm", "010463000218039221lQCs0KQdNGivC", "010463000218039221OjHMjaoCDw4Ql", "010463000218039221W1MGBys6wBGmm", "010463000218039221edh8OVhBOUwaC", "0104630002180392218AkXP53Rpj0ai", "010463000218039221SVAWBbWTzcw3E", "0104630002180392217ipdYAyFkCo9G", "010463000218039221L41YLWMRvAxEU", "010463000218039221wvQAOz4G69DII", "010463000218039221JdKPaSzJ52YHs", "0104630002180392212cMAFBCBzMR3Y", "010463000218039221nNFD1ZdXZQO0Y", "010463000218039221fdvqJYyd2OuCi", "010463000218039221HZmGfcjQ3D1YH", "010463000218039221rhqPvPz4q9OCF", "010463000218039221Z9C7UNHV8iQMY", "010463000218039221632d2oRmc20qO", "010463000218039221MFxreXYCZJ4ZR", "010463000218039221pkDIIfw43yMoK", "0104630002180392219EfMx8ujsmzT6", "010463000218039221Eg8hLSZ4KTBfu", "010463000218039221cgXPKEwgTmRPn", "010463000218039221tbdC37m3UkWUx", "010463000218039221kmGdDxolcgv6L", "010463000218039221P14M4bs9BPD6n", "010463000218039221zpi33xR88HPCp", "010463000218039221QieMgny67WNWd", "010463000218039221XPreWnVw6SuDo", "0104630002180392216NcKfOucOBtjy", "010463000218039221l4AjAbkuA84fF", "010463000218039221BydFufCZUYuCs", "010463000218039221pZmoVJ0Zxjy9o", "010463000218039221Jz771SGPQvu1D", "010463000218039221gA3l57Jb74Yln", "010463000218039221expCX2sJHfdMg", "010463000218039221wSZSUNGvx1mQN", "010463000218039221e7ljl259G3iWV", "010463000218039221oJ1aTEI6OTdN9", "010463000218039221nhiFDEh9QnjzQ", "010463000218039221537wa0QBgHOBJ", "010463000218039221F2t0ptgJwCPBo", "010463000218039221DEjOiqBEPy90w", "010463000218039221qczcBT743ck2u", "010463000218039221u5os25kiOgnwc", "0104630002180392217VjImt4GACGCt", "0104630002180392213YnS5LzAvFuQB", "010463000218039221yoJQSs63aJNm8", "010463000218039221A2Zc3vIpFbFXl", "010463000218039221hCAOmv3G8wvtn", "010463000218039221IscnAKU2COQSK", "010463000218039221yywGtI2hqdTOy", "010463000218039221hD9mlrGHmtXAL", "010463000218039221sDvuBCLFPsTv5", "010463000218039221yoRESMLGzpqTh", "010463000218039221y951g0mAG3koL", "010463000218039221rOBv5W5kwC8u1", "010463000218039221CfbOx7SDlh1Nz", "010463000218039221IVog4ZqZAo1S7", "010463000218039221WFSOPbQ5X3Wt2", "010463000218039221yNUYdH0nmT8bN", "010463000218039221inRIlAbSXE8pv", "010463000218039221RMh7DTZUaoxC9", "010463000218039221QUE9QWjml33sH", "010463000218039221TIWBXuDmDaD7x", "010463000218039221lJtUuBaswwyUD", "01046300021803922180S8YNszQH049", "010463000218039221GudXCQ86nZZQc", "010463000218039221qcXkb4P65TSwX", "0104630002180392213AJQrtbnLrO5Q", "010463000218039221nM092DVqlxCW7", "0104630002180392216gDTX8bZiD0y9", "010463000218039221nPT8tMLD2AmRM", "010463000218039221FSAIGmoNMtxiC", "010463000218039221eF4PJLPfBnlup", "010463000218039221hKZ6evm9x7cYy", "010463000218039221QtnApGGNxEeX8", "010463000218039221h5J9bxsy5I880", "010463000218039221EjMjaFMT5p40Z", "010463000218039221mgqxTG3SpLt2j", "010463000218039221H9lz2k1NcASoh", "010463000218039221zdR7JqGAAzm0C", "010463000218039221wDsuExKPLnKqw", "010463000218039221nECuZvhCJxhSG", "010463000218039221FHggNZB9sbbvP", "010463000218039221vBCB52yVSM0k4", "010463000218039221SyFi6C66FASiC", "010463000218039221syyV2TsZS9LfR", "0104630002180392211enpvT7RB5QQu", "010463000218039221t7YOZpuJsDy3F", "010463000218039221ba4UCbg6O9OGP", "010463000218039221C2DKiFbEoDvgT", "010463000218039221yOhjifSrL6wVt", "010463000218039221Cd37hOpGM8RIO", "0104630002180392213tQOGqlSqbyRg", "010463000218039221Jnh4HoIA5sIDI", "010463000218039221Zvgk6IsIAplPj", "010463000218039221aG4F4gfSeQ4P8", "010463000218039221IhKNAnMafdR2E", "010463000218039221Yw7tDhCVGc8Zu", "010463000218039221nH2ChpVFOb7t1", "0104630002180392212O213Yb68J36P", "010463000218039221ezOJZewXZQzyh", "010463000218039221W3FZDeyb7aknU", "010463000218039221s0vV0iNidNCuH", "010463000218039221U5QebbjNhvyYM", "010463000218039221c9Zqqv4ZWxv98", "010463000218039221G0MuZ0l8HvAzB", "010463000218039221rnDhm6JYVopQj", "010463000218039221T06BRc0Tri5UM", "0104630002180392215HEyS73rvpNDg", "010463000218039221KdyH8nzFA7gNn", "010463000218039221CZWsMcrTNBs1N", "010463000218039221az3PiFmwVkbyY", "010463000218039221wTCM9xbjq3J4x", "010463000218039221fvl1iMKKEswxc", "010463000218039221nOvKoyjitufHT", "010463000218039221tCXMtwMPLEgN7", "010463000218039221sC1lK4rPhCcIO", "010463000218039221uAUCEwIYSDVb1", "010463000218039221c2J5uroU8Oel8", "010463000218039221k7bpXZnOI2kXV", "0104630002180392217DBChnkLihyks", "010463000218039221IGKV4bHmZYlSV", "010463000218039221J3NGvb7Bn79pd", "010463000218039221A20Yrbe5Eta0B", "0104630002180392213m9KoIR7lDNPb", "010463000218039221pexQXPTbL9O2Z", "010463000218039221s4hESyd9pAE5i", "010463000218039221CCc2Dm8H3RKEc", "010463000218039221mzchDmxvvGncR", "010463000218039221e93rKEXOz47BA", "010463000218039221ITFMG9BESxuBD", "010463000218039221ehwmv3drdd2bW", "010463000218039221EJTnLV5hp7cZB", "010463000218039221a8d2vZ7rtj5GV", "010463000218039221jesy33SOBFr1B", "01046300021803922166Vi9mqOPy7r3", "010463000218039221bCUYra54wmN3X", "010463000218039221SMfSQv0cXVCn5", "010463000218039221y5REDhzrBjfEO", "010463000218039221pOsx1soR0nvML", "010463000218039221I2hg99l2gBgM7", "010463000218039221GHa2DEPRXSXQ2", "010463000218039221Udjw42KJIok0f", "010463000218039221XiN5hDxuAj5R7", "010463000218039221rqolORc57OAPI", "010463000218039221Hs1E8SxMKmdEB", "0104630002180392213d7FP0o1hR0QX", "010463000218039221R2Pt1pAOnSreP", "010463000218039221zd2vnktlgAQTX", "010463000218039221Cu0iJznvLww9m", "010463000218039221OLfvz7ktYRfNa", "010463000218039221m4QkWTaeQMY1Z", "010463000218039221SQuV4PMkiIebr", "010463000218039221Y8cnG3Jkk9zYP", "010463000218039221qVdncWAzG7Fre", "010463000218039221auMtQe2Ua9Lmq", "010463000218039221lTUjz81rNDIvN", "010463000218039221bAJtAt8h2VhbZ", "0104630002180392217CD4kfGpxqEBI", "010463000218039221KQDXmvmt0FIFk", "010463000218039221A6g9HLHRK3Ke1", "0104630002180392218C8AeBPI5K8Ic", "010463000218039221zdyFYJIztQgm6", "010463000218039221yxN7eUG4Trgak", "010463000218039221jCtTVzO47o3fO", "010463000218039221KiacHDHpjL8xy", "0104630002180392212TMQTkKRMTbeY", "0104630002180392210euURaoxzI5Uz", "010463000218039221pMBnwk9aJuHmQ", "010463000218039221eocmdmpt3HB3I", "010463000218039221ARLeBrk1tRY3M", "010463000218039221N72HyzqVYu9vZ", "010463000218039221RDZrCBjBOMuSf", "010463000218039221EGTHPNNJ5Fj7u", "010463000218039221OXTDYnyYuaFxV", "010463000218039221zQPFt10brRIBe", "010463000218039221l66pKQEbagCCq", "0104630002180392214qVDdPyOCPewW", "010463000218039221FDUrgiUBre0uG", "010463000218039221aFHg9SsszlmPo", "010463000218039221Kk5nhww3sNkl7", "010463000218039221M4GPHCEzTSzoN", "0104630002180392216ybhyHC55jtHM", "010463000218039221p6H4DKVtfwT9u", "0104630002180392215f6RbLWjIomZQ", "010463000218039221m27FzFlBUz0Md", "010463000218039221DE3pvPJ49JPY3", "0104630002180392215nv0w41gkN8Zn", "010463000218039221BlHmGvvF1Ws7X", "010463000218039221Wtb7sUzf72owj", "010463000218039221MbiNdvx6Q6yIK", "010463000218039221LvpEKSgVEZgGo", "01046300021803922131Zic27BrecdW", "010463000218039221p0hrPaNxFE64k", "010463000218039221nsdBgdtNSh7Bt", "010463000218039221ZoCKP7AhoY6fe", "010463000218039221pAKAEAN72iSio", "01046300021803922162oEeZfB9fDSO", "010463000218039221vyYictC0mBJWB", "010463000218039221vbRb8s4HX0ChQ", "010463000218039221Rq4eg8ydPELND", "010463000218039221cV9WmYhtuvw8H", "01046300021803922107RZNsSKYQFBr", "010463000218039221BOB3O67Iu2fcT", "010463000218039221D7SJjdxWrKuYE", "010463000218039221mJIQzstiHGBsC", "010463000218039221xW8KxuooYHX94", "010463000218039221h8Bxuo2brFJ09", "010463000218039221To15zLXfBAzIN", "010463000218039221zdDCDHAk004qP", "010463000218039221RsNihgAk9DX6Q", "010463000218039221VPTsKTRHDIUpP", "010463000218039221pqrLxiA2DAZZx", "010463000218039221CTBPKUAgMBdCR", "010463000218039221k7Ti4jotiz4Fx", "010463000218039221ZpI2rh4EzQgBS", "010463000218039221KoRUYy7km6CDI", "010463000218039221JqOyeKtehmJDS", "010463000218039221P1hqQeguFBSRD", "0104630002180392219B67iiI4PDVEz", "010463000218039221873a7ShF5234B", "010463000218039221n1c7ZFCxyWCgM", "010463000218039221YBgxSrkkBF6CA", "010463000218039221AZfiATdBbdCVv", "010463000218039221SiUNwecnix1q5", "010463000218039221Vgt1T40ZSc4Lh", "010463000218039221vhtrVC8ClPNu7", "010463000218039221XtSPXbOJWE8qF", "010463000218039221DW4wAHct8mvds", "010463000218039221nkTI3D75kuf97", "010463000218039221jcfV7X7OpnHNN", "010463000218039221iGMLZRT3id2oN", "010463000218039221Df9T6cjLp5csW", "010463000218039221kcNBB5mQGnyAe", "010463000218039221Sp33dI7b4rP7h", "010463000218039221iNmS4R4VenAN8", "010463000218039221tHPXMqEGgRL8u", "010463000218039221VPPR7NPbGHNmV", "010463000218039221OlWUjioj9sLjQ", "010463000218039221VbqM3DhBACvuU", "010463000218039221fD9gawilpL256", "0104630002180392213KIvUbd9TwjmF", "010463000218039221xxFnwKnkidKG0", "010463000218039221waMFkAsb4O5JK", "010463000218039221pnkuFTLoJUggE", "010463000218039221sgka2VScnYWKI", "010463000218039221hXnBPpHcV3C6Y", "0104630002180392219MyXZWXlJC9PX", "010463000218039221BANStmaV6RHd7", "010463000218039221caujBLp9RVazB", "010463000218039221Xa04xkWoevNvv", "010463000218039221v4k535GqTUbX0", "010463000218039221Gu1JsBWqSHEiz", "010463000218039221eiKN8FrOwo07m", "010463000218039221HHu2DfBNqly1Y", "010463000218039221LIg9RQdaCxsMu", "010463000218039221gcb9fhiExqO0N", "010463000218039221IyxRQvfGtgDXB", "010463000218039221xZQy3KDNeSFQA", "010463000218039221jZzv7UKWgBT1e", "0104630002180392215GvCvgnpZTDok", "010463000218039221clW8GmZxfj9Jl", "010463000218039221iaNofSyTH777M", "010463000218039221uUbxpCbzW5Cyq", "0104630002180392214yMW1ecmdpxGD", "010463000218039221kfJb9tIMaAYqv", "010463000218039221ePPOSEdxIBfcx", "010463000218039221SD6QioZutcP1H", "010463000218039221aq8FKI3vg0pW3", "010463000218039221HiyU5K2H5N9Mu", "010463000218039221VlWqD4AqSRExL", "010463000218039221L4Fbb9wdHsbLO", "010463000218039221yMDViCsgZV7JB", "010463000218039221bGm3v91bbDccg", "010463000218039221cQcwMlbYExmbG", "010463000218039221ACAjDGa2lBkWx", "010463000218039221eToDM9cmIVD70", "0104630002180392212fPf31eBQBrNw", "010463000218039221N7DxivHuPk1vC", "010463000218039221UxVmDah5Kb3Yo", "010463000218039221EUmkoWiUUbtuC", "010463000218039221SfjHL3K4m8nrn", "010463000218039221zQpza5Lw4R0Ik", "010463000218039221hIBxUTsFJBnpn", "010463000218039221P6QRztztAjgBN", "010463000218039221W35YVkUfvzH4P", "010463000218039221tjwD4gfBaEvS7", "010463000218039221p9mYBL06JzTaP", "010463000218039221mU2vOVrGNQGUl", "010463000218039221kQqjs8Y61fZ4D"]
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
 
-print(len(lst))
\ No newline at end of file
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from catalog.models import CatalogListing, Item, ItemImage
+from imaging.models import ImageJob, StoredFile
+from users.models import User
+from . import rtree
+from .bulk_images import ItemMatcher, import_photos
+from .distance import BranchArrays, branch_arrays, branch_distances, haversine, haversine_array
+from .hours import DAY_MINUTES, WEEK_MINUTES, compile_schedule, interval_filter, is_open
+from .models import Branch, BranchOpenInterval, Vendor
+from .normalize import key_prefix, search_key
+from .signals import refresh_map_indexes
+from .spatial import MAX_RING_RADIUS, BranchGridIndex
+
+SUNDAY = 6 * DAY_MINUTES
+
+
+class CompileScheduleTests(SimpleTestCase):
+    def test_overnight_range_spills_into_next_day(self):
+        friday = 4 * DAY_MINUTES
+        schedule = compile_schedule({'friday': '22:00-02:00'})
+        self.assertEqual(schedule, [[friday + 22 * 60, friday + DAY_MINUTES + 2 * 60]])
+        self.assertTrue(is_open(schedule, friday + DAY_MINUTES + 60))
+        self.assertFalse(is_open(schedule, friday + DAY_MINUTES + 2 * 60))
+
+    def test_sunday_night_wraps_to_monday(self):
+        schedule = compile_schedule({'вс': {'open': '22:00', 'close': '02:00'}})
+        self.assertEqual(schedule, [[0, 2 * 60], [SUNDAY + 22 * 60, WEEK_MINUTES]])
+        self.assertTrue(is_open(schedule, 60))
+        self.assertTrue(is_open(schedule, WEEK_MINUTES - 1))
+
+    def test_24_00_closes_at_midnight_and_merges_with_next_day(self):
+        schedule = compile_schedule({'monday': '09:00-24:00', 'tuesday': '00:00-03:00'})
+        self.assertEqual(schedule, [[9 * 60, DAY_MINUTES + 3 * 60]])
+        self.assertEqual(compile_schedule({'monday': '09:00-24:30'}), [])
+
+    def test_equal_open_and_close_is_round_the_clock(self):
+        wednesday = 2 * DAY_MINUTES
+        self.assertEqual(compile_schedule({'wed': '00:00-00:00'}), [[wednesday, wednesday + DAY_MINUTES]])
+        self.assertEqual(
+            compile_schedule({'wed': '10:00-10:00'}),
+            [[wednesday + 10 * 60, wednesday + DAY_MINUTES + 10 * 60]]
+        )
+
+    def test_closed_and_unreadable_days(self):
+        self.assertEqual(compile_schedule({'monday': 'Закрыто', 'tuesday': '9-18', 'friday': None}), [])
+
+
+class IntervalFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='cafe', name='Cafe')
+        cls.night = Branch.objects.create(
+            vendor=vendor, name='Night', address='-', latitude=41.3, longitude=69.2, phone='-',
+            opening_hours={'sunday': '22:00-02:00'}
+        )
+        cls.morning = Branch.objects.create(
+            vendor=vendor, name='Morning', address='-', latitude=41.3, longitude=69.2, phone='-',
+            opening_hours={'monday': '09:00-18:00'}
+        )
+
+    def open_at(self, minute, within=0):
+        return set(BranchOpenInterval.objects.filter(
+            interval_filter(minute, within)
+        ).values_list('branch_id', flat=True))
+
+    def test_open_intervals_follow_the_schedule(self):
+        self.assertEqual(self.open_at(SUNDAY + 23 * 60), {self.night.pk})
+        self.assertEqual(self.open_at(60), {self.night.pk})
+        self.assertEqual(self.open_at(10 * 60), {self.morning.pk})
+        self.assertEqual(self.open_at(SUNDAY + 21 * 60), set())
+
+    def test_window_reaches_past_sunday_midnight(self):
+        last_minute = WEEK_MINUTES - 1
+        self.assertEqual(self.open_at(SUNDAY + 21 * 60, within=60), {self.night.pk})
+        self.assertEqual(self.open_at(last_minute, within=9 * 60 + 1), {self.night.pk, self.morning.pk})
+        self.assertEqual(self.open_at(SUNDAY + 20 * 60, within=30), set())
+
+
+class SearchKeyTests(SimpleTestCase):
+    def test_latin_and_cyrillic_spellings_share_a_key(self):
+        for spellings in (
+            ('Нон', 'non', 'NON'),
+            ('Лепёшка', 'lepyoshka', 'lepeshka'),
+            ('Қўй гўшти', "Qo‘y go'shti", 'qoy goshti'),
+            ('Хачапури', 'khachapuri', 'xachapuri'),
+            ('Жаркое', 'zharkoye'),
+            ('Щи', 'shchi'),
+        ):
+            with self.subTest(spellings=spellings):
+                self.assertEqual({search_key(spelling) for spelling in spellings}, {search_key(spellings[0])})
+
+    def test_case_diacritics_and_separators_fold(self):
+        self.assertEqual(search_key('  A-1042__Big '), 'a 1042 big')
+        self.assertEqual(search_key('Café'), 'cafe')
+        self.assertEqual(search_key('Non_2'), 'non 2')
+
+    def test_empty_text(self):
+        self.assertEqual(search_key(''), '')
+        self.assertEqual(search_key(None), '')
+
+
+class KeyPrefixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='store', name='Bakery')
+        branch = Branch.objects.create(
+            vendor=vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        cls.by_title = {
+            title: Item.objects.create(vendor=vendor, branch=branch, title=title)
+            for title in ('Нон', 'Non 2', 'Лепёшка', 'Samsa non', 'Noz')
+        }
+
+    def test_matches_keys_starting_with_the_query(self):
+        items = Item.objects.filter(key_prefix('search_title', search_key('NON')))
+        self.assertCountEqual(items, [self.by_title['Нон'], self.by_title['Non 2']])
+        self.assertEqual(Item.objects.filter(key_prefix('search_title', '')).count(), len(self.by_title))
+
+    def test_uses_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        sql, params = Item.objects.filter(key_prefix('search_title', 'non')).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('INDEX', plan)
+        self.assertNotIn('SCAN', plan)
+
+
+class ItemMatcherTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='store', name='Bakery')
+        other_vendor = Vendor.objects.create(owner=owner, type='store', name='Other')
+        branches = [
+            Branch.objects.create(
+                vendor=vendor, name=name, address='-', latitude=41.3, longitude=69.2, phone='-'
+            )
+            for name in ('North', 'South')
+        ]
+        other_branch = Branch.objects.create(
+            vendor=other_vendor, name='Main', address='-', latitude=41.3, longitude=69.2, phone='-'
+        )
+        cls.non = [Item.objects.create(vendor=vendor, branch=branch, title='Нон') for branch in branches]
+        cls.cake = Item.objects.create(vendor=vendor, branch=branches[0], title='Торт', sku='A-1042')
+        # its title is another item's SKU
+        cls.impostor = Item.objects.create(vendor=vendor, branch=branches[0], title='A 1042')
+        cls.tea = Item.objects.create(vendor=vendor, branch=branches[0], title='Чай', sku='TEA-2')
+        cls.tea_bag = Item.objects.create(vendor=vendor, branch=branches[0], title='Tea')
+        Item.objects.create(vendor=other_vendor, branch=other_branch, title='Лепёшка')
+        cls.matcher = ItemMatcher(vendor)
+
+    def test_title_matches_every_branch(self):
+        self.assertCountEqual(self.matcher.match('non.jpg'), self.non)
+        self.assertCountEqual(self.matcher.match('photos/NON.PNG'), self.non)
+
+    def test_sku_wins_over_title(self):
+        self.assertEqual(self.matcher.match('a-1042.jpg'), [self.cake])
+        self.assertEqual(self.matcher.match('Торт.jpg'), [self.cake])
+
+    def test_numbered_photos(self):
+        self.assertCountEqual(self.matcher.match('Non_2.jpg'), self.non)
+        self.assertCountEqual(self.matcher.match('нон 12.webp'), self.non)
+        self.assertEqual(self.matcher.match('A-1042_3.jpg'), [self.cake])
+        # a SKU ending with a number is a full match first
+        self.assertEqual(self.matcher.match('tea-2.jpg'), [self.tea])
+        self.assertEqual(self.matcher.match('tea-3.jpg'), [self.tea_bag])
+        self.assertEqual(self.matcher.match('non_123.jpg'), [])
+
+    def test_other_vendors_items_are_not_matched(self):
+        self.assertEqual(self.matcher.match('lepyoshka.jpg'), [])
+
+
+
+def photo_archive(files):
+    """Uploaded zip of {filename: color} as small PNGs"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for filename, color in files.items():
+            image = BytesIO()
+            Image.new('RGB', (8, 8), color).save(image, 'PNG')
+            archive.writestr(filename, image.getvalue())
+    return SimpleUploadedFile('photos.zip', buffer.getvalue(), content_type='application/zip')
+
+
+class ImportPhotosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        cls.vendor = Vendor.objects.create(owner=owner, type='store', name='Bakery')
+        branches = [
+            Branch.objects.create(
+                vendor=cls.vendor, name=name, address='-', latitude=41.3, longitude=69.2, phone='-'
+            )
+            for name in ('North', 'South')
+        ]
+        cls.non = [Item.objects.create(vendor=cls.vendor, branch=branch, title='Нон') for branch in branches]
+        cls.cake = Item.objects.create(vendor=cls.vendor, branch=branches[0], title='Торт', sku='A-1042')
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_import(self, files):
+        with self.captureOnCommitCallbacks(execute=True):
+            return list(import_photos(self.vendor, photo_archive(files)))
+
+    def test_rows_file_references_and_jobs(self):
+        events = self.run_import({'non_2.png': 'blue', 'non.png': 'red', 'a-1042.png': 'green', 'plov.png': 'white'})
+        self.assertEqual(events[-1], {
+            'finished': True, 'done': 4, 'total': 4, 'added': 3, 'unmatched': 1, 'skipped': 0, 'error': 0,
+        })
+        for item in self.non:
+            self.assertEqual(list(item.images.values_list('order', flat=True).order_by('order')), [0, 1])
+        red = self.non[0].images.get(order=0).image.name
+        self.assertEqual(self.non[1].images.get(order=0).image.name, red)
+        # one stored file and one job per photo, shared by both branches
+        self.assertEqual(StoredFile.objects.get(name=red).references, 2)
+        self.assertEqual(StoredFile.objects.count(), 3)
+        self.assertEqual(ImageJob.objects.filter(status=ImageJob.PENDING).count(), 3)
+
+    def test_primary_images_and_listings_follow(self):
+        self.run_import({'non.png': 'red', 'non_2.png': 'blue'})
+        first = ItemImage.objects.get(item=self.non[0], order=0).image.name
+        for item in self.non:
+            item.refresh_from_db()
+            self.assertEqual(item.primary_image, first)
+            self.assertEqual(CatalogListing.objects.get(item=item).primary_image, first)
+
+    def test_photos_add_after_existing_ones(self):
+        self.run_import({'a-1042.png': 'red'})
+        self.run_import({'a-1042_2.png': 'blue'})
+        orders = list(self.cake.images.order_by('order').values_list('order', flat=True))
+        self.assertEqual(orders, [0, 1])
+        # the same bytes uploaded again are one more reference to one file
+        self.run_import({'a-1042.png': 'red'})
+        name = self.cake.images.get(order=0).image.name
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+
+class BranchGridIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        count = 200
+        # a city cluster plus a few branches hundreds of kilometers away
+        lats = np.concatenate([41.3 + rng.uniform(-0.1, 0.1, count), [39.65, 40.1, 42.46]])
+        lngs = np.concatenate([69.25 + rng.uniform(-0.1, 0.1, count), [66.96, 64.4, 59.6]])
+        item_counts = rng.integers(0, 4, len(lats))
+        ids = np.arange(1, len(lats) + 1) * 10
+        self.arrays = BranchArrays(ids, lats, lngs, ids % 3, item_counts)
+        self.index = BranchGridIndex(self.arrays)
+
+    def brute_force(self, lat, lng):
+        arrays = self.arrays
+        distances = haversine_array(lat, lng, arrays.lats, arrays.lngs)
+        order = np.lexsort((arrays.ids, distances))
+        return [
+            (int(arrays.ids[position]), float(distances[position]))
+            for position in order if arrays.item_counts[position] > 0
+        ]
+
+    def assertSameOrder(self, result, expected):
+        self.assertEqual(len(result), len(expected))
+        for (branch_id, distance), (expected_id, expected_distance) in zip(result, expected):
+            self.assertAlmostEqual(distance, expected_distance, places=9)
+            if branch_id != expected_id:
+                # equal distances may come out in either order
+                self.assertAlmostEqual(distance, dict(expected)[branch_id], places=9)
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lng in [(41.3, 69.25), (41.45, 69.1), (41.2999, 69.3801)]:
+            self.assertSameOrder(list(self.index.iter_nearest(lat, lng)), self.brute_force(lat, lng))
+            self.assertSameOrder(self.index.nearest(lat, lng, 5), self.brute_force(lat, lng)[:5])
+
+    def test_branches_without_items_are_skipped(self):
+        empty = {int(branch_id) for branch_id in self.arrays.ids[self.arrays.item_counts == 0]}
+        found = {branch_id for branch_id, _ in self.index.iter_nearest(41.3, 69.25)}
+        self.assertTrue(empty)
+        self.assertFalse(found & empty)
+        self.assertEqual(len(found), len(self.index))
+
+    def test_stops_once_enough_items(self):
+        counts = dict(zip(self.arrays.ids.tolist(), self.arrays.item_counts.tolist()))
+        result = self.index.nearest_with_items(41.3, 69.25, 20)
+        self.assertSameOrder(result, self.brute_force(41.3, 69.25)[:len(result)])
+        totals = [counts[branch_id] for branch_id, _ in result]
+        self.assertGreaterEqual(sum(totals), 20)
+        self.assertLess(sum(totals[:-1]), 20)
+
+    def test_branch_ids_filter(self):
+        allowed = [int(branch_id) for branch_id in self.arrays.ids[::4]]
+        result = self.index.nearest_with_items(41.3, 69.25, 10, allowed)
+        expected = [pair for pair in self.brute_force(41.3, 69.25) if pair[0] in allowed]
+        self.assertTrue(result)
+        self.assertTrue(all(branch_id in allowed for branch_id, _ in result))
+        self.assertSameOrder(result, expected[:len(result)])
+
+    def test_far_point_falls_back_to_sorting(self):
+        # far beyond MAX_RING_RADIUS cells from every branch
+        self.assertGreater(self.index._max_radius(*self.index._cell(1, 1)), MAX_RING_RADIUS)
+        for lat, lng in [(1, 1), (-89.9, -179.9), (42.0, 62.0)]:
+            self.assertSameOrder(list(self.index.iter_nearest(lat, lng)), self.brute_force(lat, lng))
+        self.assertSameOrder(self.index.nearest(1, 1, 3), self.brute_force(1, 1)[:3])
+
+    def test_invalid_points(self):
+        for lat, lng in [(float('nan'), 69.2), (41.3, float('inf')), (-float('inf'), 0.5), (91, 69.2), (41.3, 181)]:
+            self.assertEqual(self.index.nearest_with_items(lat, lng, 10), [])
+
+    def test_empty_index(self):
+        index = BranchGridIndex(BranchArrays.from_rows([]))
+        self.assertEqual(index.nearest(41.3, 69.25, 5), [])
+
+
+class MapViewTests(TestCase):
+    def test_invalid_coordinates_show_nothing(self):
+        for lat, lng in [('nan', '69.2'), ('41.3', 'inf'), ('-inf', '1'), ('91', '69.2'), ('41.3', '-181')]:
+            response = self.client.get('/catalog/vendors/map/', {'lat': lat, 'lng': lng})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['nearby_items']), [])
+
+
+class BranchDistancesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        vendor = Vendor.objects.create(owner=owner, type='store', name='Bakery')
+        closed = Vendor.objects.create(owner=owner, type='store', name='Closed', is_active=False)
+        cls.near = Branch.objects.create(
+            vendor=vendor, name='Near', address='-', latitude=41.31, longitude=69.25, phone='-'
+        )
+        # inside the bounding box corner, but further than the radius
+        cls.corner = Branch.objects.create(
+            vendor=vendor, name='Corner', address='-', latitude=41.33, longitude=69.29, phone='-'
+        )
+        cls.far = Branch.objects.create(
+            vendor=vendor, name='Far', address='-', latitude=41.5, longitude=69.25, phone='-'
+        )
+        Branch.objects.create(
+            vendor=vendor, name='Off', address='-', latitude=41.3, longitude=69.25, phone='-', is_active=False
+        )
+        Branch.objects.create(
+            vendor=closed, name='Main', address='-', latitude=41.3, longitude=69.25, phone='-'
+        )
+
+    def test_radius(self):
+        distances = branch_distances(41.3, 69.25, 4)
+        self.assertEqual(list(distances), [self.near.pk])
+        self.assertAlmostEqual(distances[self.near.pk], haversine(41.3, 69.25, 41.31, 69.25))
+        self.assertEqual(set(branch_distances(41.3, 69.25, 30)), {self.near.pk, self.corner.pk, self.far.pk})
+        self.assertEqual(branch_distances(1, 1, 30), {})
+
+
+class BranchMapIndexTests(TestCase):
+    """The R*Tree viewport index follows saves, deletes and bulk updates"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='x')
+        cls.vendor = Vendor.objects.create(owner=owner, type='store', name='Bakery')
+
+    def create_branch(self, name, latitude, longitude, **kwargs):
+        return Branch.objects.create(
+            vendor=self.vendor, name=name, address='-', latitude=latitude, longitude=longitude,
+            phone='-', **kwargs
+        )
+
+    def in_tashkent(self):
+        return list(rtree.branches_in_bbox(41.2, 69.1, 41.4, 69.4).order_by('pk'))
+
+    def rtree_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {rtree.RTREE_TABLE} ORDER BY id')
+            return [row[0] for row in cursor.fetchall()]
+
+    def test_create_move_and_deactivate(self):
+        branch = self.create_branch('Center', 41.31, 69.28)
+        outside = self.create_branch('Samarkand', 39.65, 66.96)
+        self.create_branch('Closed', 41.32, 69.27, is_active=False)
+        self.assertEqual(self.in_tashkent(), [branch])
+        self.assertEqual(self.rtree_ids(), [branch.pk, outside.pk])
+
+        outside.latitude, outside.longitude = 41.35, 69.3
+        outside.save()
+        self.assertEqual(self.in_tashkent(), [branch, outside])
+
+        branch.is_active = False
+        branch.save()
+        self.assertEqual(self.in_tashkent(), [outside])
+
+        self.vendor.is_active = False
+        self.vendor.save()
+        self.assertEqual(self.in_tashkent(), [])
+        self.assertEqual(self.rtree_ids(), [])
+
+    def test_delete(self):
+        branch = self.create_branch('Center', 41.31, 69.28)
+        branch.delete()
+        self.assertEqual(self.rtree_ids(), [])
+
+    def test_edges_are_inclusive(self):
+        branch = self.create_branch('Corner', 41.2, 69.4)
+        self.assertEqual(self.in_tashkent(), [branch])
+
+    def test_refresh_after_bulk_update(self):
+        branch = self.create_branch('Center', 41.31, 69.28)
+        self.assertEqual(len(branch_arrays.get()), 1)
+
+        # .update() skips the signals, the indexes are stale until the refresh
+        Branch.objects.filter(pk=branch.pk).update(latitude=39.65, longitude=66.96)
+        self.assertEqual(self.in_tashkent(), [])
+        self.assertEqual(self.rtree_ids(), [branch.pk])
+        Branch.objects.filter(pk=branch.pk).update(latitude=41.3, longitude=69.2)
+        Vendor.objects.filter(pk=self.vendor.pk).update(is_active=False)
+        self.assertEqual(len(branch_arrays.get()), 1)
+
+        refresh_map_indexes()
+        self.assertEqual(self.rtree_ids(), [])
+        self.assertEqual(len(branch_arrays.get()), 0)
+        Vendor.objects.filter(pk=self.vendor.pk).update(is_active=True)
+        refresh_map_indexes()
+        self.assertEqual(self.in_tashkent(), [branch])
@@ -19,6 +19,7 @@ urlpatterns = [
     # Item management
     path('<int:vendor_id>/add-item/', views.add_item, name='add_item'),
     path('<int:vendor_id>/manage-items/', views.manage_items, name='manage_items'),
+    path('<int:vendor_id>/bulk-images/', views.bulk_upload_images, name='bulk_upload_images'),
     path('item/<int:item_id>/edit/', views.edit_item, name='edit_item'),
     path('item/<int:item_id>/delete/', views.delete_item, name='delete_item'),
     path('item/<int:item_id>/toggle-status/', views.toggle_item_status, name='toggle_item_status'),
@@ -51,4 +52,6 @@ urlpatterns = [
     
     # API endpoints
     path('api/vendors/locations/', views.vendor_locations_api, name='vendor_locations_api'),
+    path('api/vendors/viewport/', views.vendor_viewport_api, name='vendor_viewport_api'),
+    path('api/vendors/clusters/<int:zoom>/<int:x>/<int:y>/', views.vendor_clusters_api, name='vendor_clusters_api'),
 ]
\ No newline at end of file
@@ -1,3 +1,6 @@
+import json
+import math
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.contrib.admin.views.decorators import staff_member_required
@@ -5,19 +8,30 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.contrib.auth import get_user_model
 from django.db.models import Q, Count
 from .models import Vendor, Branch
-from .forms import VendorForm, BranchForm, OwnerForm, AssignVendorRoleForm, OfferFormWithTime
+from .distance import order_by_distance
+from .hours import open_branches, open_filter_minutes, open_now
+from .normalize import key_prefix, search_key
+from .rtree import branches_in_bbox
+from .clusters import cluster_pyramid, MAX_ZOOM as CLUSTER_MAX_ZOOM
+from .bulk_images import import_photos
+from .forms import VendorForm, BranchForm, OwnerForm, AssignVendorRoleForm, OfferFormWithTime, BulkImageUploadForm
 from catalog.models import Item, Category, ItemImage, Offer, SurpriseBox, SurpriseBoxItem
 from catalog.forms import ItemForm, ItemImageFormSet, SurpriseBoxForm
+from catalog.search import items_matching
 from django import forms
 
 User = get_user_model()
 
+# Viewport API: markers per response, and the zoom from which popups need contacts
+VIEWPORT_MAX_BRANCHES = 500
+VIEWPORT_DETAIL_ZOOM = 14
+
 def index(request):
     return render(request, 'vendors/index.html')
 
@@ -29,17 +43,48 @@ class VendorListView(ListView):
     paginate_by = 12
     
     def get_queryset(self):
-        return Vendor.objects.filter(is_active=True).prefetch_related('branches')
+        queryset = Vendor.objects.filter(is_active=True).prefetch_related('branches')
+        
+        # Vendors with an active branch open now / within the hour
+        open_within = open_filter_minutes(self.request.GET)
+        if open_within is not None:
+            queryset = queryset.filter(pk__in=Branch.objects.filter(
+                is_active=True, pk__in=open_branches(open_within)
+            ).values('vendor_id'))
+        
+        # Closest vendors first when the user location is known
+        self.distances = None
+        try:
+            user_lat = float(self.request.GET.get('lat', ''))
+            user_lng = float(self.request.GET.get('lng', ''))
+        except ValueError:
+            return queryset
+        
+        # Sorted in NumPy, only the vendors of the page are read (paginate_queryset)
+        ids, self.distances = order_by_distance(
+            queryset.order_by('name').values_list('id', flat=True), user_lat, user_lng
+        )
+        return ids.tolist()
+    
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        if self.distances is not None:
+            vendors = Vendor.objects.prefetch_related('branches').in_bulk(object_list)
+            distances = self.distances[page.start_index() - 1:page.end_index()].tolist()
+            object_list = []
+            for vendor_id, distance in zip(page.object_list, distances):
+                vendor = vendors[vendor_id]
+                vendor.distance = None if math.isnan(distance) else distance
+                object_list.append(vendor)
+            page.object_list = object_list
+        return paginator, page, object_list, is_paginated
 
 
 def vendor_detail(request, pk):
     from django.db.models import Q
     from django.utils import timezone
     
-    vendor = get_object_or_404(
-        Vendor.objects.filter(is_active=True).prefetch_related('branches', 'items'),
-        pk=pk
-    )
+    vendor = get_object_or_404(Vendor, is_active=True, pk=pk)
     
     # Get active branches with coordinates
     branches = vendor.branches.filter(is_active=True).order_by('name')
@@ -49,12 +94,10 @@ def vendor_detail(request, pk):
         is_active=True
     ).filter(
         Q(expiry_date__isnull=True) | Q(expiry_date__gt=timezone.now().date())
-    ).select_related('category', 'branch').prefetch_related(
-        'images', 
-        'offers'
-    ).order_by('-created_at')[:12]
+    ).select_related('category', 'branch').with_active_offer().order_by('-created_at')[:12]
     
     # Prepare branches data for JavaScript (with coordinates)
+    branches_open = open_now(branches)
     branches_data = []
     for branch in branches:
         branches_data.append({
@@ -64,7 +107,7 @@ def vendor_detail(request, pk):
             'latitude': float(branch.latitude) if branch.latitude else None,
             'longitude': float(branch.longitude) if branch.longitude else None,
             'phone': branch.phone,
-            'is_open': branch.is_open_now(),
+            'is_open': branches_open[branch.id],
             'hours': branch.get_today_hours()
         })
     
@@ -184,6 +227,34 @@ def add_item(request, vendor_id):
     })
 
 
+@login_required
+def bulk_upload_images(request, vendor_id):
+    """Photos for many items at once from a zip archive, progress is streamed as JSON lines"""
+    # Суперадмин может загружать фото любому вендору
+    if request.user.is_superuser:
+        vendor = get_object_or_404(Vendor, id=vendor_id)
+    else:
+        vendor = get_object_or_404(Vendor, id=vendor_id, owner=request.user)
+
+    if request.method == 'POST':
+        form = BulkImageUploadForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        lines = (
+            json.dumps(event, ensure_ascii=False) + '\n'
+            for event in import_photos(vendor, form.cleaned_data['archive'])
+        )
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        # nginx would hold the progress lines back until the end
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    return render(request, 'vendors/bulk_upload_images.html', {
+        'vendor': vendor,
+        'form': BulkImageUploadForm(),
+    })
+
+
 @login_required
 def add_offer(request, item_id):
     """Add an offer to an item with time fields"""
@@ -230,7 +301,8 @@ def manage_items(request, vendor_id):
     status_filter = request.GET.get('status', '')
     
     if search_query:
-        items = items.filter(title__icontains=search_query)
+        # matches Latin and Cyrillic spellings alike
+        items = items.filter(items_matching(search_query))
     
     if category_filter:
         items = items.filter(category_id=category_filter)
@@ -405,6 +477,59 @@ def vendor_locations_api(request):
     return JsonResponse({'vendors': vendor_data})
 
 
+def _parse_bbox(value):
+    """'west,south,east,north' (Leaflet toBBoxString order) -> (south, west, north, east)"""
+    west, south, east, north = (float(part) for part in value.split(','))
+    if south > north or west > east:
+        raise ValueError('empty bounding box')
+    return south, west, north, east
+
+
+def vendor_viewport_api(request):
+    """API endpoint returning only the branches inside the visible map area"""
+    try:
+        south, west, north, east = _parse_bbox(request.GET.get('bbox', ''))
+        zoom = int(request.GET.get('zoom', VIEWPORT_DETAIL_ZOOM))
+    except ValueError:
+        return JsonResponse({'error': 'bbox=west,south,east,north и zoom обязательны'}, status=400)
+    
+    fields = ['id', 'name', 'latitude', 'longitude', 'vendor_id', 'vendor__name', 'vendor__type']
+    if zoom >= VIEWPORT_DETAIL_ZOOM:
+        # Close enough to open a popup - send the contact details too
+        fields += ['address', 'phone']
+    
+    branches = branches_in_bbox(south, west, north, east)
+    open_within = open_filter_minutes(request.GET)
+    if open_within is not None:
+        branches = branches.filter(pk__in=open_branches(open_within))
+    
+    rows = list(
+        branches
+        .order_by('id')
+        .values(*fields)[:VIEWPORT_MAX_BRANCHES + 1]
+    )
+    truncated = len(rows) > VIEWPORT_MAX_BRANCHES
+    
+    return JsonResponse({
+        'branches': rows[:VIEWPORT_MAX_BRANCHES],
+        'truncated': truncated,
+        'zoom': zoom,
+    })
+
+
+def vendor_clusters_api(request, zoom, x, y):
+    """API endpoint returning precomputed marker clusters for one map tile"""
+    if zoom > CLUSTER_MAX_ZOOM or x >= 1 << zoom or y >= 1 << zoom:
+        return JsonResponse({'error': 'Тайл вне допустимого диапазона'}, status=400)
+    
+    return JsonResponse({
+        'zoom': zoom,
+        'x': x,
+        'y': y,
+        'clusters': cluster_pyramid.get().tile(zoom, x, y),
+    })
+
+
 @login_required
 def delete_offer(request, offer_id):
     """Delete an offer"""
@@ -663,7 +788,7 @@ def admin_vendor_list(request):
     search_query = request.GET.get('search', '')
     if search_query:
         vendors = vendors.filter(
-            Q(name__icontains=search_query) |
+            key_prefix('search_name', search_key(search_query)) |
             Q(description__icontains=search_query) |
             Q(owner__username__icontains=search_query) |
             Q(owner__email__icontains=search_query)
@@ -740,11 +865,7 @@ def admin_vendor_items(request, vendor_id):
     # Поиск
     search_query = request.GET.get('search', '')
     if search_query:
-        items = items.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+        items = items.filter(items_matching(search_query, ('search_title', 'category__search_name')))
     
     # Фильтр по статусу
     status_filter = request.GET.get('status', '')